@@ -0,0 +1,73 @@
+"""Measure S3 + DynamoDB client creation with and without the model cache.
+
+Each measurement runs in a fresh interpreter with imports done up front, so
+only session and client creation is timed. The model cache is built into a
+temporary file from the botocore in the handler directory. Run from
+``cdk-deployment/``::
+
+    python benchmarks/client_creation.py lambda > benchmarks/results/client_creation.md
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CLIENT_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+}
+SERVICES = ["s3", "dynamodb"]
+
+SNIPPET = """
+import time, boto3, model_cache
+start = time.perf_counter()
+session = {session}
+for service in {services!r}:
+    session.client(service)
+print((time.perf_counter() - start) * 1000)
+"""
+
+SESSIONS = {
+    "botocore Loader (json/gzip from disk)": "boto3.Session()",
+    "model cache (marshal blob)": "model_cache.create_session({cache_file!r})",
+}
+
+
+def measure(handler_dir, session):
+    env = {**os.environ, **CLIENT_ENV, "PYTHONPATH": os.path.abspath(handler_dir)}
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(session=session, services=SERVICES)],
+        cwd=handler_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handler_dir")
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.handler_dir))
+    import model_cache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_file = os.path.join(tmp, "botocore_models.marshal")
+        cache_size = model_cache.build(SERVICES, cache_file)
+
+        print(f"# Client creation: {' + '.join(SERVICES)}\n")
+        print(f"Python {sys.version.split()[0]}, {args.runs} runs each, model cache {cache_size / 1024:.0f} KiB\n")
+        print("| models loaded by | median ms | min ms | max ms |")
+        print("| --- | ---: | ---: | ---: |")
+        for label, session in SESSIONS.items():
+            session = session.format(cache_file=cache_file)
+            measure(args.handler_dir, session)  # warm-up: write .pyc files first
+            timings = [measure(args.handler_dir, session) for _ in range(args.runs)]
+            print(f"| {label} | {statistics.median(timings):.1f} | {min(timings):.1f} | {max(timings):.1f} |")
+
+
+if __name__ == "__main__":
+    main()
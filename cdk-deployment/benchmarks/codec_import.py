@@ -0,0 +1,63 @@
+"""Measure Pillow's full plugin initialisation against the codec registry.
+
+Each measurement runs in a fresh interpreter and times what the first
+``Image.open`` costs on top of ``import PIL.Image``: ``Image.init()`` (every
+format plugin) versus ``image_codecs.image_module()`` (accepted formats
+only). Run from ``cdk-deployment/``::
+
+    python benchmarks/codec_import.py lambda > benchmarks/results/codec_import.md
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SNIPPET = """
+import sys, time
+from PIL import Image
+import image_codecs
+start = time.perf_counter()
+{setup}
+elapsed = (time.perf_counter() - start) * 1000
+print(sum(1 for name in sys.modules if name.startswith("PIL.") and name.endswith("ImagePlugin")), elapsed)
+"""
+
+SETUPS = {
+    "`Image.init()` (what `Image.open` does)": "Image.init()",
+    "`image_codecs.image_module()`": "image_codecs.image_module()",
+}
+
+
+def measure(handler_dir, setup):
+    env = {**os.environ, "PYTHONPATH": os.path.abspath(handler_dir)}
+    env.pop("IMAGE_EXTRA_FORMATS", None)
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(setup=setup)],
+        cwd=handler_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    plugins, elapsed = result.stdout.strip().splitlines()[-1].split()
+    return int(plugins), float(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handler_dir")
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    import PIL
+
+    print("# Pillow codec initialisation\n")
+    print(f"Python {sys.version.split()[0]}, Pillow {PIL.__version__}, {args.runs} runs each\n")
+    print("| plugins loaded by | plugin modules | median ms | min ms | max ms |")
+    print("| --- | ---: | ---: | ---: | ---: |")
+    for label, setup in SETUPS.items():
+        measure(args.handler_dir, setup)  # warm-up: write .pyc files first
+        results = [measure(args.handler_dir, setup) for _ in range(args.runs)]
+        timings = [elapsed for _, elapsed in results]
+        print(f"| {label} | {results[0][0]} | {statistics.median(timings):.1f} | {min(timings):.1f} | {max(timings):.1f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Measure per-image processing throughput of the processor's Pillow pipeline.
+
+Times the same decode -> half-size resize -> JPEG q70 encode the handler runs,
+on synthetic JPEG originals of a few sizes. With no ``--platform`` it runs on
+this machine against the handler directory's ``image_codecs``::
+
+    python benchmarks/encode_throughput.py lambda
+
+With one or more ``--platform`` values it builds the processor's Docker image
+for each platform and runs itself inside it, so the numbers come from the
+Pillow wheels that are actually deployed::
+
+    python benchmarks/encode_throughput.py lambda --platform linux/amd64 --platform linux/arm64
+
+A platform that does not match the host runs under QEMU emulation; those
+numbers only show that the asset works, not how fast Graviton is. Compare
+architectures on native hosts (or in Lambda itself).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# (label, width, height): phone shot, DSLR export, large scan
+SIZES = [("1.9 MP", 1600, 1200), ("12 MP", 4000, 3000), ("24 MP", 6000, 4000)]
+IMAGE_TAG = "image-processor-benchmark"
+
+
+def synthetic_jpeg(width, height):
+    from PIL import Image
+
+    # Gradients plus noise: compresses like a photo, unlike a flat colour
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    image = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+def process(data):
+    import image_codecs
+
+    # Keep in step with lambda_function.handler
+    with image_codecs.open_image(data) as img:
+        img = img.resize((img.width // 2, img.height // 2))
+        if img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, "JPEG", quality=70)
+    return out.getvalue()
+
+
+def measure_local(runs):
+    import PIL
+
+    rows = []
+    for label, width, height in SIZES:
+        data = synthetic_jpeg(width, height)
+        process(data)  # warm-up: codec setup, first allocation
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            process(data)
+            timings.append((time.perf_counter() - start) * 1000)
+        rows.append({
+            "machine": platform.machine(),
+            "pillow": PIL.__version__,
+            "size": label,
+            "median_ms": statistics.median(timings),
+            "images_per_s": 1000 / statistics.median(timings),
+        })
+    return rows
+
+
+def measure_docker(handler_dir, docker_platform, runs):
+    tag = f"{IMAGE_TAG}:{docker_platform.replace('/', '-')}"
+    subprocess.run(
+        ["docker", "build", "--quiet", "--platform", docker_platform, "-t", tag, handler_dir],
+        check=True, stdout=subprocess.DEVNULL,
+    )
+    benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [
+            "docker", "run", "--rm", "--platform", docker_platform,
+            "-v", f"{benchmarks_dir}:/benchmarks:ro", "-e", "PYTHONPATH=/asset",
+            "--entrypoint", "python", tag,
+            "/benchmarks/encode_throughput.py", "/asset", "--runs", str(runs), "--json",
+        ],
+        check=True, capture_output=True, text=True,
+    )
+    return [{**row, "platform": docker_platform} for row in json.loads(result.stdout)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handler_dir")
+    parser.add_argument("--platform", action="append", default=[], dest="platforms",
+                        help="Docker platform to build and run the processor image for")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.platforms:
+        rows = [row for docker_platform in args.platforms
+                for row in measure_docker(args.handler_dir, docker_platform, args.runs)]
+    else:
+        sys.path.insert(0, os.path.abspath(args.handler_dir))
+        rows = [{**row, "platform": "local"} for row in measure_local(args.runs)]
+
+    if args.json:
+        print(json.dumps(rows))
+        return
+
+    print("# Processing throughput: decode, resize to 50%, JPEG q70\n")
+    print(f"Host {platform.machine()}, {args.runs} runs per size, synthetic JPEG q90 originals\n")
+    print("| platform | machine | Pillow | original | median ms/image | images/s |")
+    print("| --- | --- | --- | --- | ---: | ---: |")
+    for row in rows:
+        print(f"| {row['platform']} | {row['machine']} | {row['pillow']} | {row['size']} "
+              f"| {row['median_ms']:.1f} | {row['images_per_s']:.1f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Measure init and first-request latency of the processor with each WARM_UP mode.
+
+Each measurement imports ``lambda_function`` in a fresh interpreter (the init
+phase) and then times the handler on a single S3 record (the first request).
+S3 and DynamoDB are served by a local HTTP stand-in through
+``AWS_ENDPOINT_URL``, so no AWS account is needed; the stand-in speaks plain
+HTTP over loopback, which understates what ``connect`` saves against real
+TLS endpoints. Run from ``cdk-deployment/``::
+
+    python benchmarks/first_request.py lambda > benchmarks/results/first_request.md
+"""
+import argparse
+import http.server
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+
+HANDLER_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "PROCESSED_BUCKET": "processed-images-bucket",
+    "METADATA_TABLE": "image-metadata",
+    "PROCESSOR_TIER": "large",
+}
+MODES = ["off", "on", "connect"]
+
+SNIPPET = """
+import json, time
+start = time.perf_counter()
+import lambda_function
+init = (time.perf_counter() - start) * 1000
+event = {{"Records": [{{"s3": {{"bucket": {{"name": "uploaded-images-bucket"}}, "object": {{"key": "small/photo.jpg", "size": {size}}}}}}}]}}
+start = time.perf_counter()
+result = lambda_function.handler(event, None)
+first = (time.perf_counter() - start) * 1000
+assert result["processed"] == 1, result
+print(init, first)
+"""
+
+
+def sample_jpeg():
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.effect_noise((1024, 768), 48).convert("RGB").save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+class FakeAws(http.server.BaseHTTPRequestHandler):
+    """Just enough S3 and DynamoDB for one handler invocation."""
+
+    protocol_version = "HTTP/1.1"
+    image = b""
+
+    def _reply(self, status=200, body=b"", content_type="application/xml"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"benchmark"')
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(body=self.image, content_type="image/jpeg")
+
+    def do_HEAD(self):
+        self._reply()
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("X-Amz-Target", "").endswith("DescribeTable"):
+            body = {"Table": {"TableName": HANDLER_ENV["METADATA_TABLE"]}}
+        else:
+            body = {}
+        self._reply(body=json.dumps(body).encode(), content_type="application/x-amz-json-1.0")
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(handler_dir, endpoint, mode, size):
+    env = {
+        **os.environ, **HANDLER_ENV,
+        "PYTHONPATH": os.path.abspath(handler_dir),
+        "AWS_ENDPOINT_URL": endpoint,
+        "WARM_UP": mode,
+    }
+    result = subprocess.run(
+        [sys.executable, "-c", SNIPPET.format(size=size)],
+        cwd=handler_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    init, first = result.stdout.strip().splitlines()[-1].split()
+    return float(init), float(first)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handler_dir")
+    parser.add_argument("--runs", type=int, default=15)
+    args = parser.parse_args()
+
+    FakeAws.image = sample_jpeg()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeAws)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+
+    print("# Processor init and first-request latency by WARM_UP mode\n")
+    print(f"Python {sys.version.split()[0]}, {args.runs} runs each, "
+          f"{len(FakeAws.image) / 1024:.0f} KiB JPEG, local HTTP stand-in for S3/DynamoDB\n")
+    print("| WARM_UP | init median ms | first request median ms | first request min ms | first request max ms |")
+    print("| --- | ---: | ---: | ---: | ---: |")
+    try:
+        for mode in MODES:
+            measure(args.handler_dir, endpoint, mode, len(FakeAws.image))  # warm-up: write .pyc files first
+            results = [measure(args.handler_dir, endpoint, mode, len(FakeAws.image)) for _ in range(args.runs)]
+            inits = [init for init, _ in results]
+            firsts = [first for _, first in results]
+            print(f"| `{mode}` | {statistics.median(inits):.1f} | {statistics.median(firsts):.1f} "
+                  f"| {min(firsts):.1f} | {max(firsts):.1f} |")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
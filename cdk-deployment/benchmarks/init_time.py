@@ -0,0 +1,89 @@
+"""Measure the cold-start init phase of a Lambda handler module.
+
+Imports the handler in a fresh interpreter under ``python -X importtime`` and
+reports the wall-clock time of the import (module-level client creation
+included) broken down by what the handler imports. Run from ``cdk-deployment/``::
+
+    python benchmarks/init_time.py lambda lambda_function > benchmarks/results/init_lambda_function.md
+
+The handler directory is put first on ``sys.path`` so the vendored
+dependencies in it are the ones being measured, as in the Lambda runtime.
+"""
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+
+# Enough configuration for the handlers to import; no AWS calls are made.
+HANDLER_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "PROCESSED_BUCKET": "processed-images-bucket",
+    "METADATA_TABLE": "image-metadata",
+    "UPLOAD_BUCKET": "uploaded-images-bucket",
+}
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import {module}; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+def measure(handler_dir, module):
+    env = {**os.environ, **HANDLER_ENV, "PYTHONPATH": os.path.abspath(handler_dir)}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SNIPPET.format(module=module)],
+        cwd=handler_dir, env=env, capture_output=True, text=True, check=True,
+    )
+    total_ms = float(result.stdout.strip().splitlines()[-1])
+
+    # "import time: self [us] | cumulative | imported package". Nested
+    # imports are indented and listed before their parent, so the handler's
+    # direct children are the entries one level below it; the handler's own
+    # self time is its module body (client creation and the like).
+    breakdown = collections.Counter()
+    children = collections.Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children[name.strip().split(".")[0]] += int(cumulative_us) / 1000
+        elif depth == 0:
+            if name.strip() == module:
+                breakdown = children
+                breakdown["(module body)"] += int(self_us) / 1000
+            children = collections.Counter()
+    return total_ms, breakdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handler_dir")
+    parser.add_argument("module")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    measure(args.handler_dir, args.module)  # warm-up: write .pyc files first
+    runs = [measure(args.handler_dir, args.module) for _ in range(args.runs)]
+    totals = [total for total, _ in runs]
+    median_run = sorted(runs, key=lambda run: run[0])[len(runs) // 2][1]
+
+    print(f"# Init time: `import {args.module}`\n")
+    print(f"Python {sys.version.split()[0]}, {args.runs} runs, .pyc files present\n")
+    print(f"- median: {statistics.median(totals):.1f} ms")
+    print(f"- min: {min(totals):.1f} ms")
+    print(f"- max: {max(totals):.1f} ms\n")
+    print(f"| imported by {args.module} | cumulative ms (median run) |")
+    print("| --- | ---: |")
+    for name, ms in median_run.most_common(args.top):
+        print(f"| {name} | {ms:.1f} |")
+
+
+if __name__ == "__main__":
+    main()
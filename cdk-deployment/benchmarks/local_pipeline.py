@@ -0,0 +1,146 @@
+"""End-to-end upload latency and throughput of the offline pipeline.
+
+Imports the Flask app in local mode (``UI_LOCAL=1``, see
+``ui_app/local_aws.py``): in-memory S3 and DynamoDB, uploads processed
+in-process by ``lambda_function.handler``. Client threads then run the
+browser's flow through the app's test client, with no sockets: presign
+(``/generate-upload-urls``), PUT to the returned URL, long-poll
+``/get-processed-image-url`` until done. In ``pre-resize`` mode each client
+first downscales its image to the rendition size and declares the
+original, as the UI's resize worker does (Pillow stands in for the
+browser), so the processor only re-encodes it. Needs
+``ui_app/requirements.txt`` and ``moto``. Run from ``cdk-deployment/``::
+
+    python benchmarks/local_pipeline.py > benchmarks/results/local_pipeline.md
+"""
+import argparse
+import hashlib
+import io
+import itertools
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+UI_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ui_app")
+
+
+def make_image(width, height):
+    from PIL import Image
+
+    image = Image.merge("RGB", [Image.effect_noise((width, height), sigma) for sigma in (20, 40, 60)])
+    buf = io.BytesIO()
+    image.save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def downscale(data):
+    """The upload and ``preResized`` declaration the UI would send for ``data``."""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        original = {"width": image.width, "height": image.height, "sizeBytes": len(data)}
+        resized = image.resize((max(image.width // 2, 1), max(image.height // 2, 1)), Image.LANCZOS)
+    buf = io.BytesIO()
+    resized.save(buf, "JPEG", quality=92)
+    return buf.getvalue(), original
+
+
+def upload(client, name, data, pre_resize=False):
+    """Seconds spent downscaling, presigning, uploading and waiting for the
+    processed image, and the bytes uploaded."""
+    started = time.perf_counter()
+    file = {"filename": name, "contentType": "image/jpeg"}
+    if pre_resize:
+        data, file["preResized"] = downscale(data)
+    prepared = time.perf_counter()
+    response = client.post("/generate-upload-urls", json={"files": [{
+        **file,
+        "contentLength": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }]})
+    target = response.get_json()["uploads"][0]
+    presigned = time.perf_counter()
+    response = client.put(urlsplit(target["url"]).path, data=data, headers=target["headers"])
+    assert response.status_code == 200, response.status_code
+    uploaded = time.perf_counter()
+    while True:
+        response = client.get(f"/get-processed-image-url?key={target['key']}&wait=20")
+        if response.status_code != 202:
+            break
+    assert response.status_code == 200, response.get_json()
+    done = time.perf_counter()
+    return (prepared - started, presigned - prepared, uploaded - presigned, done - uploaded, done - started,
+            len(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=48)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--sizes", nargs="+", default=["640x480", "1920x1080", "4000x3000"])
+    parser.add_argument("--modes", nargs="+", choices=("original", "pre-resize"), default=["original", "pre-resize"])
+    args = parser.parse_args()
+
+    os.environ["UI_LOCAL"] = "1"
+    sys.path.insert(0, UI_APP)
+    import app as ui
+    import local_aws
+
+    # First requests create the clients, tables and processing model
+    upload(ui.app.test_client(), "warm-up.jpg", make_image(64, 64))
+
+    rows = []
+    for size, mode in itertools.product(args.sizes, args.modes):
+        width, height = (int(n) for n in size.split("x"))
+        # Distinct bytes per upload: identical files would share one key
+        images = [make_image(width, height) for _ in range(args.images)]
+        results = []
+        lock = threading.Lock()
+        pending = list(enumerate(images))
+
+        def client():
+            test_client = ui.app.test_client()
+            while True:
+                with lock:
+                    if not pending:
+                        return
+                    i, data = pending.pop()
+                timings = upload(test_client, f"IMG_{i:04d}.jpg", data, mode == "pre-resize")
+                with lock:
+                    results.append(timings)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        *phases, uploaded = zip(*results)
+        cuts = statistics.quantiles(sorted(phases[-1]), n=100)
+        rows.append((
+            size, mode, statistics.mean(len(data) for data in images) / 1024, statistics.mean(uploaded) / 1024,
+            *(statistics.median(phase) * 1000 for phase in phases),
+            cuts[89] * 1000, cuts[98] * 1000, len(results) / elapsed,
+        ))
+
+    print("<!-- Generated with: python benchmarks/local_pipeline.py -->\n")
+    print("# Offline pipeline: upload to processed image\n")
+    print(f"{platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}; "
+          f"{args.images} noisy JPEGs per size, {args.clients} concurrent clients, "
+          f"{local_aws.PROCESSORS} processor threads. Medians per phase; p90/p99 of the total.\n")
+    print("| size | mode | avg KiB | uploaded KiB | downscale ms | presign ms | PUT ms | wait ms | total ms "
+          "| total p90 ms | total p99 ms | images/s |")
+    print("| --- | --- | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: |")
+    for size, mode, kib, uploaded, downscaled, presign, put, wait, total, p90, p99, rate in rows:
+        print(f"| {size} | {mode} | {kib:.0f} | {uploaded:.0f} | {downscaled:.1f} | {presign:.1f} | {put:.1f} "
+              f"| {wait:.1f} | {total:.1f} | {p90:.1f} | {p99:.1f} | {rate:.1f} |")
+
+
+if __name__ == "__main__":
+    main()
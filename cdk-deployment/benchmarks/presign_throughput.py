@@ -0,0 +1,88 @@
+"""Measure per-URL presign cost: botocore's generate_presigned_url vs SigV4Presigner.
+
+Both sign the same PUT (Content-Type and Content-Length bound) and GET URLs in
+one warm interpreter. presign_lambda/ has no vendored dependencies, so put
+lambda/ on the path to measure the botocore version the asset pins. Run from
+``cdk-deployment/``::
+
+    PYTHONPATH=lambda python benchmarks/presign_throughput.py presign_lambda > benchmarks/results/presign_throughput.md
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+CLIENT_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_SESSION_TOKEN": "benchmark-session-token",
+}
+BUCKET = "uploaded-images-bucket-20250910"
+
+
+def per_url_us(sign, count, repeats):
+    """Median microseconds per URL over ``repeats`` rounds of ``count`` URLs."""
+    sign(0)  # warm-up
+    rounds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(count):
+            sign(i)
+        rounds.append((time.perf_counter() - start) / count * 1e6)
+    return statistics.median(rounds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("handler_dir")
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--repeats", type=int, default=7)
+    args = parser.parse_args()
+
+    os.environ.update(CLIENT_ENV)
+    sys.path.insert(0, os.path.abspath(args.handler_dir))
+    import boto3
+    import botocore
+    from botocore.config import Config
+    from sigv4_presign import SigV4Presigner
+
+    session = boto3.Session()
+    client = session.client("s3", config=Config(signature_version="s3v4"))
+    presigner = SigV4Presigner(client, session.get_credentials())
+
+    cases = {
+        "PUT, Content-Type + Content-Length": (
+            lambda i: client.generate_presigned_url(
+                "put_object",
+                Params={"Bucket": BUCKET, "Key": f"small/photo-{i}.jpg",
+                        "ContentType": "image/jpeg", "ContentLength": 1234},
+                ExpiresIn=3600,
+            ),
+            lambda i: presigner.presign(
+                "PUT", BUCKET, f"small/photo-{i}.jpg", 3600,
+                headers={"Content-Type": "image/jpeg", "Content-Length": 1234},
+            ),
+        ),
+        "GET": (
+            lambda i: client.generate_presigned_url(
+                "get_object", Params={"Bucket": BUCKET, "Key": f"processed-photo-{i}.jpg"}, ExpiresIn=3600,
+            ),
+            lambda i: presigner.presign("GET", BUCKET, f"processed-photo-{i}.jpg", 3600),
+        ),
+    }
+
+    print("# Presign cost per URL\n")
+    print(f"Python {sys.version.split()[0]}, botocore {botocore.__version__}, "
+          f"median of {args.repeats} rounds of {args.count} URLs\n")
+    print("| URL | generate_presigned_url µs | SigV4Presigner µs | speed-up |")
+    print("| --- | ---: | ---: | ---: |")
+    for label, (slow, fast) in cases.items():
+        slow_us = per_url_us(slow, args.count, args.repeats)
+        fast_us = per_url_us(fast, args.count, args.repeats)
+        print(f"| {label} | {slow_us:.1f} | {fast_us:.1f} | {slow_us / fast_us:.1f}x |")
+
+
+if __name__ == "__main__":
+    main()
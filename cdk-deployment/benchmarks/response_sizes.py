@@ -0,0 +1,106 @@
+"""Bytes on the wire for the UI page and API responses, by content coding.
+
+Imports the Flask app in local mode (``UI_LOCAL=1``, see
+``ui_app/local_aws.py``) and fetches the page, its script and typical
+JSON responses through the test client, once per ``Accept-Encoding``.
+Then it replays a repeat visit: the page revalidated with its ETag and
+the script served from the browser cache. Needs ``ui_app/requirements.txt``
+and ``moto``. Run from ``cdk-deployment/``::
+
+    python benchmarks/response_sizes.py > benchmarks/results/response_sizes.md
+"""
+import hashlib
+import io
+import os
+import re
+import sys
+import time
+from urllib.parse import urlsplit
+
+UI_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ui_app")
+CODINGS = ("identity", "gzip", "br")
+
+
+def make_image(width, height):
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.effect_noise((width, height), 40).convert("RGB").save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+def batch_request(count):
+    return {"files": [{
+        "filename": f"IMG_{i:04d}.jpg",
+        "contentType": "image/jpeg",
+        "contentLength": 2048000,
+        "sha256": hashlib.sha256(str(i).encode()).hexdigest(),
+    } for i in range(count)]}
+
+
+def main():
+    os.environ["UI_LOCAL"] = "1"
+    sys.path.insert(0, UI_APP)
+    import app as ui
+    import http_caching
+
+    client = ui.app.test_client()
+
+    # One processed upload for the status and /images responses
+    data = make_image(640, 480)
+    target = client.post("/generate-upload-urls", json={"files": [{
+        "filename": "IMG_0001.jpg", "contentType": "image/jpeg", "contentLength": len(data),
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }]}).get_json()["uploads"][0]
+    client.put(urlsplit(target["url"]).path, data=data, headers=target["headers"])
+    while client.get(f"/get-processed-image-url?key={target['key']}&wait=20").status_code == 202:
+        time.sleep(0.1)
+
+    page = client.get("/")
+    script = re.search(r'<script src="\.\./([^"]+)"', page.get_data(as_text=True)).group(1)
+    requests = [
+        ("GET /", lambda headers: client.get("/", headers=headers)),
+        ("GET /static/uploader.js", lambda headers: client.get(f"/{script}", headers=headers)),
+        ("POST /generate-upload-urls (50 files)",
+         lambda headers: client.post("/generate-upload-urls", json=batch_request(50), headers=headers)),
+        ("GET /get-processed-image-url", lambda headers: client.get(
+            f"/get-processed-image-url?key={target['key']}", headers=headers)),
+        ("GET /images/{key}", lambda headers: client.get(f"/images/{target['key']}", headers=headers)),
+    ]
+
+    rows = []
+    for name, send in requests:
+        sizes, cache_control = [], None
+        for coding in CODINGS:
+            response = send({"Accept-Encoding": coding})
+            assert response.status_code == 200, (name, response.status_code)
+            sizes.append(len(response.data))
+            cache_control = response.headers["Cache-Control"]
+        rows.append((name, *sizes, cache_control))
+
+    # Repeat visit with a warm cache: the page costs a 304, the versioned
+    # script is not requested at all
+    first_visit = sum(size for name, _, _, size, _ in rows[:2])
+    revalidated = client.get("/", headers={
+        "Accept-Encoding": "br", "If-None-Match": client.get("/", headers={"Accept-Encoding": "br"}).headers["ETag"],
+    })
+    assert revalidated.status_code == 304
+
+    print("<!-- Generated with: python benchmarks/response_sizes.py -->\n")
+    print("# Response sizes by content coding\n")
+    print(f"Body bytes through the Flask app in local mode; the presign Lambda's JSON is the same, "
+          f"gzipped by API Gateway from {http_caching.MIN_COMPRESSION_BYTES} bytes. "
+          "Headers are not counted.\n")
+    print("| response | identity | gzip | br | Cache-Control |")
+    print("| --- | ---: | ---: | ---: | --- |")
+    for name, identity, gzipped, br, cache_control in rows:
+        print(f"| {name} | {identity} | {gzipped} | {br} | `{cache_control}` |")
+    print()
+    print("| page load (br) | bytes | requests |")
+    print("| --- | ---: | ---: |")
+    print(f"| first visit | {first_visit} | 2 |")
+    print(f"| repeat visit | {len(revalidated.data)} | 1 (304) |")
+
+
+if __name__ == "__main__":
+    main()
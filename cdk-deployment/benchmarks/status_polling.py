@@ -0,0 +1,120 @@
+"""Compare status polling: 1 s short polls vs server-side long polls.
+
+Drives the real presign handler's /get-processed-image-url against a stand-in
+status table that reports ``processing`` until the image's processing time
+has passed, on a virtual clock (nothing actually sleeps). The short-poll
+client is the browser's former loop, one request a second; the long-poll
+client sends ``wait=20`` and re-polls at most once a second. Run from
+``cdk-deployment/``::
+
+    python benchmarks/status_polling.py > benchmarks/results/status_polling.md
+"""
+import argparse
+import os
+import sys
+import types
+
+ROUND_TRIP = 0.05  # seconds of network + API Gateway + Lambda overhead per request
+POLL_INTERVAL = 1.0
+LONG_POLL_SECONDS = 20
+POLL_TIMEOUT = 30.0
+
+os.environ.update({
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "UPLOAD_BUCKET": "uploaded-images-bucket-20250910",
+    "PROCESSED_BUCKET": "processed-images-bucket-20250910",
+    "STATUS_TABLE": "image-processing-status",
+})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class StatusTable:
+    """get_item stand-in: processing until ``ready_at``, then done."""
+
+    def __init__(self, clock, ready_at):
+        self.clock = clock
+        self.ready_at = ready_at
+        self.reads = 0
+
+    def get_item(self, **kwargs):
+        self.reads += 1
+        if self.clock.now < self.ready_at:
+            return {"Item": {"upload_key": {"S": "k"}, "status": {"S": "processing"}}}
+        return {"Item": {
+            "upload_key": {"S": "k"},
+            "status": {"S": "done"},
+            "renditions": {"M": {"processed": {"S": "processed-k.jpg"}}},
+        }}
+
+
+def poll(handler, clock, wait, interval):
+    """Client loop; returns (requests, seconds until the URL arrived, Lambda seconds)."""
+    requests = 0
+    busy = 0.0
+    while clock.now < POLL_TIMEOUT:
+        started = clock.now
+        requests += 1
+        params = {"key": "k", "wait": str(wait)} if wait else {"key": "k"}
+        response = handler({"path": "/get-processed-image-url", "queryStringParameters": params}, None)
+        clock.now += ROUND_TRIP
+        busy += clock.now - started
+        if response["statusCode"] == 200:
+            return requests, clock.now, busy
+        elapsed = clock.now - started
+        if elapsed < interval:
+            clock.now += interval - elapsed
+    return requests, None, busy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processing-times", type=float, nargs="+", default=[0.5, 2.3, 5.7, 12.4, 25.8])
+    args = parser.parse_args()
+
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    # lambda/ provides the modules the Docker build adds to the presign asset
+    sys.path[:0] = [os.path.join(root, "presign_lambda"), os.path.join(root, "lambda")]
+    import presign_handler
+
+    clock = Clock()
+    presign_handler.time = types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep)
+    presign_handler.publish_url_cache_metrics = lambda: None
+
+    rows = []
+    for ready_at in args.processing_times:
+        results = []
+        # The short-poll client's first request went out after one interval
+        for wait, first_delay in ((0, POLL_INTERVAL), (LONG_POLL_SECONDS, 0.0)):
+            clock.now = first_delay
+            table = StatusTable(clock, ready_at)
+            presign_handler.dynamodb_client = table
+            requests, done_at, busy = poll(presign_handler.handler, clock, wait, POLL_INTERVAL)
+            results.append((requests, table.reads, done_at - ready_at, busy))
+        rows.append((ready_at, results))
+
+    print("<!-- Generated with: python benchmarks/status_polling.py -->\n")
+    print("# Status polling: short polls vs long polls\n")
+    print(f"Virtual clock, {ROUND_TRIP * 1000:.0f} ms per request round trip; short polls every "
+          f"{POLL_INTERVAL:.0f} s, long polls with wait={LONG_POLL_SECONDS}\n")
+    print("| processing time s | short: requests | short: GetItem | short: delay after ready s "
+          "| long: requests | long: GetItem | long: delay after ready s | long: Lambda s |")
+    print("| ---: | ---: | ---: | ---: | ---: | ---: | ---: | ---: |")
+    for ready_at, ((s_req, s_reads, s_delay, _), (l_req, l_reads, l_delay, l_busy)) in rows:
+        print(f"| {ready_at:g} | {s_req} | {s_reads} | {s_delay:.2f} | {l_req} | {l_reads} | {l_delay:.2f} | {l_busy:.1f} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Request latency of the Flask UI service: debug server vs gunicorn.
+
+Starts ``ui_app`` twice, with ``python app.py`` (Flask's debug server) and
+with ``gunicorn -c gunicorn.conf.py wsgi:app``, against a local DynamoDB
+stand-in that answers every call after ``--dynamodb-latency-ms``. Client
+threads then send a mix of upload-URL, status and ``/images`` requests over
+kept-alive connections for ``--seconds`` each, and the latency percentiles
+are printed as markdown. Needs ``ui_app/requirements.txt`` installed. Run
+from ``cdk-deployment/``::
+
+    python benchmarks/ui_load.py > benchmarks/results/ui_load.md
+"""
+import argparse
+import http.client
+import http.server
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+UI_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "ui_app")
+KEY = "small/3f0c9a.jpg"
+DONE_ITEM = {
+    "upload_key": {"S": KEY},
+    "status": {"S": "done"},
+    "updated_at": {"S": "2025-09-10T14:30:00+00:00"},
+    "renditions": {"M": {"processed": {"S": "processed-3f0c9a.jpg"}}},
+}
+# One of each per round, in this order
+REQUESTS = (
+    "/generate-upload-url?filename=IMG_0001.jpg&contentType=image/jpeg&contentLength=2048000",
+    f"/get-processed-image-url?key={KEY}",
+    f"/images/{KEY}",
+)
+
+
+class DynamoDBStandIn(http.server.ThreadingHTTPServer):
+    """Answers the UI's DynamoDB calls after a fixed delay, like a remote endpoint."""
+
+    daemon_threads = True
+
+    def __init__(self, latency):
+        self.latency = latency
+        super().__init__(("127.0.0.1", 0), DynamoDBHandler)
+
+
+class DynamoDBHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY each
+    # response waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+    RESPONSES = {
+        "GetItem": {"Item": DONE_ITEM},
+        "PutItem": {},
+        "BatchWriteItem": {"UnprocessedItems": {}},
+        "BatchGetItem": {"Responses": {}, "UnprocessedKeys": {}},
+        "Query": {"Items": [], "Count": 0, "ScannedCount": 0},
+    }
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        operation = self.headers.get("X-Amz-Target", "").rpartition(".")[2]
+        body = json.dumps(self.RESPONSES.get(operation, {})).encode()
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, dynamodb_url):
+    env = dict(
+        os.environ,
+        AWS_ENDPOINT_URL_DYNAMODB=dynamodb_url,
+        AWS_DEFAULT_REGION="us-east-1",
+        AWS_ACCESS_KEY_ID="benchmark",
+        AWS_SECRET_ACCESS_KEY="benchmark",
+        UI_BIND=f"127.0.0.1:{port}",
+    )
+    if mode == "debug":
+        # app.py listens on 5000 like in development
+        command = [sys.executable, "app.py"]
+    else:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"]
+    process = subprocess.Popen(
+        command, cwd=UI_APP, env=env, start_new_session=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/url-cache-stats")
+            if connection.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process)
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait(timeout=30)
+
+
+def load(port, clients, seconds, warmup):
+    """Latencies (ms) of the requests completed after ``warmup`` seconds, and the error count."""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    start = time.monotonic()
+    stop_at = start + warmup + seconds
+
+    def client():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        own, own_errors, i = [], 0, 0
+        while time.monotonic() < stop_at:
+            path = REQUESTS[i % len(REQUESTS)]
+            i += 1
+            sent = time.monotonic()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+            done = time.monotonic()
+            if sent - start >= warmup:
+                own.append((done - sent) * 1000)
+                own_errors += not ok
+        with lock:
+            latencies.extend(own)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=10.0)
+    parser.add_argument("--modes", nargs="+", choices=("debug", "gunicorn"), default=["debug", "gunicorn"])
+    args = parser.parse_args()
+
+    dynamodb = DynamoDBStandIn(args.dynamodb_latency_ms / 1000)
+    threading.Thread(target=dynamodb.serve_forever, daemon=True).start()
+    dynamodb_url = f"http://127.0.0.1:{dynamodb.server_address[1]}"
+
+    rows = []
+    for mode in args.modes:
+        port = 5000 if mode == "debug" else free_port()
+        process = start_server(mode, port, dynamodb_url)
+        try:
+            latencies, errors = load(port, args.clients, args.seconds, args.warmup)
+        finally:
+            stop_server(process)
+        latencies.sort()
+        cuts = statistics.quantiles(latencies, n=100)
+        rows.append((mode, len(latencies), len(latencies) / args.seconds, cuts[49], cuts[89], cuts[98], errors))
+
+    print("<!-- Generated with: python benchmarks/ui_load.py -->\n")
+    print("# UI service: debug server vs gunicorn\n")
+    print(f"{platform.machine()}, {os.cpu_count()} CPU, Python {platform.python_version()}; "
+          f"{args.clients} clients for {args.seconds:g} s after a {args.warmup:g} s warm-up; "
+          f"DynamoDB stand-in answering after {args.dynamodb_latency_ms:g} ms. "
+          "Requests rotate between /generate-upload-url, /get-processed-image-url and /images/{key}.\n")
+    print("| server | requests | req/s | p50 ms | p90 ms | p99 ms | errors |")
+    print("| --- | ---: | ---: | ---: | ---: | ---: | ---: |")
+    for mode, count, rate, p50, p90, p99, errors in rows:
+        print(f"| {mode} | {count} | {rate:.0f} | {p50:.1f} | {p90:.1f} | {p99:.1f} | {errors} |")
+
+
+if __name__ == "__main__":
+    main()
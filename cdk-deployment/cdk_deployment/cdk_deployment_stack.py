@@ -1,19 +1,94 @@
 from aws_cdk import (
-    App, Stack, Duration, RemovalPolicy,
+    App, Stack, Duration, RemovalPolicy, Size,
     aws_s3 as s3,
     aws_lambda as _lambda,
     aws_s3_notifications as s3n,
     aws_dynamodb as dynamodb,
     aws_apigateway as apigw,
+    aws_apigatewayv2 as apigwv2,
+    aws_apigatewayv2_integrations as apigwv2_integrations,
     aws_iam as iam,
+    aws_applicationautoscaling as appscaling,
+    aws_stepfunctions as sfn,
+    aws_stepfunctions_tasks as tasks,
 )
 import aws_cdk as cdk
 from constructs import Construct
 
+from cdk_deployment.settings import load_settings
+
+# Uploads larger than this are processed by the large-image tier.
+LARGE_IMAGE_THRESHOLD_BYTES = 5 * 1024 * 1024
+# Presign refuses uploads declared larger than this.
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+SMALL_IMAGE_PREFIX = "small/"
+LARGE_IMAGE_PREFIX = "large/"
+# Only these suffixes trigger processing. S3 filters are case sensitive, and
+# phones and cameras commonly write upper-case extensions.
+IMAGE_SUFFIXES = [
+    suffix
+    for ext in (".jpg", ".jpeg", ".png", ".webp", ".gif")
+    for suffix in (ext, ext.upper())
+]
+# Suffixes for the formats that can be enabled with extra_image_formats
+EXTRA_IMAGE_SUFFIXES = {
+    "AVIF": (".avif",),
+    "HEIF": (".heic", ".heif"),
+    "TIFF": (".tif", ".tiff"),
+    "BMP": (".bmp",),
+}
+# Pillow 10 decodes TIFF and BMP itself; these formats need a plugin in the
+# processor asset, installed by lambda/Dockerfile when they are enabled
+EXTRA_IMAGE_PACKAGES = {
+    "AVIF": "pillow-avif-plugin==1.4.6",
+    "HEIF": "pillow-heif==0.16.0",
+}
+
+# REST API integrations time out after 29 seconds
+API_GATEWAY_TIMEOUT_SECONDS = 29
+
+ARCHITECTURES = {
+    "x86_64": _lambda.Architecture.X86_64,
+    "arm64": _lambda.Architecture.ARM_64,
+}
+
 class CdkDeploymentStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs):
         super().__init__(scope, id, **kwargs)
 
+        settings = load_settings(self.node)
+        # arm64 runs on Graviton, which is cheaper per GB-second for the
+        # CPU-bound decode/resize/encode work. The Docker assets below are
+        # built for the same platform, so pip resolves matching Pillow wheels.
+        if settings["architecture"] not in ARCHITECTURES:
+            raise ValueError(f"Unsupported architecture {settings['architecture']!r}, expected one of {sorted(ARCHITECTURES)}")
+        architecture = ARCHITECTURES[settings["architecture"]]
+        extra_formats = [name.upper() for name in settings["extra_image_formats"]]
+        for name in extra_formats:
+            if name not in EXTRA_IMAGE_SUFFIXES:
+                raise ValueError(f"Unsupported extra image format {name!r}, expected one of {sorted(EXTRA_IMAGE_SUFFIXES)}")
+        image_suffixes = IMAGE_SUFFIXES + [
+            suffix
+            for name in extra_formats
+            for ext in EXTRA_IMAGE_SUFFIXES[name]
+            for suffix in (ext, ext.upper())
+        ]
+        long_poll_seconds = settings["presign"]["long_poll_seconds"]
+        if not 0 <= long_poll_seconds < min(API_GATEWAY_TIMEOUT_SECONDS, settings["presign"]["timeout_seconds"]):
+            raise ValueError(
+                f"presign.long_poll_seconds ({long_poll_seconds}) must be below both the API Gateway timeout "
+                f"({API_GATEWAY_TIMEOUT_SECONDS}s) and presign.timeout_seconds ({settings['presign']['timeout_seconds']}s)"
+            )
+        # The backfill invokes the large tier, which keeps serving live
+        # uploads meanwhile: leave it some of its reserved concurrency
+        backfill_concurrency = settings["backfill"]["max_concurrency"]
+        large_reserved = settings["large_processor"]["reserved_concurrency"]
+        if large_reserved is not None and backfill_concurrency >= large_reserved:
+            raise ValueError(
+                f"backfill.max_concurrency ({backfill_concurrency}) must be below "
+                f"large_processor.reserved_concurrency ({large_reserved})"
+            )
+
         # S3 Bucket for uploaded images
         uploaded_bucket = s3.Bucket(
             self, "UploadedImagesBucket",
@@ -27,7 +102,11 @@ class CdkDeploymentStack(Stack):
                     allowed_headers=["*"],
                     exposed_headers=["ETag"]
                 )
-            ]
+            ],
+            # Multipart uploads the browser never completed or aborted
+            lifecycle_rules=[
+                s3.LifecycleRule(abort_incomplete_multipart_upload_after=Duration.days(1)),
+            ],
         )
 
         # S3 Bucket for processed images
@@ -52,29 +131,233 @@ class CdkDeploymentStack(Stack):
             removal_policy=RemovalPolicy.DESTROY, # dev only
         )
 
-        # Lambda function to process images
-        lambda_fn = _lambda.Function(
+        # Processing status per upload key (pending -> processing -> done or
+        # failed), written by presign and the processors and read by the
+        # status endpoint. Items expire a week after their last update.
+        image_status_table = dynamodb.Table(
+            self, "ImageStatusTable",
+            table_name="image-processing-status",
+            partition_key=dynamodb.Attribute(
+                name="upload_key",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY, # dev only
+        )
+
+        # Hourly processing-time aggregates per processor tier (see
+        # lambda/processing_stats.py): the processors add every image they
+        # finish and the status endpoint turns the last hours into a
+        # Retry-After hint. Items expire after a day.
+        processing_stats_table = dynamodb.Table(
+            self, "ProcessingStatsTable",
+            table_name="image-processing-stats",
+            partition_key=dynamodb.Attribute(
+                name="period",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY, # dev only
+        )
+
+        # --- WebSocket API for completion notifications ---
+
+        # Browsers subscribe to their upload keys (the presign function's
+        # "subscribe" route, added below) and the processors post each key's
+        # final status to its subscribers. Subscriptions expire after two
+        # hours; those of closed connections are deleted on the next post.
+        connections_table = dynamodb.Table(
+            self, "ConnectionsTable",
+            table_name="image-processing-connections",
+            partition_key=dynamodb.Attribute(
+                name="upload_key",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="connection_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY, # dev only
+        )
+        notifications_api = apigwv2.WebSocketApi(
+            self, "NotificationsApi",
+            api_name="Image Notification Service",
+            description="Pushes processing results to browsers subscribed to their uploads.",
+        )
+        notifications_stage = apigwv2.WebSocketStage(
+            self, "NotificationsStage",
+            web_socket_api=notifications_api,
+            stage_name="live",
+            auto_deploy=True,
+        )
+
+        # Lambda functions to process images, split into two tiers by
+        # original size: small originals (thumbnails, phone shots) run on a
+        # cheap low-memory function, large originals (scans, RAW exports)
+        # get more memory/CPU and a longer timeout.
+        extra_packages = [EXTRA_IMAGE_PACKAGES[name] for name in extra_formats if name in EXTRA_IMAGE_PACKAGES]
+        processor_code = _lambda.Code.from_docker_build(
+            path="lambda",  # folder with lambda_function.py and Dockerfile
+            platform=architecture.docker_platform,
+            # Left out by default, so the asset hash only changes with them
+            build_args={"EXTRA_REQUIREMENTS": " ".join(extra_packages)} if extra_packages else None,
+        )
+        processor_environment = {
+            "PROCESSED_BUCKET": processed_bucket.bucket_name,
+            "METADATA_TABLE": image_metadata_table.table_name,
+            "STATUS_TABLE": image_status_table.table_name,
+            "LARGE_IMAGE_THRESHOLD_BYTES": str(LARGE_IMAGE_THRESHOLD_BYTES),
+            # Pillow only ever loads the plugins for accepted formats
+            "IMAGE_EXTRA_FORMATS": ",".join(extra_formats),
+            "CONNECTIONS_TABLE": connections_table.table_name,
+            "WEBSOCKET_ENDPOINT": notifications_stage.callback_url,
+            "STATS_TABLE": processing_stats_table.table_name,
+        }
+
+        large_processor_fn = _lambda.Function(
+            self, "LargeImageProcessorLambda",
+            runtime=_lambda.Runtime.PYTHON_3_11,
+            handler="lambda_function.handler",
+            code=processor_code,
+            environment={
+                **processor_environment,
+                "PROCESSOR_TIER": "large",
+                "WARM_UP": settings["large_processor"]["warm_up"],
+            },
+            architecture=architecture,
+            **self._capacity_props(settings["large_processor"]),
+        )
+        large_processor = self._live_alias(
+            large_processor_fn, settings["large_processor"]["provisioned_concurrency"])
+
+        small_processor_fn = _lambda.Function(
             self, "ImageProcessorLambda",
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="lambda_function.handler",
-            code=_lambda.Code.from_docker_build(path="lambda"),  # folder with lambda_function.py and Dockerfile
+            code=processor_code,
             environment={
-                "PROCESSED_BUCKET": processed_bucket.bucket_name,
-                "METADATA_TABLE": image_metadata_table.table_name,
+                **processor_environment,
+                "PROCESSOR_TIER": "small",
+                "WARM_UP": settings["small_processor"]["warm_up"],
+                # Oversized objects that arrive without the large/ prefix are
+                # handed over to the large tier instead of timing out here.
+                "LARGE_PROCESSOR_FUNCTION": large_processor.function_arn,
             },
-            memory_size=1024,
-            timeout=Duration.seconds(30),
+            architecture=architecture,
+            **self._capacity_props(settings["small_processor"]),
         )
+        small_processor = self._live_alias(
+            small_processor_fn, settings["small_processor"]["provisioned_concurrency"])
+        large_processor.grant_invoke(small_processor_fn)
 
         # Grant permissions
-        uploaded_bucket.grant_read(lambda_fn)
-        processed_bucket.grant_write(lambda_fn)
-        image_metadata_table.grant_read_write_data(lambda_fn) # Grant Lambda write access to DynamoDB table
+        for processor_fn in (small_processor_fn, large_processor_fn):
+            uploaded_bucket.grant_read(processor_fn)
+            processed_bucket.grant_write(processor_fn)
+            image_metadata_table.grant_read_write_data(processor_fn) # Grant Lambda write access to DynamoDB table
+            image_status_table.grant_write_data(processor_fn)
+            # Subscribers get a download URL signed by the processor
+            processed_bucket.grant_read(processor_fn)
+            connections_table.grant_read_write_data(processor_fn)
+            processing_stats_table.grant_write_data(processor_fn)
+            notifications_stage.grant_management_api_access(processor_fn)
+
+        # Trigger the matching tier on object creation in uploaded bucket. The
+        # presign service puts each upload under small/ or large/ based on the
+        # size declared by the client; non-image suffixes never invoke Lambda.
+        for prefix, processor_fn in (
+            (SMALL_IMAGE_PREFIX, small_processor),
+            (LARGE_IMAGE_PREFIX, large_processor),
+        ):
+            for suffix in image_suffixes:
+                uploaded_bucket.add_event_notification(
+                    s3.EventType.OBJECT_CREATED,
+                    s3n.LambdaDestination(processor_fn),
+                    s3.NotificationKeyFilter(prefix=prefix, suffix=suffix)
+                )
+
+
+        # --- Backfill: reprocess existing originals at scale ---
 
-        # Trigger Lambda on object creation in uploaded bucket
-        uploaded_bucket.add_event_notification(
-            s3.EventType.OBJECT_CREATED,
-            s3n.LambdaDestination(lambda_fn)
+        # A Distributed Map reads an S3 Inventory manifest (or any manifest in
+        # the same format) and fans batches of objects out to the large tier,
+        # whose timeout leaves room for a whole batch per invocation. Start an
+        # execution with {"manifestBucket": "...", "manifestKey": ".../manifest.json"}.
+        process_batch = tasks.LambdaInvoke(
+            self, "ProcessBackfillBatch",
+            lambda_function=large_processor,
+            payload_response_only=True,
+        )
+        # Throttles are not among LambdaInvoke's default retries; a burst of
+        # live large uploads must not fail backfill batches outright
+        process_batch.add_retry(
+            errors=["Lambda.TooManyRequestsException"],
+            interval=Duration.seconds(2),
+            backoff_rate=2,
+            max_attempts=6,
+            jitter_strategy=sfn.JitterType.FULL,
+        )
+        # The processor logs and skips records it cannot process; surface them
+        # as a failed batch so they count towards the tolerated failures.
+        backfill_batch = process_batch.next(
+            sfn.Choice(self, "BackfillBatchFailed?")
+            .when(
+                sfn.Condition.number_greater_than("$.failed", 0),
+                sfn.Fail(self, "BackfillBatchFailed", error="ImageProcessingFailed"),
+            )
+            .otherwise(sfn.Succeed(self, "BackfillBatchSucceeded"))
+        )
+
+        backfill_results_bucket = s3.Bucket(
+            self, "BackfillResultsBucket",
+            removal_policy=RemovalPolicy.DESTROY,  # dev only
+            auto_delete_objects=True,
+            lifecycle_rules=[s3.LifecycleRule(expiration=Duration.days(30))],
+        )
+        backfill_map = sfn.DistributedMap(
+            self, "BackfillMap",
+            item_reader=sfn.S3ManifestItemReader(
+                bucket_name_path=sfn.JsonPath.string_at("$.manifestBucket"),
+                key=sfn.JsonPath.string_at("$.manifestKey"),
+            ),
+            item_batcher=sfn.ItemBatcher(
+                max_items_per_batch=settings["backfill"]["batch_size"],
+                batch_input={"source": "backfill"},
+            ),
+            max_concurrency=settings["backfill"]["max_concurrency"],
+            tolerated_failure_percentage=settings["backfill"]["tolerated_failure_percentage"],
+            # Per-batch results would overflow the execution output at this
+            # scale, so they are written to S3 instead: to a bucket of their
+            # own, where no inventory or listing of the uploads picks them
+            # up as originals to process.
+            result_writer_v2=sfn.ResultWriterV2(
+                bucket=backfill_results_bucket,
+                prefix="backfill-results",
+            ),
+        )
+        backfill_map.item_processor(backfill_batch)
+
+        backfill_state_machine = sfn.StateMachine(
+            self, "BackfillStateMachine",
+            definition_body=sfn.DefinitionBody.from_chainable(backfill_map),
+        )
+        # Inventory manifests usually live in a separate destination bucket;
+        # the state machine may read that one only
+        manifest_bucket_name = settings["backfill"]["manifest_bucket"]
+        if manifest_bucket_name:
+            manifest_bucket = s3.Bucket.from_bucket_name(self, "BackfillManifestBucket", manifest_bucket_name)
+        else:
+            manifest_bucket = uploaded_bucket
+        manifest_bucket.grant_read(backfill_state_machine)
+
+        cdk.CfnOutput(
+            self, "BackfillStateMachineArn",
+            value=backfill_state_machine.state_machine_arn,
+            description="Step Functions state machine for reprocessing existing uploads"
         )
 
 
@@ -85,16 +368,54 @@ class CdkDeploymentStack(Stack):
             self, "PresignLambda",
             runtime=_lambda.Runtime.PYTHON_3_11,
             handler="presign_handler.handler",
-            code=_lambda.Code.from_asset("presign_lambda"),
+            # Built from cdk-deployment/ so it can reuse the asset build tooling in lambda/
+            code=_lambda.Code.from_docker_build(
+                path=".",
+                file="presign_lambda/Dockerfile",
+                platform=architecture.docker_platform,
+            ),
             environment={
                 "UPLOAD_BUCKET": uploaded_bucket.bucket_name,
                 "PROCESSED_BUCKET": processed_bucket.bucket_name,
-            }
+                "STATUS_TABLE": image_status_table.table_name,
+                "METADATA_TABLE": image_metadata_table.table_name,
+                "CONNECTIONS_TABLE": connections_table.table_name,
+                "STATS_TABLE": processing_stats_table.table_name,
+                "LARGE_IMAGE_THRESHOLD_BYTES": str(LARGE_IMAGE_THRESHOLD_BYTES),
+                "MAX_UPLOAD_BYTES": str(MAX_UPLOAD_BYTES),
+                # Files the notifications below would never route are refused
+                "IMAGE_SUFFIXES": ",".join(dict.fromkeys(suffix.lower() for suffix in image_suffixes)),
+                "LONG_POLL_MAX_SECONDS": str(long_poll_seconds),
+            },
+            architecture=architecture,
+            **self._capacity_props(settings["presign"]),
         )
+        presign = self._live_alias(
+            presign_lambda, settings["presign"]["provisioned_concurrency"])
 
         # Grant the presign lambda permissions for both buckets
         uploaded_bucket.grant_put(presign_lambda)
+        # Completing a multipart upload first checks the parts' sizes
+        presign_lambda.add_to_role_policy(iam.PolicyStatement(
+            actions=["s3:ListMultipartUploadParts"],
+            resources=[uploaded_bucket.arn_for_objects("*")],
+        ))
         processed_bucket.grant_read(presign_lambda)
+        image_status_table.grant_read_write_data(presign_lambda)
+        image_metadata_table.grant_read_data(presign_lambda)
+        connections_table.grant_write_data(presign_lambda)
+        processing_stats_table.grant_read_data(presign_lambda)
+        # Subscriptions to uploads that already finished are answered at once
+        notifications_stage.grant_management_api_access(presign_lambda)
+        notifications_api.add_route(
+            "subscribe",
+            integration=apigwv2_integrations.WebSocketLambdaIntegration("SubscribeIntegration", presign),
+        )
+        cdk.CfnOutput(
+            self, "NotificationsWebSocketUrl",
+            value=notifications_stage.url,
+            description="WebSocket endpoint browsers subscribe to for processing results"
+        )
 
 
         # API Gateway to trigger the presign lambda
@@ -104,22 +425,63 @@ class CdkDeploymentStack(Stack):
             description="This service generates pre-signed URLs for image uploads and downloads.",
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
-                allow_methods=apigw.Cors.ALL_METHODS
-            )
+                allow_methods=apigw.Cors.ALL_METHODS,
+                # Conditional GET /images/{key} requests
+                allow_headers=apigw.Cors.DEFAULT_HEADERS + ["If-None-Match"],
+                # Browsers reuse a preflight this long instead of sending an
+                # OPTIONS before every request (Chromium caps it at 2 hours)
+                max_age=cdk.Duration.hours(2),
+            ),
+            # gzip JSON responses of 1 KiB and more for clients that accept it
+            # (same threshold as presign_lambda/http_caching.py)
+            min_compression_size=cdk.Size.kibibytes(1),
         )
 
         # Add a /generate-upload-url resource and a POST method
         generate_upload_url_resource = api.root.add_resource("generate-upload-url")
         generate_upload_url_resource.add_method(
             "POST",
-            apigw.LambdaIntegration(presign_lambda)
+            apigw.LambdaIntegration(presign)
+        )
+
+        # Add a /generate-upload-urls resource: one POST signs a batch of files
+        generate_upload_urls_resource = api.root.add_resource("generate-upload-urls")
+        generate_upload_urls_resource.add_method(
+            "POST",
+            apigw.LambdaIntegration(presign)
         )
 
+        # Add /multipart-upload/{create,parts,complete,abort} POST methods for
+        # large files, uploaded in parallel parts straight to S3
+        multipart_upload_resource = api.root.add_resource("multipart-upload")
+        for action in ("create", "parts", "complete", "abort"):
+            multipart_upload_resource.add_resource(action).add_method(
+                "POST",
+                apigw.LambdaIntegration(presign)
+            )
+
         # Add a /get-processed-image-url resource and a GET method
         get_processed_image_url_resource = api.root.add_resource("get-processed-image-url")
         get_processed_image_url_resource.add_method(
             "GET",
-            apigw.LambdaIntegration(presign_lambda)
+            apigw.LambdaIntegration(presign)
+        )
+
+        # Add a /get-processed-image-urls resource: one POST (long-)polls the
+        # status of up to 100 uploads
+        get_processed_image_urls_resource = api.root.add_resource("get-processed-image-urls")
+        get_processed_image_urls_resource.add_method(
+            "POST",
+            apigw.LambdaIntegration(presign)
+        )
+
+        # Add a GET /images/{key+} resource: status, renditions and metadata
+        # of one upload, with ETag revalidation. Keys contain a slash, hence
+        # the greedy path parameter.
+        images_resource = api.root.add_resource("images")
+        images_resource.add_resource("{key+}").add_method(
+            "GET",
+            apigw.LambdaIntegration(presign)
         )
 
         # Output the API Gateway URL
@@ -128,3 +490,48 @@ class CdkDeploymentStack(Stack):
             value=api.url,
             description="API Gateway endpoint for generating pre-signed upload URLs"
         )
+
+        # The metadata table's name is generated; the Flask app reads it
+        # from its METADATA_TABLE environment variable
+        cdk.CfnOutput(
+            self, "MetadataTableName",
+            value=image_metadata_table.table_name,
+            description="DynamoDB table with the sizes and dimensions of processed images"
+        )
+
+    @staticmethod
+    def _capacity_props(capacity):
+        """Function properties for one section of the capacity settings."""
+        return {
+            "memory_size": capacity["memory_size"],
+            "timeout": Duration.seconds(capacity["timeout_seconds"]),
+            "ephemeral_storage_size": Size.mebibytes(capacity["ephemeral_storage_mib"]),
+            "reserved_concurrent_executions": capacity["reserved_concurrency"],
+        }
+
+    def _live_alias(self, fn, provisioned):
+        """Point a "live" alias at the current version of ``fn``.
+
+        Triggers invoke the alias rather than $LATEST, since provisioned
+        concurrency can only be attached to a version or alias.
+        """
+        if not provisioned:
+            return fn.add_alias("live")
+        if isinstance(provisioned, int):
+            return fn.add_alias("live", provisioned_concurrent_executions=provisioned)
+
+        alias = fn.add_alias("live", provisioned_concurrent_executions=provisioned["min"])
+        scaling = alias.add_auto_scaling(
+            min_capacity=provisioned["min"],
+            max_capacity=provisioned["max"],
+        )
+        if provisioned.get("utilization_target"):
+            scaling.scale_on_utilization(utilization_target=provisioned["utilization_target"])
+        for schedule in provisioned.get("schedules", []):
+            scaling.scale_on_schedule(
+                schedule["name"],
+                schedule=appscaling.Schedule.cron(**schedule["cron"]),
+                min_capacity=schedule.get("min_capacity"),
+                max_capacity=schedule.get("max_capacity"),
+            )
+        return alias
@@ -0,0 +1,134 @@
+"""Capacity and concurrency settings for CdkDeploymentStack.
+
+Settings start from ``DEFAULTS``, are overlaid with the profile selected
+through the ``profile`` context key (``dev`` when unset) and finally with any
+individual ``<section>.<setting>`` context keys, e.g.::
+
+    cdk deploy -c profile=prod -c large_processor.reserved_concurrency=50
+"""
+import copy
+import json
+
+DEFAULTS = {
+    # x86_64 or arm64, applied to every function in the stack
+    "architecture": "x86_64",
+    # Formats decoded on top of JPEG/PNG/WebP/GIF: any of AVIF, HEIF, TIFF, BMP
+    "extra_image_formats": [],
+    "small_processor": {
+        "memory_size": 512,
+        "timeout_seconds": 15,
+        "ephemeral_storage_mib": 512,
+        "reserved_concurrency": None,
+        "provisioned_concurrency": None,
+        # Init-phase warm-up of the processor: off, on or connect
+        "warm_up": "off",
+    },
+    "large_processor": {
+        "memory_size": 3008,
+        "timeout_seconds": 300,
+        "ephemeral_storage_mib": 2048,
+        "reserved_concurrency": None,
+        "provisioned_concurrency": None,
+        "warm_up": "off",
+    },
+    "presign": {
+        "memory_size": 256,
+        # Covers the longest long-poll plus the request itself
+        "timeout_seconds": 30,
+        "ephemeral_storage_mib": 512,
+        "reserved_concurrency": None,
+        "provisioned_concurrency": None,
+        # Longest /get-processed-image-url?wait= the function holds a
+        # request for; must stay below API Gateway's 29 s integration timeout
+        "long_poll_seconds": 20,
+    },
+    # Distributed Map batching for the backfill state machine
+    "backfill": {
+        "batch_size": 25,
+        "max_concurrency": 100,
+        "tolerated_failure_percentage": 1,
+        # Bucket holding the S3 Inventory manifests, the only one the state
+        # machine can read them from; the upload bucket when unset
+        "manifest_bucket": None,
+    },
+}
+
+# Provisioned concurrency is either a fixed number of environments or a dict
+# with "min"/"max" capacity plus a "utilization_target" and/or a list of
+# "schedules" ({"name", "cron": {...}, "min_capacity", "max_capacity"}).
+PROFILES = {
+    "dev": {},
+    "prod": {
+        "small_processor": {
+            "reserved_concurrency": 200,
+            "provisioned_concurrency": {
+                "min": 2,
+                "max": 50,
+                "utilization_target": 0.7,
+                "schedules": [
+                    # Be warm before the first uploads of the working day (UTC)
+                    {"name": "MorningScaleUp", "cron": {"hour": "6", "minute": "45"}, "min_capacity": 10},
+                    {"name": "EveningScaleDown", "cron": {"hour": "20", "minute": "0"}, "min_capacity": 2},
+                ],
+            },
+            # Provisioned environments run init ahead of traffic, so the
+            # first record on each one gets warm codecs and connections.
+            "warm_up": "connect",
+        },
+        "large_processor": {
+            "reserved_concurrency": 50,
+            "warm_up": "on",
+        },
+        "presign": {
+            "provisioned_concurrency": {
+                "min": 1,
+                "max": 10,
+                "utilization_target": 0.7,
+            },
+        },
+        # Below large_processor.reserved_concurrency, leaving room for live
+        # large uploads
+        "backfill": {
+            "max_concurrency": 40,
+        },
+    },
+}
+
+
+def _merge(base, overrides):
+    for name, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(name), dict):
+            _merge(base[name], value)
+        else:
+            base[name] = value
+    return base
+
+
+def _parse(value):
+    # Values passed with -c on the command line always arrive as strings
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def load_settings(node):
+    """Resolve the settings for the construct tree ``node`` belongs to."""
+    profile = node.try_get_context("profile") or "dev"
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile {profile!r}, expected one of {sorted(PROFILES)}")
+
+    settings = _merge(copy.deepcopy(DEFAULTS), copy.deepcopy(PROFILES[profile]))
+    for section, values in settings.items():
+        if isinstance(values, dict):
+            for name in values:
+                override = node.try_get_context(f"{section}.{name}")
+                if override is not None:
+                    values[name] = _parse(override)
+        else:
+            override = node.try_get_context(section)
+            if override is not None:
+                settings[section] = _parse(override)
+    return settings
@@ -0,0 +1,98 @@
+"""Completion notifications over the WebSocket API.
+
+Browsers open the stack's WebSocket API and send
+``{"action": "subscribe", "keys": [...]}`` for their upload keys; the presign
+function stores one connection-table item per (upload key, connection). When
+a record ends up done or failed, the processor looks up the key's
+subscribers and posts them a status message, which replaces status polling.
+
+``ConnectionManager`` posts through the API Gateway management API;
+``LocalConnectionManager`` is an in-memory stand-in with the same ``post``
+for tests and local runs. Shared by the processor and the presign function.
+"""
+import json
+
+
+def status_message(upload_key, status, url=None, processed_key=None, error=None):
+    """The message pushed for ``upload_key`` once it is done or failed."""
+    message = {"type": "status", "key": upload_key, "status": status}
+    if url is not None:
+        message["url"] = url
+        message["processedKey"] = processed_key
+    if error is not None:
+        message["error"] = error
+    return message
+
+
+class ConnectionManager:
+    """Posts messages to WebSocket connections.
+
+    ``client`` is an ``apigatewaymanagementapi`` client created with the
+    stage's callback URL as ``endpoint_url``.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def post(self, connection_id, message):
+        """Send ``message`` as JSON; False when the connection is gone."""
+        try:
+            self._client.post_to_connection(
+                ConnectionId=connection_id,
+                Data=json.dumps(message).encode("utf-8"),
+            )
+        except self._client.exceptions.GoneException:
+            return False
+        return True
+
+
+class LocalConnectionManager:
+    """In-memory stand-in for ConnectionManager.
+
+    Connections are opened with ``connect``; ``messages`` maps each open
+    connection to the messages posted to it, decoded as a browser would.
+    """
+
+    def __init__(self):
+        self.messages = {}
+
+    def connect(self, connection_id):
+        self.messages[connection_id] = []
+
+    def disconnect(self, connection_id):
+        self.messages.pop(connection_id, None)
+
+    def post(self, connection_id, message):
+        if connection_id not in self.messages:
+            return False
+        self.messages[connection_id].append(json.loads(json.dumps(message)))
+        return True
+
+
+def subscribers(dynamodb, table_name, upload_key):
+    """Connection ids subscribed to ``upload_key``."""
+    items = dynamodb.query(
+        TableName=table_name,
+        KeyConditionExpression="upload_key = :key",
+        ExpressionAttributeValues={":key": {"S": upload_key}},
+        ProjectionExpression="connection_id",
+        ConsistentRead=True,
+    )["Items"]
+    return [item["connection_id"]["S"] for item in items]
+
+
+def notify(dynamodb, table_name, manager, upload_key, connection_ids, message):
+    """Post ``message`` to ``connection_ids``; returns how many received it.
+
+    Subscriptions of connections that have gone away are deleted.
+    """
+    delivered = 0
+    for connection_id in connection_ids:
+        if manager.post(connection_id, message):
+            delivered += 1
+        else:
+            dynamodb.delete_item(
+                TableName=table_name,
+                Key={"upload_key": {"S": upload_key}, "connection_id": {"S": connection_id}},
+            )
+    return delivered
@@ -0,0 +1,134 @@
+"""Pillow codec registry for the image formats the processor accepts.
+
+``Image.open`` normally calls ``Image.init()``, which imports every Pillow
+format plugin (~40 modules) the first time an image is opened. Here only the
+plugins for the accepted formats are imported and Pillow is marked as
+initialised, so nothing else is ever loaded and no other decoder is ever
+handed untrusted input.
+
+JPEG, PNG, WebP and GIF are always accepted. More formats can be enabled
+with ``IMAGE_EXTRA_FORMATS`` (comma separated, e.g. ``AVIF,HEIF``); AVIF and
+HEIF need their plugin packages in the asset, which the stack installs when
+they are enabled. An enabled format whose plugin is missing is not sniffed
+either, so its uploads are rejected up front instead of failing to decode.
+
+The signature table is plain data, so uploads can be sniffed before Pillow is
+imported at all.
+"""
+import importlib
+import importlib.util
+import io
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# format: (Pillow plugin module, leading byte signatures as (offset, magic))
+ACCEPTED_FORMATS = {
+    "JPEG": ("PIL.JpegImagePlugin", [(0, b"\xff\xd8\xff")]),
+    "PNG": ("PIL.PngImagePlugin", [(0, b"\x89PNG\r\n\x1a\n")]),
+    "WEBP": ("PIL.WebPImagePlugin", [(8, b"WEBP")]),
+    "GIF": ("PIL.GifImagePlugin", [(0, b"GIF87a"), (0, b"GIF89a")]),
+}
+
+EXTRA_FORMATS = {
+    # Native in Pillow >= 11.2, otherwise from pillow-avif-plugin
+    "AVIF": (("PIL.AvifImagePlugin", "pillow_avif"), [(4, b"ftypavif"), (4, b"ftypavis")]),
+    # pillow-heif registers itself through register_heif_opener()
+    "HEIF": (("pillow_heif",), [(4, b"ftypheic"), (4, b"ftypheix"), (4, b"ftypmif1"), (4, b"ftypmsf1")]),
+    "TIFF": (("PIL.TiffImagePlugin",), [(0, b"II*\x00"), (0, b"MM\x00*")]),
+    "BMP": (("PIL.BmpImagePlugin",), [(0, b"BM")]),
+}
+
+# Longest offset + magic in the tables above
+SNIFF_BYTES = 12
+
+extra_formats = [
+    name.strip().upper()
+    for name in os.environ.get("IMAGE_EXTRA_FORMATS", "").split(",")
+    if name.strip()
+]
+for _name in extra_formats:
+    if _name not in EXTRA_FORMATS:
+        raise ValueError(f"Unsupported IMAGE_EXTRA_FORMATS entry {_name!r}, expected one of {sorted(EXTRA_FORMATS)}")
+
+_Image = None
+_enabled_formats = None
+# Enabled extra formats with an installed plugin, once looked up
+_available_extra = None
+
+
+def sniff_format(header):
+    """Format name whose signature ``header`` starts with, or None."""
+    candidates = list(ACCEPTED_FORMATS.items())
+    candidates += [(name, EXTRA_FORMATS[name]) for name in available_extra_formats()]
+    for name, (_, signatures) in candidates:
+        for offset, magic in signatures:
+            if header[offset:offset + len(magic)] == magic:
+                return name
+    return None
+
+
+def available_extra_formats():
+    """The enabled extra formats whose plugin is installed.
+
+    Found without importing the plugins (or Pillow's image module); once
+    image_module() ran, only those whose plugin actually loaded.
+    """
+    global _available_extra
+    if _available_extra is None:
+        _available_extra = [name for name in extra_formats if _plugin_module(name) is not None]
+    return _available_extra
+
+
+def _plugin_module(name):
+    modules, _ = EXTRA_FORMATS[name]
+    for module_name in modules:
+        try:
+            if importlib.util.find_spec(module_name) is not None:
+                return module_name
+        except ImportError:
+            continue
+    logger.warning(f"{name} is enabled but none of {', '.join(modules)} is installed")
+    return None
+
+
+def _load_extra(name):
+    module_name = _plugin_module(name)
+    if module_name is None:
+        return False
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        logger.warning(f"{name} is enabled but {module_name} could not be loaded: {e}")
+        return False
+    if module_name == "pillow_heif":
+        module.register_heif_opener()
+    return True
+
+
+def image_module():
+    """``PIL.Image`` with only the accepted format plugins registered."""
+    global _Image, _enabled_formats, _available_extra
+    if _Image is None:
+        from PIL import Image
+
+        enabled = []
+        for name, (module_name, _) in ACCEPTED_FORMATS.items():
+            importlib.import_module(module_name)
+            enabled.append(name)
+        loaded = [name for name in available_extra_formats() if _load_extra(name)]
+        enabled += loaded
+
+        # Mark Pillow as fully initialised so preinit()/init() never import
+        # the remaining plugins behind our back.
+        Image._initialized = 2
+        _Image, _enabled_formats, _available_extra = Image, enabled, loaded
+    return _Image
+
+
+def open_image(data):
+    """Open ``data`` (bytes or file object) with the enabled decoders only."""
+    Image = image_module()
+    fp = io.BytesIO(data) if isinstance(data, bytes) else data
+    return Image.open(fp, formats=_enabled_formats)
@@ -1,42 +1,288 @@
-import boto3
 import os
 import io
-from PIL import Image
 import datetime
+import json
 import logging
+import time
+import urllib.parse
+
+import connections
+import image_codecs
+import pre_resize
+import processing_stats
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from model_cache import create_session
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-s3 = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
+# Low-level clients only: the boto3 resource layer would load and parse its
+# own JSON models and build classes during init for a single put_item. The
+# session serves the service models from the build-time model cache.
+session = create_session()
+# SigV4 for the download URLs pushed to subscribers
+s3 = session.client("s3", config=Config(signature_version="s3v4"))
+dynamodb = session.client("dynamodb")
 
 processed_bucket = os.environ["PROCESSED_BUCKET"]
 metadata_table_name = os.environ["METADATA_TABLE"]
-metadata_table = dynamodb.Table(metadata_table_name)
+# Per-upload processing status read by the presign API; skipped when unset
+status_table_name = os.environ.get("STATUS_TABLE")
+STATUS_TTL = datetime.timedelta(days=7)
+# Uploads whose key was issued by the presign API (they carry the
+# original-filename metadata) are never overwritten with other content, so
+# their outputs can be cached forever.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# WebSocket completion notifications (see connections.py); skipped when unset
+connections_table_name = os.environ.get("CONNECTIONS_TABLE")
+websocket_endpoint = os.environ.get("WEBSOCKET_ENDPOINT")
+connection_manager = None
+# Hourly processing-time aggregates behind the status endpoint's ETA hint
+# (see processing_stats.py); skipped when unset
+stats_table_name = os.environ.get("STATS_TABLE")
+
+# Size-based tiering: the small tier hands oversized originals over to the
+# large tier rather than risking a timeout on its smaller memory/CPU budget.
+processor_tier = os.environ.get("PROCESSOR_TIER", "small")
+large_image_threshold = int(os.environ.get("LARGE_IMAGE_THRESHOLD_BYTES", 5 * 1024 * 1024))
+large_processor_function = os.environ.get("LARGE_PROCESSOR_FUNCTION")
+lambda_client = None
+
+# Optional init-phase warm-up, see warm_up(): "off", "on" (local work only) or
+# "connect" (also opens the S3 and DynamoDB connections).
+WARM_UP_MODES = ("off", "on", "connect")
+warm_up_mode = os.environ.get("WARM_UP", "off").lower()
+if warm_up_mode not in WARM_UP_MODES:
+    raise ValueError(f"Unsupported WARM_UP {warm_up_mode!r}, expected one of {WARM_UP_MODES}")
+
+def warm_up(connect=False):
+    """Pay the first-use costs during init instead of in the first record.
+
+    Runs a tiny image through the same decode/resize/encode path as the
+    handler, then signs (without sending) an S3 and a DynamoDB request, which
+    loads credentials and resolves both endpoint rule sets. With ``connect``
+    it also sends one cheap request per service so the first record finds an
+    open TLS connection in the pool.
+    """
+    out = io.BytesIO()
+    image_codecs.image_module().new("RGB", (8, 8)).save(out, "JPEG", quality=70)
+    with image_codecs.open_image(out.getvalue()) as img:
+        img.resize((4, 4)).convert("RGB").save(io.BytesIO(), "JPEG", optimize=True, quality=70)
+
+    s3.generate_presigned_url("put_object", Params={"Bucket": processed_bucket, "Key": "warm-up"})
+    dynamodb.generate_presigned_url("describe_table", Params={"TableName": metadata_table_name})
+
+    if connect:
+        dynamodb.describe_table(TableName=metadata_table_name)
+        try:
+            s3.head_bucket(Bucket=processed_bucket)
+        except ClientError:
+            # The processors may only write to this bucket; the 403 still
+            # leaves the connection in the pool.
+            pass
+
+if warm_up_mode != "off":
+    try:
+        warm_up(connect=warm_up_mode == "connect")
+    except Exception as e:
+        # Never fail init over an optimisation
+        logger.warning(f"Warm-up failed: {e}")
+
+def record_rejection(src_key, reason):
+    # CloudWatch embedded metric format: the log line itself becomes a
+    # RejectedObjects datapoint, no PutMetricData call needed.
+    logger.warning(f"Rejected {src_key}: {reason}")
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(datetime.datetime.now().timestamp() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": "ImageProcessing",
+                "Dimensions": [["Reason"]],
+                "Metrics": [{"Name": "RejectedObjects", "Unit": "Count"}],
+            }],
+        },
+        "Reason": reason,
+        "RejectedObjects": 1,
+        "ObjectKey": src_key,
+    }))
+
+def set_status(upload_key, status, processed_key=None, error=None, size_bytes=None):
+    """Record where ``upload_key`` is: processing, done or failed.
+
+    The presign API answers status polls from this item with a single
+    GetItem, and reports failures as soon as they are written here.
+    """
+    if not status_table_name:
+        return
+    now = datetime.datetime.now(datetime.timezone.utc)
+    values = {
+        ":status": {"S": status},
+        ":updated_at": {"S": now.isoformat()},
+        ":expires_at": {"N": str(int((now + STATUS_TTL).timestamp()))},
+    }
+    expression = "SET #status = :status, updated_at = :updated_at, expires_at = :expires_at"
+    if size_bytes is not None:
+        values[":size_bytes"] = {"N": str(size_bytes)}
+        expression += ", size_bytes = :size_bytes"
+    if processed_key:
+        values[":renditions"] = {"M": {"processed": {"S": processed_key}}}
+        expression += ", renditions = :renditions"
+    if error:
+        values[":error"] = {"S": error}
+        expression += ", #error = :error"
+    else:
+        # An error from an earlier attempt must not outlive a retry
+        expression += " REMOVE #error"
+    try:
+        dynamodb.update_item(
+            TableName=status_table_name,
+            Key={"upload_key": {"S": upload_key}},
+            UpdateExpression=expression,
+            # STATUS is a DynamoDB reserved word
+            ExpressionAttributeNames={"#status": "status", "#error": "error"},
+            ExpressionAttributeValues=values,
+        )
+    except Exception as e:
+        # The status is advisory; never fail the record over it
+        logger.warning(f"Could not set status {status} for {upload_key}: {e}")
+    # After the write: a browser subscribing concurrently either is found
+    # here or finds the final status when it subscribes.
+    if status in ("done", "failed"):
+        notify_subscribers(upload_key, status, processed_key, error)
+
+def record_processing_time(size_bytes, seconds):
+    if not stats_table_name:
+        return
+    try:
+        processing_stats.record(dynamodb, stats_table_name, processor_tier, size_bytes, seconds)
+    except Exception as e:
+        # The statistics only feed a polling hint; never fail the record over them
+        logger.warning(f"Could not record processing time: {e}")
+
+def notify_subscribers(upload_key, status, processed_key=None, error=None):
+    """Push the final status of ``upload_key`` to the browsers watching it."""
+    global connection_manager
+    if not connections_table_name or not websocket_endpoint:
+        return
+    try:
+        connection_ids = connections.subscribers(dynamodb, connections_table_name, upload_key)
+        if not connection_ids:
+            return
+        if connection_manager is None:
+            connection_manager = connections.ConnectionManager(
+                session.client("apigatewaymanagementapi", endpoint_url=websocket_endpoint))
+        url = None
+        if processed_key:
+            url = s3.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": processed_bucket, "Key": processed_key},
+                ExpiresIn=3600,
+            )
+        message = connections.status_message(upload_key, status, url, processed_key, error)
+        connections.notify(dynamodb, connections_table_name, connection_manager, upload_key, connection_ids, message)
+    except Exception as e:
+        # Subscribers fall back to polling; never fail the record over it
+        logger.warning(f"Could not notify subscribers of {upload_key}: {e}")
+
+def forward_to_large_tier(records):
+    global lambda_client
+    if lambda_client is None:
+        lambda_client = session.client("lambda")
+    lambda_client.invoke(
+        FunctionName=large_processor_function,
+        InvocationType="Event",
+        Payload=json.dumps({"Records": records}).encode(),
+    )
+    logger.info(f"Forwarded {len(records)} oversized record(s) to {large_processor_function}")
+
+def records_from_event(event):
+    # Backfill batches from the Distributed Map carry S3 Inventory rows
+    # ({"Bucket", "Key", "Size"}, all strings) instead of S3 event records.
+    # Size is an optional inventory field: without it the size is None
+    # (unknown) and is taken from the object when it is read.
+    if "Items" in event:
+        return [
+            {"s3": {
+                "bucket": {"name": item["Bucket"]},
+                "object": {"key": item["Key"], "size": int(item["Size"]) if item.get("Size") else None},
+            }}
+            for item in event["Items"]
+        ]
+    return event["Records"]
 
 def handler(event, context):
-    for record in event["Records"]:
+    records = records_from_event(event)
+    processed = failed = rejected = 0
+    if processor_tier == "small" and large_processor_function:
+        oversized = [r for r in records if (r["s3"]["object"].get("size") or 0) > large_image_threshold]
+        if oversized:
+            forward_to_large_tier(oversized)
+            records = [r for r in records if r not in oversized]
+
+    for record in records:
         src_bucket = record["s3"]["bucket"]["name"]
-        src_key = record["s3"]["object"]["key"]
+        # Keys arrive URL-encoded in both S3 events and inventory manifests
+        src_key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
         original_file_size = record["s3"]["object"]["size"]
         logger.info(f"Processing image: {src_key} from bucket: {src_bucket}")
 
+        if original_file_size == 0:
+            record_rejection(src_key, "empty")
+            set_status(src_key, "failed", error="The uploaded file is empty")
+            rejected += 1
+            continue
+
+        started = time.monotonic()
         try:
+            # Stream the original and sniff its first bytes before reading the rest
+            original = s3.get_object(Bucket=src_bucket, Key=src_key)
+            body = original["Body"]
+            if original_file_size is None:
+                original_file_size = original["ContentLength"]
+                if original_file_size == 0:
+                    body.close()
+                    record_rejection(src_key, "empty")
+                    set_status(src_key, "failed", error="The uploaded file is empty")
+                    rejected += 1
+                    continue
+            original_filename = original.get("Metadata", {}).get("original-filename")
+            # Anything that is not one of the accepted formats is rejected
+            # before the rest is read or Pillow (imported on first use by
+            # image_codecs) gets to look at it.
+            header = body.read(image_codecs.SNIFF_BYTES)
+            if image_codecs.sniff_format(header) is None:
+                body.close()
+                record_rejection(src_key, "not_an_image")
+                set_status(src_key, "failed", error="The uploaded file is not a supported image")
+                rejected += 1
+                continue
+            # Only now an image: updated_at marks the start, from which the
+            # status endpoint estimates the time left
+            set_status(src_key, "processing", size_bytes=original_file_size)
+
             # Download original image into memory
-            in_mem_file = io.BytesIO()
-            s3.download_fileobj(src_bucket, src_key, in_mem_file)
+            in_mem_file = io.BytesIO(header + body.read())
             logger.info(f"Successfully downloaded {src_key}")
-            in_mem_file.seek(0)
-
-            
 
             # Open and process image from memory
-            with Image.open(in_mem_file) as img:
+            with image_codecs.open_image(in_mem_file) as img:
                 original_width, original_height = img.size
-                # Dummy processing: resize and compress
-                img = img.resize((img.width // 2, img.height // 2))
+                original_size = original_file_size
+                # The browser may have downscaled the upload to the rendition
+                # size already (see pre_resize.py); it then only needs encoding
+                declared = pre_resize.accepted_original(original.get("Metadata", {}), img.size)
+                if declared is not None:
+                    original_width, original_height, original_size = declared
+                else:
+                    if pre_resize.DIMENSIONS_METADATA in original.get("Metadata", {}):
+                        logger.warning(f"{src_key} does not match its pre-resize declaration; processing it in full")
+                    # Dummy processing: resize and compress
+                    img = img.resize(pre_resize.rendition_size(img.width, img.height))
+                # Palette (GIF/PNG) and alpha images have no JPEG encoding
+                if img.mode not in ("RGB", "L"):
+                    img = img.convert("RGB")
                 processed_width, processed_height = img.size
                 
                 # Save processed image to an in-memory buffer
@@ -50,31 +296,45 @@ def handler(event, context):
 
             # Upload processed image from memory to target bucket
             dest_key = f"processed-{os.path.basename(src_key)}"
-            s3.upload_fileobj(out_mem_file, processed_bucket, dest_key)
+            extra_args = {"ContentType": "image/jpeg"}
+            if original_filename is not None:
+                extra_args["CacheControl"] = IMMUTABLE_CACHE_CONTROL
+            s3.upload_fileobj(out_mem_file, processed_bucket, dest_key, ExtraArgs=extra_args)
             logger.info(f"Successfully uploaded processed image {dest_key} to {processed_bucket}")
 
             # Store metadata in DynamoDB
             timestamp = datetime.datetime.now().isoformat()
-            metadata_table.put_item(
-                Item={
-                    "image_key": src_key,
-                    "original_bucket": src_bucket,
-                    "original_key": src_key,
-                    "processed_bucket": processed_bucket,
-                    "processed_key": dest_key,
-                    "timestamp": timestamp,
-                    "original_size_bytes": original_file_size,
-                    "processed_size_bytes": processed_file_size,
-                    "original_dimensions": f"{original_width}x{original_height}",
-                    "processed_dimensions": f"{processed_width}x{processed_height}",
-                }
-            )
+            item = {
+                "image_key": {"S": src_key},
+                "original_bucket": {"S": src_bucket},
+                "original_key": {"S": src_key},
+                "processed_bucket": {"S": processed_bucket},
+                "processed_key": {"S": dest_key},
+                "timestamp": {"S": timestamp},
+                "original_size_bytes": {"N": str(original_size)},
+                "processed_size_bytes": {"N": str(processed_file_size)},
+                "original_dimensions": {"S": f"{original_width}x{original_height}"},
+                "processed_dimensions": {"S": f"{processed_width}x{processed_height}"},
+            }
+            if declared is not None:
+                item["uploaded_size_bytes"] = {"N": str(original_file_size)}
+            if original_filename is not None:
+                item["original_filename"] = {"S": urllib.parse.unquote(original_filename)}
+            dynamodb.put_item(TableName=metadata_table_name, Item=item)
             logger.info(f"Successfully stored metadata for {src_key} in DynamoDB.")
+            set_status(src_key, "done", processed_key=dest_key)
+            record_processing_time(original_file_size, time.monotonic() - started)
+            processed += 1
 
         except Exception as e:
             logger.critical(f"Unhandled error processing record for {src_key}: {e}")
+            set_status(src_key, "failed", error="The image could not be processed")
+            failed += 1
 
     return {
         'statusCode': 200,
-        'body': 'Image processing complete'
+        'body': 'Image processing complete',
+        'processed': processed,
+        'failed': failed,
+        'rejected': rejected,
     }
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Precomputed botocore model cache.
+
+Creating a client makes botocore's ``Loader`` read, gunzip and ``json.loads``
+the service model, endpoint rule set, endpoint and partition data on every
+cold start. At build time this module records exactly what the loader returns
+while the clients we use are created (trimming the endpoint data to those
+services) and writes it as a single ``marshal`` blob next to itself::
+
+    python model_cache.py s3 dynamodb lambda
+
+At runtime ``create_session()`` returns a boto3 session whose loader serves
+those models from the blob. Anything not in the blob (paginators, waiters,
+other services) is still loaded from disk, and a blob written by a different
+botocore or Python version is ignored.
+"""
+import marshal
+import os
+import sys
+
+import boto3
+import botocore
+import botocore.session
+from botocore.loaders import Loader
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "botocore_models.marshal")
+
+
+def _cache_tag():
+    # marshal's format is only stable within one Python version
+    return f"botocore-{botocore.__version__}-{sys.implementation.cache_tag}"
+
+
+def _plain(value):
+    # The loader builds OrderedDicts, which marshal cannot store; plain dicts
+    # keep insertion order just the same.
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+class CachedLoader(Loader):
+    """Loader that answers from precomputed models before touching disk."""
+
+    def __init__(self, models, **kwargs):
+        super().__init__(**kwargs)
+        self._service_models = models["service_models"]
+        self._data = models["data"]
+
+    def load_service_model(self, service_name, type_name, api_version=None):
+        model = self._service_models.get((service_name, type_name, api_version))
+        if model is None:
+            return super().load_service_model(service_name, type_name, api_version)
+        return model
+
+    def load_data_with_path(self, name):
+        if name not in self._data:
+            return super().load_data_with_path(name)
+        data, relative_path = self._data[name]
+        # Paths are stored relative to the data directory so that
+        # is_builtin_path() still holds wherever the asset is unpacked.
+        return data, os.path.join(self.BUILTIN_DATA_PATH, relative_path)
+
+
+class _RecordingLoader(Loader):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.service_models = {}
+        self.data = {}
+
+    def load_service_model(self, service_name, type_name, api_version=None):
+        model = super().load_service_model(service_name, type_name, api_version)
+        self.service_models[(service_name, type_name, api_version)] = _plain(model)
+        return model
+
+    def load_data_with_path(self, name):
+        data, path = super().load_data_with_path(name)
+        # Service models are recorded by load_service_model, with extras applied
+        if os.sep not in name and self.is_builtin_path(path):
+            self.data[name] = (_plain(data), os.path.relpath(path, self.BUILTIN_DATA_PATH))
+        return data, path
+
+
+def build(services, cache_file=CACHE_FILE):
+    """Create a client for each of ``services`` and store what was loaded."""
+    loader = _RecordingLoader()
+    session = botocore.session.get_session()
+    session.register_component("data_loader", loader)
+    for service in services:
+        session.create_client(
+            service,
+            region_name="us-east-1",
+            aws_access_key_id="build",
+            aws_secret_access_key="build",
+        )
+
+    # endpoints.json lists every service in every partition; only the entries
+    # for the cached services are ever looked up through this cache.
+    endpoints = loader.data["endpoints"][0]
+    for partition in endpoints["partitions"]:
+        partition["services"] = {
+            name: service for name, service in partition["services"].items()
+            if name in services
+        }
+
+    with open(cache_file, "wb") as fp:
+        marshal.dump({
+            "tag": _cache_tag(),
+            "service_models": loader.service_models,
+            "data": loader.data,
+        }, fp)
+    return os.path.getsize(cache_file)
+
+
+def create_session(cache_file=CACHE_FILE):
+    """boto3 session backed by the precomputed models, when they match."""
+    botocore_session = botocore.session.get_session()
+    try:
+        # One read + loads(): marshal.load() on a file object reads in small chunks
+        with open(cache_file, "rb") as fp:
+            models = marshal.loads(fp.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        models = None
+    if models and models.get("tag") == _cache_tag():
+        botocore_session.register_component("data_loader", CachedLoader(models))
+    return boto3.Session(botocore_session=botocore_session)
+
+
+if __name__ == "__main__":
+    size = build(sys.argv[1:])
+    print(f"{CACHE_FILE}: {size / 1024:.0f} KiB for {', '.join(sys.argv[1:])}")
@@ -0,0 +1,72 @@
+"""Uploads the browser downscaled to the rendition size before sending them.
+
+The UI can decode a large photo, scale it to ``rendition_size`` of its
+own dimensions and upload that instead, with a ``preResized`` declaration
+of the original (``{"width", "height", "sizeBytes"}``) in the presign
+request. The presign API signs the declaration into the upload as object
+metadata (``metadata_headers``). The processor then only re-encodes
+uploads that ``accepted_original`` confirms are at the declared
+original's rendition size, and records the original's size and
+dimensions. Anything else is processed as an ordinary original.
+
+Shared by the processor and the presign function and Flask app.
+"""
+DIMENSIONS_METADATA = "original-dimensions"
+SIZE_METADATA = "original-size"
+# JPEG's limit; no real photo comes close
+MAX_DIMENSION = 65535
+
+
+def rendition_size(width, height):
+    """Dimensions of the processed rendition of a ``width`` x ``height`` image."""
+    return max(width // 2, 1), max(height // 2, 1)
+
+
+def declared_original(value, max_size_bytes):
+    """``(width, height, size_bytes)`` from a presign request's ``preResized``.
+
+    None when the request has none; ValueError when it is malformed.
+    """
+    if value is None:
+        return None
+    if not isinstance(value, dict):
+        raise ValueError("preResized must be an object")
+    numbers = [value.get(name) for name in ("width", "height", "sizeBytes")]
+    # bool is an int too
+    if not all(isinstance(n, int) and not isinstance(n, bool) and n > 0 for n in numbers):
+        raise ValueError("preResized needs positive integer width, height and sizeBytes")
+    width, height, size_bytes = numbers
+    if width > MAX_DIMENSION or height > MAX_DIMENSION or size_bytes > max_size_bytes:
+        raise ValueError("preResized describes an image larger than accepted")
+    return width, height, size_bytes
+
+
+def metadata_headers(original):
+    """Signed ``x-amz-meta-*`` headers carrying a declared original."""
+    width, height, size_bytes = original
+    return {
+        f"x-amz-meta-{DIMENSIONS_METADATA}": f"{width}x{height}",
+        f"x-amz-meta-{SIZE_METADATA}": str(size_bytes),
+    }
+
+
+def accepted_original(metadata, uploaded_dimensions):
+    """The declared ``(width, height, size_bytes)`` if the upload matches it.
+
+    ``metadata`` is the uploaded object's user metadata. None when there is
+    no declaration, it does not parse, or the uploaded image is not at the
+    declared original's rendition size: the upload is then processed like
+    any original.
+    """
+    dimensions = metadata.get(DIMENSIONS_METADATA)
+    size = metadata.get(SIZE_METADATA)
+    if dimensions is None or size is None:
+        return None
+    try:
+        width, height = (int(n) for n in dimensions.split("x"))
+        size_bytes = int(size)
+    except ValueError:
+        return None
+    if rendition_size(width, height) != tuple(uploaded_dimensions):
+        return None
+    return width, height, size_bytes
@@ -0,0 +1,85 @@
+"""Recent processing times, for the status endpoint's Retry-After hint.
+
+Each processor tier adds every image it processes to an hourly item in the
+stats table: the sample count and the sums of size (MiB), seconds,
+size * seconds and size^2. All of them are additive, so concurrent
+processors update an item with a single ``ADD`` and no read. The presign
+side sums the last ``WINDOW_HOURS`` of items and fits
+``seconds = base + per_mib * size`` by least squares, which gives an ETA
+for any upload from its size. Items expire after a day.
+
+Shared by the processor (``record``) and the presign function and Flask app
+(``period_keys``, ``fit``, ``retry_after``).
+"""
+import datetime
+
+MIB = 1024 * 1024
+STAT_FIELDS = ("samples", "sum_mib", "sum_seconds", "sum_mib_seconds", "sum_mib_squared")
+WINDOW_HOURS = 2
+STATS_TTL = datetime.timedelta(days=1)
+# Fewer samples than this and the defaults below are used instead
+MIN_SAMPLES = 5
+DEFAULT_MODEL = (0.5, 0.2)  # seconds, seconds per MiB
+# Upload to processor start: S3 event delivery plus a possible cold start
+QUEUE_SECONDS = 1.0
+# Bounds of the hint: never busy-loop, never leave a finished image unseen for long
+MIN_RETRY_AFTER = 0.25
+MAX_RETRY_AFTER = 15.0
+
+
+def period_key(tier, when):
+    return f"{tier}#{when.strftime('%Y%m%d%H')}"
+
+
+def period_keys(tier, now):
+    """Stats items covering the last WINDOW_HOURS, newest first."""
+    return [period_key(tier, now - datetime.timedelta(hours=hours)) for hours in range(WINDOW_HOURS)]
+
+
+def record(dynamodb, table_name, tier, size_bytes, seconds, now=None):
+    """Add one processed image to the current hour's item for ``tier``."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    mib = size_bytes / MIB
+    values = dict(zip(STAT_FIELDS, (1, mib, seconds, mib * seconds, mib * mib)))
+    dynamodb.update_item(
+        TableName=table_name,
+        Key={"period": {"S": period_key(tier, now)}},
+        UpdateExpression="ADD " + ", ".join(f"{name} :{name}" for name in STAT_FIELDS)
+        + " SET expires_at = :expires_at",
+        ExpressionAttributeValues={
+            **{f":{name}": {"N": f"{value:.6f}"} for name, value in values.items()},
+            ":expires_at": {"N": str(int((now + STATS_TTL).timestamp()))},
+        },
+    )
+
+
+def fit(items):
+    """``(base_seconds, seconds_per_mib)`` from stats items (plain numbers).
+
+    Falls back to DEFAULT_MODEL with too few samples. A negative slope (noise
+    with similar sizes) becomes a flat mean.
+    """
+    n, sx, sy, sxy, sxx = (sum(float(item.get(name, 0)) for item in items) for name in STAT_FIELDS)
+    if n < MIN_SAMPLES:
+        return DEFAULT_MODEL
+    mean_x, mean_y = sx / n, sy / n
+    variance = sxx / n - mean_x * mean_x
+    if variance <= 1e-9:
+        return (mean_y, 0.0)
+    slope = (sxy / n - mean_x * mean_y) / variance
+    if slope <= 0:
+        return (mean_y, 0.0)
+    return (max(mean_y - slope * mean_x, 0.0), slope)
+
+
+def retry_after(model, status, size_bytes, elapsed_seconds):
+    """Seconds until the upload is expected to be done, within the hint bounds.
+
+    ``elapsed_seconds`` counts from the status' last update: the presign
+    write for ``pending``, the processor start for ``processing``.
+    """
+    base, per_mib = model
+    remaining = base + per_mib * size_bytes / MIB - elapsed_seconds
+    if status == "pending":
+        remaining += QUEUE_SECONDS
+    return min(max(remaining, MIN_RETRY_AFTER), MAX_RETRY_AFTER)
@@ -0,0 +1,133 @@
+"""Build step: trim the Lambda asset down to what the processor loads.
+
+Run by the Dockerfile after dependencies and handler code are in place::
+
+    python prune_asset.py /asset lambda_function s3 dynamodb sts lambda
+
+- removes botocore service models other than the listed services (the
+  top-level endpoint/partition/retry data is kept),
+- removes boto3 resource models and examples, botocore examples, and the
+  documentation strings inside the kept service models (the docs *modules*
+  stay: boto3 and botocore import them at runtime),
+- precompiles bytecode with hash-based invalidation, since the asset zip
+  does not preserve the mtimes timestamp-based .pyc files rely on,
+
+and reports the asset size and the handler's import (init) time before and
+after.
+"""
+import compileall
+import gzip
+import json
+import os
+import py_compile
+import shutil
+import statistics
+import subprocess
+import sys
+
+# Enough configuration for the handler module to import; no AWS calls are made.
+INIT_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "build",
+    "AWS_SECRET_ACCESS_KEY": "build",
+    "PROCESSED_BUCKET": "build",
+    "METADATA_TABLE": "build",
+}
+INIT_RUNS = 5
+
+
+def asset_size(asset_dir):
+    total = 0
+    for root, _, files in os.walk(asset_dir):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def init_time_ms(asset_dir, module):
+    """Median wall-clock time of importing ``module`` in a fresh interpreter."""
+    snippet = (
+        "import time; start = time.perf_counter(); import {}; "
+        "print((time.perf_counter() - start) * 1000)".format(module)
+    )
+    env = {**os.environ, **INIT_ENV}
+    timings = []
+    for _ in range(INIT_RUNS):
+        # -B: never write .pyc files, the read-only Lambda filesystem can't either
+        result = subprocess.run(
+            [sys.executable, "-B", "-c", snippet],
+            cwd=asset_dir, env=env, capture_output=True, text=True, check=True,
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def remove_bytecode(asset_dir):
+    for root, dirs, _ in os.walk(asset_dir):
+        if "__pycache__" in dirs:
+            shutil.rmtree(os.path.join(root, "__pycache__"))
+            dirs.remove("__pycache__")
+
+
+def strip_documentation(model):
+    model.pop("documentation", None)
+    for operation in model.get("operations", {}).values():
+        operation.pop("documentation", None)
+        operation.pop("documentationUrl", None)
+    for shape in model.get("shapes", {}).values():
+        shape.pop("documentation", None)
+        members = list(shape.get("members", {}).values())
+        members += [shape[name] for name in ("member", "key", "value") if name in shape]
+        for member in members:
+            member.pop("documentation", None)
+    return model
+
+
+def prune_service_models(data_dir, services):
+    if not os.path.isdir(data_dir):
+        # botocore is not in the asset (the runtime's copy is used): nothing to prune
+        print(f"no botocore models in {data_dir}, skipping")
+        return
+    for name in os.listdir(data_dir):
+        path = os.path.join(data_dir, name)
+        if os.path.isdir(path) and name not in services:
+            shutil.rmtree(path)
+
+    for root, _, files in os.walk(data_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.startswith("examples-1."):
+                os.remove(path)
+            elif name == "service-2.json.gz":
+                # Stored uncompressed: botocore prefers .json, and skipping the
+                # gunzip is part of what makes the smaller model faster to load.
+                with gzip.open(path, "rb") as fp:
+                    model = json.loads(fp.read().decode("utf-8"))
+                with open(path[:-len(".gz")], "w", encoding="utf-8") as fp:
+                    json.dump(strip_documentation(model), fp, separators=(",", ":"))
+                os.remove(path)
+
+
+def main():
+    asset_dir, module, *services = sys.argv[1:]
+
+    remove_bytecode(asset_dir)
+    size_before = asset_size(asset_dir)
+    init_before = init_time_ms(asset_dir, module)
+
+    prune_service_models(os.path.join(asset_dir, "botocore", "data"), set(services))
+    for path in ("boto3/data", "boto3/examples", "bin"):
+        shutil.rmtree(os.path.join(asset_dir, path), ignore_errors=True)
+    compileall.compile_dir(
+        asset_dir, quiet=1, workers=0,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH,
+    )
+
+    size_after = asset_size(asset_dir)
+    init_after = init_time_ms(asset_dir, module)
+
+    print(f"asset size: {size_before / 2**20:.1f} MiB -> {size_after / 2**20:.1f} MiB")
+    print(f"init ({module} import, median of {INIT_RUNS}): {init_before:.0f} ms -> {init_after:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Cache-Control policies and response compression of the upload APIs.
+
+Both the presign function and the Flask app label their responses with
+the policies below:
+
+- ``NO_STORE`` for signed upload URLs, in-progress statuses and errors.
+  None of these may be reused.
+- ``REVALIDATE`` for responses with an ETag (``/images/{key}``, the HTML
+  page). They are reused only after a 304.
+- ``FINISHED`` for the result of a done upload. The processed key never
+  changes, and its signed URL outlives the max-age by far.
+- ``IMMUTABLE`` for static assets whose URL carries a content hash.
+
+The presign function leaves compression to API Gateway
+(``min_compression_size`` on the REST API, gzip and deflate only). The
+Flask app compresses JSON, HTML, JavaScript and CSS itself with
+``preferred_encoding`` and ``compress``: brotli when the optional
+``brotli`` package is installed, else gzip.
+"""
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+NO_STORE = "no-store"
+REVALIDATE = "no-cache"
+FINISHED = "private, max-age=60"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Smaller bodies fit in one packet anyway (same as the REST API's setting)
+MIN_COMPRESSION_BYTES = 1024
+COMPRESSIBLE_TYPES = ("application/json", "text/html", "text/javascript", "application/javascript", "text/css")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encodings():
+    """Content codings this process can produce, in order of preference."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def preferred_encoding(accept_encoding, available=None):
+    """The coding to answer an ``Accept-Encoding`` header with, or None.
+
+    Honours q-values, with ``q=0`` refusing a coding. ``*`` stands for any
+    coding not listed. Among acceptable codings with equal weight, the
+    order of ``available`` decides.
+    """
+    available = encodings() if available is None else available
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding:
+            weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in available:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+def compressible(content_type):
+    """Whether bodies of this type are worth compressing (text, not images)."""
+    if not content_type:
+        return False
+    return content_type.split(";")[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0: the same body always compresses to the same bytes
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported content coding: {encoding}")
+
+
+def weak_etag(tag):
+    """The ETag of a compressed variant.
+
+    Only weakly equal to the uncompressed one, which ``If-None-Match``
+    comparisons accept.
+    """
+    return tag if tag.startswith("W/") else "W/" + tag
@@ -0,0 +1,89 @@
+"""The ``GET /images/{key}`` representation of an upload, and its ETag.
+
+One response carries what a gallery needs about an image: its processing
+status, the original's size and dimensions, and every rendition with its
+key, size, dimensions and a signed download URL. It is built from the
+upload's status item and its latest metadata item, as plain values (what
+boto3's ``TypeDeserializer`` or the Table resource return). Shared by the
+presign function and the Flask app.
+
+The ETag depends on the status item only, so a request whose
+``If-None-Match`` still matches is answered 304 after one status read,
+without the metadata query or any signing. Done uploads carry signed URLs,
+so their tag also changes every ``url_ttl`` seconds of wall-clock time (the
+same on every instance): a client never holds on to a URL older than twice
+that.
+
+The tag is weak: two instances, or one before and after its URL cache was
+emptied, sign different URLs into bodies that share a tag. They are
+equivalent for the client but not byte for byte the same, which a strong
+tag would promise.
+"""
+import hashlib
+
+
+def etag(key, status_item, now, url_ttl):
+    """Weak ETag for the representation of ``key`` at ``now`` (epoch seconds)."""
+    status = status_item["status"]
+    version = f"{key}|{status}|{status_item.get('updated_at', '')}"
+    if status == "done":
+        version += f"|{int(now // url_ttl)}"
+    return 'W/"' + hashlib.sha256(version.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def not_modified(if_none_match, tag):
+    """Whether an ``If-None-Match`` header value matches ``tag``.
+
+    Uses the weak comparison RFC 9110 prescribes for If-None-Match: the
+    ``W/`` prefixes on either side are ignored.
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    opaque_tag = tag.removeprefix("W/")
+    return "*" in candidates or any(candidate.removeprefix("W/") == opaque_tag for candidate in candidates)
+
+
+def dimensions(text):
+    """``{"width", "height"}`` from the metadata's ``"<width>x<height>"``."""
+    width, height = text.split("x")
+    return {"width": int(width), "height": int(height)}
+
+
+def representation(key, status_item, metadata_item, sign):
+    """The response body; ``sign(rendition_key)`` returns a download URL.
+
+    ``metadata_item`` is None until the upload is done. Sizes and
+    dimensions of a rendition come from the metadata's
+    ``<rendition>_size_bytes`` and ``<rendition>_dimensions``.
+    """
+    status = status_item["status"]
+    body = {"key": key, "status": status, "updatedAt": status_item.get("updated_at")}
+    if status == "failed":
+        body["error"] = status_item.get("error", "Processing failed")
+
+    original = {}
+    if metadata_item:
+        if "original_filename" in metadata_item:
+            body["originalFilename"] = metadata_item["original_filename"]
+        original["sizeBytes"] = int(metadata_item["original_size_bytes"])
+        original.update(dimensions(metadata_item["original_dimensions"]))
+        if "uploaded_size_bytes" in metadata_item:
+            # Downscaled by the browser before upload (see lambda/pre_resize.py)
+            original["uploadedSizeBytes"] = int(metadata_item["uploaded_size_bytes"])
+    elif "size_bytes" in status_item:
+        # Declared at presign time; the metadata has the stored size
+        original["sizeBytes"] = int(status_item["size_bytes"])
+    body["original"] = original
+
+    renditions = {}
+    if status == "done":
+        for name, rendition_key in (status_item.get("renditions") or {}).items():
+            rendition = {"key": rendition_key, "url": sign(rendition_key)}
+            if metadata_item and f"{name}_size_bytes" in metadata_item:
+                rendition["sizeBytes"] = int(metadata_item[f"{name}_size_bytes"])
+            if metadata_item and f"{name}_dimensions" in metadata_item:
+                rendition.update(dimensions(metadata_item[f"{name}_dimensions"]))
+            renditions[name] = rendition
+    body["renditions"] = renditions
+    return body
@@ -1,30 +1,148 @@
+import base64
 import boto3
+import datetime
+import hmac
 import os
 import json
+import math
+import re
+import secrets
+import time
+import uuid
+from urllib.parse import quote
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from boto3.dynamodb.types import TypeDeserializer
 import logging
 
+import http_caching
+import image_resource
+from sigv4_presign import SigV4Presigner
+from url_cache import SignedUrlCache
+
+# Added to the asset by the Docker build (lambda/connections.py,
+# lambda/pre_resize.py and lambda/processing_stats.py)
+import connections
+import pre_resize
+import processing_stats
+
+try:
+    # Added to the asset by the Docker build (lambda/model_cache.py)
+    from model_cache import create_session
+except ImportError:
+    create_session = boto3.Session
+
 logger = logging.getLogger()
 logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
 UPLOAD_BUCKET = os.environ.get("UPLOAD_BUCKET")
 PROCESSED_BUCKET = os.environ.get("PROCESSED_BUCKET")
+STATUS_TABLE = os.environ.get("STATUS_TABLE")
+# Sizes and dimensions for GET /images/{key}
+METADATA_TABLE = os.environ.get("METADATA_TABLE")
+# WebSocket subscriptions to completion notifications, see connections.py
+CONNECTIONS_TABLE = os.environ.get("CONNECTIONS_TABLE")
+# Recent processing times per tier, for the Retry-After hint on 202s
+STATS_TABLE = os.environ.get("STATS_TABLE")
 REGION = os.environ.get("AWS_REGION")
+LARGE_IMAGE_THRESHOLD_BYTES = int(os.environ.get("LARGE_IMAGE_THRESHOLD_BYTES", 5 * 1024 * 1024))
+# Declared sizes above this are refused. SigV4 signs Content-Length into
+# every PUT URL, so S3 rejects bodies that differ from the declared size.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+# Extensions the bucket notifications route to a processor (the stack's
+# suffix filters, lower-cased). Keys with any other extension, or none,
+# would never be processed, so such files are refused with 415.
+IMAGE_SUFFIXES = tuple(os.environ.get("IMAGE_SUFFIXES", ".jpg,.jpeg,.png,.webp,.gif").split(","))
+# Multipart uploads: fixed part size (S3's minimum is 5 MiB for all but the
+# last part) and the most part URLs one /multipart-upload/parts call signs.
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+MAX_PART_URLS = 100
+# Matches the processor's STATUS_TTL; uploads that never arrive expire too
+STATUS_TTL = datetime.timedelta(days=7)
+# Most files one /generate-upload-urls request may sign; larger selections
+# are split into several requests by the client.
+MAX_BATCH_UPLOADS = 50
+# BatchWriteItem accepts at most 25 items per call
+WRITE_BATCH_SIZE = 25
+# Pending items are only written for new keys and failed uploads, see put_pending()
+PENDING_CONDITION = {
+    'ConditionExpression': 'attribute_not_exists(upload_key) OR #status = :failed',
+    # STATUS is a DynamoDB reserved word
+    'ExpressionAttributeNames': {'#status': 'status'},
+    'ExpressionAttributeValues': {':failed': {'S': 'failed'}},
+}
+# Most keys one /get-processed-image-urls request may ask about: what a
+# single BatchGetItem reads
+MAX_STATUS_KEYS = 100
+# Subscriptions outlive any upload a browser is still waiting for
+SUBSCRIPTION_TTL = datetime.timedelta(hours=2)
+# Client-computed content hashes: hex SHA-256 of the whole file
+SHA256_HEX = re.compile(r'[0-9a-fA-F]{64}')
+# Presigned URLs are valid for an hour; identical requests within five
+# minutes get the same URL, so every URL handed out has 55+ minutes left.
+URL_EXPIRES_IN = 3600
+URL_CACHE_TTL = 300
+# Hit/miss counters are published as metrics at most this often
+URL_CACHE_METRICS_INTERVAL = 60
+# Long-poll of /get-processed-image-url?wait=N: the request is held for at
+# most LONG_POLL_MAX_SECONDS (set by the stack below the API Gateway timeout),
+# re-reading the status with a delay that doubles from 100 ms up to 500 ms.
+LONG_POLL_MAX_SECONDS = int(os.environ.get("LONG_POLL_MAX_SECONDS", 20))
+LONG_POLL_FIRST_DELAY = 0.1
+LONG_POLL_MAX_DELAY = 0.5
+# Time kept back from the function timeout to build the response
+LONG_POLL_MARGIN_SECONDS = 1
+# Processing-time models fitted from the stats table are reused this long
+STATS_MODEL_TTL = 60
 
-s3_client = boto3.client('s3', region_name=REGION)
+session = create_session()
+# SigV4 so Content-Length and Content-Type are signed headers S3 enforces
+s3_client = session.client('s3', region_name=REGION, config=Config(signature_version='s3v4'))
+# Signs URLs directly with a cached signing key and bucket endpoint; the same
+# bytes generate_presigned_url would produce, at a fraction of the cost.
+presigner = SigV4Presigner(s3_client, session.get_credentials())
+dynamodb_client = session.client('dynamodb', region_name=REGION)
+url_cache = SignedUrlCache(expires_in=URL_EXPIRES_IN, ttl=URL_CACHE_TTL)
+_published_stats = {'hits': 0, 'misses': 0, 'at': time.monotonic()}
+# apigatewaymanagementapi clients per WebSocket stage endpoint
+connection_managers = {}
+# tier -> (processing-time model, time.monotonic() it was fitted at)
+processing_models = {}
+deserializer = TypeDeserializer()
 
 def handler(event, context):
     # Ensure environment variables are set
-    if not UPLOAD_BUCKET or not PROCESSED_BUCKET:
-        logger.error("UPLOAD_BUCKET or PROCESSED_BUCKET environment variable not set.")
+    if not UPLOAD_BUCKET or not PROCESSED_BUCKET or not STATUS_TABLE:
+        logger.error("UPLOAD_BUCKET, PROCESSED_BUCKET or STATUS_TABLE environment variable not set.")
         return create_response(500, {'error': 'Server configuration error'})
 
+    publish_url_cache_metrics()
+
+    # WebSocket API messages carry a route key instead of a path
+    route_key = event.get('requestContext', {}).get('routeKey')
+    if route_key == 'subscribe':
+        return handle_subscribe(event)
+
     # Route the request based on the path
     request_path = event.get('path', '')
     if request_path == '/generate-upload-url':
         return handle_generate_upload_url(event)
+    elif request_path == '/generate-upload-urls':
+        return handle_generate_upload_urls(event)
     elif request_path == '/get-processed-image-url':
-        return handle_get_processed_image_url(event)
+        return handle_get_processed_image_url(event, context)
+    elif request_path == '/get-processed-image-urls':
+        return handle_get_processed_image_urls(event, context)
+    elif request_path.startswith('/images/'):
+        return handle_get_image(event)
+    elif request_path == '/multipart-upload/create':
+        return handle_create_multipart_upload(event)
+    elif request_path == '/multipart-upload/parts':
+        return handle_presign_upload_parts(event)
+    elif request_path == '/multipart-upload/complete':
+        return handle_complete_multipart_upload(event)
+    elif request_path == '/multipart-upload/abort':
+        return handle_abort_multipart_upload(event)
     else:
         return create_response(404, {'error': 'Not Found'})
 
@@ -33,60 +151,799 @@ def handle_generate_upload_url(event):
         body = json.loads(event.get('body', '{}'))
         filename = body.get('filename')
         content_type = body.get('contentType')
+        content_length = body.get('contentLength')
+        sha256 = body.get('sha256')
 
         if not filename or not content_type:
             return create_response(400, {'error': 'Missing filename or contentType'})
+        if not valid_sha256(sha256):
+            return create_response(400, {'error': 'sha256 must be 64 hex digits'})
+        if not valid_content_length(content_length):
+            return create_response(400, {'error': 'contentLength must be a positive whole number of bytes'})
+        if too_large(content_length):
+            return create_response(413, {'error': f'Files are limited to {MAX_UPLOAD_BYTES} bytes'})
+        if image_extension(filename) is None:
+            return create_response(415, {'error': f'Only {", ".join(IMAGE_SUFFIXES)} files are accepted'})
+        try:
+            original = pre_resize.declared_original(body.get('preResized'), MAX_UPLOAD_BYTES)
+        except ValueError as e:
+            return create_response(400, {'error': str(e)})
 
-        presigned_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': UPLOAD_BUCKET,
-                'Key': filename,
-                'ContentType': content_type
-            },
-            ExpiresIn=3600
-        )
-        return create_response(200, {'url': presigned_url})
+        upload = presign_upload(filename, content_type, content_length, sha256, original)
+        upload['subscribeToken'] = put_pending(upload['key'], content_length)
+        return create_response(200, upload)
 
-    except (json.JSONDecodeError, TypeError):
+    except (json.JSONDecodeError, TypeError, ValueError):
         return create_response(400, {'error': 'Invalid JSON in request body'})
     except ClientError as e:
         logger.error(f"Error generating upload URL: {e}")
         return create_response(500, {'error': 'Could not generate upload URL'})
 
-def handle_get_processed_image_url(event):
+def handle_generate_upload_urls(event):
+    """Presigned PUT URLs for up to MAX_BATCH_UPLOADS files in one round trip.
+
+    The body is ``{"files": [{"filename", "contentType", "contentLength", "sha256"?,
+    "preResized"?}, ...]}``; the response lists ``{"filename", "url", "key", "headers"}``
+    in the same order, each with the ``subscribeToken`` its key's WebSocket
+    subscriptions must present.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        files = body.get('files') if isinstance(body, dict) else None
+        if not isinstance(files, list) or not files:
+            return create_response(400, {'error': 'Missing files'})
+        if len(files) > MAX_BATCH_UPLOADS:
+            return create_response(400, {'error': f'At most {MAX_BATCH_UPLOADS} files per request'})
+        if not all(isinstance(f, dict) and f.get('filename') and f.get('contentType') for f in files):
+            return create_response(400, {'error': 'Missing filename or contentType'})
+        if not all(valid_sha256(f.get('sha256')) for f in files):
+            return create_response(400, {'error': 'sha256 must be 64 hex digits'})
+        if not all(valid_content_length(f.get('contentLength')) for f in files):
+            return create_response(400, {'error': 'contentLength must be a positive whole number of bytes'})
+        if any(too_large(f['contentLength']) for f in files):
+            return create_response(413, {'error': f'Files are limited to {MAX_UPLOAD_BYTES} bytes'})
+        if any(image_extension(f['filename']) is None for f in files):
+            return create_response(415, {'error': f'Only {", ".join(IMAGE_SUFFIXES)} files are accepted'})
+        try:
+            originals = [pre_resize.declared_original(f.get('preResized'), MAX_UPLOAD_BYTES) for f in files]
+        except ValueError as e:
+            return create_response(400, {'error': str(e)})
+
+        uploads = [
+            {
+                'filename': f['filename'],
+                **presign_upload(f['filename'], f['contentType'], f['contentLength'], f.get('sha256'), original),
+            }
+            for f, original in zip(files, originals)
+        ]
+        tokens = put_pending_statuses({upload['key']: f['contentLength'] for upload, f in zip(uploads, files)})
+        for upload in uploads:
+            upload['subscribeToken'] = tokens[upload['key']]
+        return create_response(200, {'uploads': uploads})
+
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        logger.error(f"Error generating upload URLs: {e}")
+        return create_response(500, {'error': 'Could not generate upload URLs'})
+
+def presign_upload(filename, content_type, content_length, sha256=None, original=None):
+    """Presigned PUT for a new upload key, plus the headers the PUT must send.
+
+    The original filename travels as object metadata. With ``sha256`` the
+    key is the content hash and S3 verifies the body against it. With
+    ``original`` (a downscaled upload, see pre_resize.py) the original's
+    dimensions and size do too.
+    """
+    key = upload_key_for(filename, content_length, sha256)
+    headers = {
+        'Content-Type': content_type,
+        'x-amz-meta-original-filename': quote(filename),
+    }
+    if original is not None:
+        headers.update(pre_resize.metadata_headers(original))
+    if sha256:
+        headers['x-amz-checksum-sha256'] = base64.b64encode(bytes.fromhex(sha256)).decode()
+    # Browsers set Content-Length themselves; it is signed but not returned.
+    # S3 rejects a body of any other size.
+    signed_headers = {**headers, 'Content-Length': content_length}
+    presigned_url = url_cache.get(
+        'PUT', UPLOAD_BUCKET, key,
+        lambda: presigner.presign('PUT', UPLOAD_BUCKET, key, URL_EXPIRES_IN, headers=signed_headers),
+        headers=signed_headers,
+    )
+    return {'url': presigned_url, 'key': key, 'headers': headers}
+
+def valid_sha256(sha256):
+    return sha256 is None or (isinstance(sha256, str) and SHA256_HEX.fullmatch(sha256) is not None)
+
+def valid_content_length(content_length):
+    # Signed into every upload URL, which is what caps the upload: a
+    # positive whole number (bool is an int too), never optional
+    return isinstance(content_length, int) and not isinstance(content_length, bool) and content_length > 0
+
+def too_large(content_length):
+    return content_length > MAX_UPLOAD_BYTES
+
+def handle_create_multipart_upload(event):
+    """Start a multipart upload; the client then signs and PUTs its parts.
+
+    Body ``{"filename", "contentType", "contentLength"}``; the response has
+    the upload ``key`` and ``uploadId`` plus the ``partSize`` and
+    ``partCount`` the client must split the file into.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        filename = body.get('filename')
+        content_type = body.get('contentType')
+        content_length = body.get('contentLength')
+
+        if not filename or not content_type or content_length is None:
+            return create_response(400, {'error': 'Missing filename, contentType or contentLength'})
+        if not valid_content_length(content_length):
+            return create_response(400, {'error': 'contentLength must be a positive whole number of bytes'})
+        if too_large(content_length):
+            return create_response(413, {'error': f'Files are limited to {MAX_UPLOAD_BYTES} bytes'})
+        if image_extension(filename) is None:
+            return create_response(415, {'error': f'Only {", ".join(IMAGE_SUFFIXES)} files are accepted'})
+
+        key = upload_key_for(filename, content_length)
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=UPLOAD_BUCKET, Key=key, ContentType=content_type,
+            Metadata={'original-filename': quote(filename)},
+        )['UploadId']
+        # The declared size binds the parts and the completed object, see
+        # handle_presign_upload_parts() and handle_complete_multipart_upload()
+        subscribe_token = secrets.token_urlsafe(16)
+        put_status(key, 'pending', size_bytes=content_length, upload_id=upload_id, subscribe_token=subscribe_token)
+        return create_response(200, {
+            'key': key,
+            'uploadId': upload_id,
+            'subscribeToken': subscribe_token,
+            'partSize': MULTIPART_PART_SIZE,
+            'partCount': math.ceil(content_length / MULTIPART_PART_SIZE),
+        })
+
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        logger.error(f"Error creating multipart upload: {e}")
+        return create_response(500, {'error': 'Could not create multipart upload'})
+
+def handle_presign_upload_parts(event):
+    """Presigned UploadPart URLs for up to MAX_PART_URLS parts.
+
+    Body ``{"key", "uploadId", "partNumbers": [...]}``. Each URL signs the
+    exact length of its part, computed from the size declared (and checked)
+    at create and stored with the uploadId, so the parts can only add up to
+    that size.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        key = body.get('key')
+        upload_id = body.get('uploadId')
+        part_numbers = body.get('partNumbers')
+
+        if not key or not upload_id or not isinstance(part_numbers, list) or not part_numbers:
+            return create_response(400, {'error': 'Missing key, uploadId or partNumbers'})
+        if len(part_numbers) > MAX_PART_URLS:
+            return create_response(400, {'error': f'At most {MAX_PART_URLS} parts per request'})
+        content_length = declared_multipart_size(key, upload_id)
+        if content_length is None:
+            return create_response(404, {'error': 'Unknown multipart upload'})
+        part_count = math.ceil(content_length / MULTIPART_PART_SIZE)
+        # bool is an int too
+        if not all(isinstance(n, int) and not isinstance(n, bool) and 1 <= n <= part_count for n in part_numbers):
+            return create_response(400, {'error': f'partNumbers must be between 1 and {part_count}'})
+
+        parts = []
+        for part_number in part_numbers:
+            part_size = min(MULTIPART_PART_SIZE, content_length - (part_number - 1) * MULTIPART_PART_SIZE)
+            url = presigner.presign(
+                'PUT', UPLOAD_BUCKET, key, URL_EXPIRES_IN,
+                query=[('uploadId', upload_id), ('partNumber', part_number)],
+                headers={'Content-Length': part_size},
+            )
+            parts.append({'partNumber': part_number, 'url': url})
+        return create_response(200, {'parts': parts})
+
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        logger.error(f"Error generating part URLs: {e}")
+        return create_response(500, {'error': 'Could not generate part URLs'})
+
+def handle_complete_multipart_upload(event):
+    """Assemble the uploaded parts; body ``{"key", "uploadId", "parts": [{"partNumber", "etag"}]}``.
+
+    Every part must be listed, and the parts S3 holds must add up to the
+    size declared at create; otherwise 400 and nothing is assembled.
+    """
+    try:
+        body = json.loads(event.get('body', '{}'))
+        key = body.get('key')
+        upload_id = body.get('uploadId')
+        parts = body.get('parts')
+
+        if not key or not upload_id or not isinstance(parts, list) or not parts:
+            return create_response(400, {'error': 'Missing key, uploadId or parts'})
+        parts = sorted(
+            ({'PartNumber': int(part['partNumber']), 'ETag': part['etag']} for part in parts),
+            key=lambda part: part['PartNumber'],
+        )
+        content_length = declared_multipart_size(key, upload_id)
+        if content_length is None:
+            return create_response(404, {'error': 'Unknown multipart upload'})
+        part_count = math.ceil(content_length / MULTIPART_PART_SIZE)
+        if [part['PartNumber'] for part in parts] != list(range(1, part_count + 1)):
+            return create_response(400, {'error': f'All {part_count} parts must be listed'})
+        uploaded = uploaded_part_sizes(key, upload_id)
+        if sum(uploaded.get(part['PartNumber'], 0) for part in parts) != content_length:
+            return create_response(400, {'error': f'The parts do not add up to the declared {content_length} bytes'})
+
+        s3_client.complete_multipart_upload(
+            Bucket=UPLOAD_BUCKET,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={'Parts': parts},
+        )
+        return create_response(200, {'key': key})
+
+    except (json.JSONDecodeError, TypeError, ValueError, KeyError):
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('InvalidPart', 'InvalidPartOrder', 'EntityTooSmall', 'NoSuchUpload'):
+            return create_response(400, {'error': e.response['Error']['Message']})
+        logger.error(f"Error completing multipart upload: {e}")
+        return create_response(500, {'error': 'Could not complete multipart upload'})
+
+def declared_multipart_size(key, upload_id):
+    """The size declared when ``upload_id`` was created for ``key``, or None."""
+    item = dynamodb_client.get_item(
+        TableName=STATUS_TABLE,
+        Key={'upload_key': {'S': key}},
+        ConsistentRead=True,
+    ).get('Item')
+    if item is None or item.get('upload_id', {}).get('S') != upload_id or 'size_bytes' not in item:
+        return None
+    return int(item['size_bytes']['N'])
+
+def uploaded_part_sizes(key, upload_id):
+    """Part number -> size of the parts S3 holds for ``upload_id``."""
+    sizes = {}
+    paginator = s3_client.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=UPLOAD_BUCKET, Key=key, UploadId=upload_id):
+        sizes.update((part['PartNumber'], part['Size']) for part in page.get('Parts', []))
+    return sizes
+
+def handle_abort_multipart_upload(event):
+    """Discard an unfinished upload and its parts; body ``{"key", "uploadId"}``."""
+    try:
+        body = json.loads(event.get('body', '{}'))
+        key = body.get('key')
+        upload_id = body.get('uploadId')
+
+        if not key or not upload_id:
+            return create_response(400, {'error': 'Missing key or uploadId'})
+
+        s3_client.abort_multipart_upload(Bucket=UPLOAD_BUCKET, Key=key, UploadId=upload_id)
+        put_status(key, 'failed', error='The upload was aborted')
+        return create_response(200, {'key': key})
+
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        logger.error(f"Error aborting multipart upload: {e}")
+        return create_response(500, {'error': 'Could not abort multipart upload'})
+
+def upload_key_for(filename, content_length, sha256=None):
+    """A key no other upload can overwrite: ``<tier>/<id><.ext>``.
+
+    The id is the file's SHA-256 when the client sent one (identical files
+    share a key and identical bytes), otherwise a random UUID. Only the
+    lower-cased extension of ``filename`` is kept, for the bucket
+    notifications' suffix filters; callers refuse files without one of
+    IMAGE_SUFFIXES first.
+    """
+    stem = sha256.lower() if sha256 else uuid.uuid4().hex
+    extension = image_extension(filename)
+    # The prefix selects the processor tier through the bucket notifications
+    if content_length > LARGE_IMAGE_THRESHOLD_BYTES:
+        return f"large/{stem}{extension}"
+    return f"small/{stem}{extension}"
+
+def image_extension(filename):
+    """The lower-cased extension of ``filename`` if it is in IMAGE_SUFFIXES, else None."""
+    if not isinstance(filename, str):
+        return None
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if extension in IMAGE_SUFFIXES else None
+
+def status_item(key, status, error=None, size_bytes=None, upload_id=None, subscribe_token=None):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    item = {
+        'upload_key': {'S': key},
+        'status': {'S': status},
+        'updated_at': {'S': now.isoformat()},
+        'expires_at': {'N': str(int((now + STATUS_TTL).timestamp()))},
+    }
+    if error:
+        item['error'] = {'S': error}
+    # The declared size, from which the status endpoint estimates an ETA
+    if size_bytes is not None:
+        item['size_bytes'] = {'N': str(int(size_bytes))}
+    # Multipart uploads: the upload the declared size belongs to
+    if upload_id is not None:
+        item['upload_id'] = {'S': upload_id}
+    # Issued with the upload URL; WebSocket subscriptions to the key must
+    # present it (see handle_subscribe)
+    if subscribe_token is not None:
+        item['subscribe_token'] = {'S': subscribe_token}
+    return item
+
+def put_status(key, status, error=None, size_bytes=None, upload_id=None, subscribe_token=None):
+    dynamodb_client.put_item(
+        TableName=STATUS_TABLE, Item=status_item(key, status, error, size_bytes, upload_id, subscribe_token))
+
+def put_pending(key, size_bytes):
+    """Record a new upload as pending, unless its key is already in use.
+
+    Content-addressed keys come back when identical bytes are presigned
+    again. Their done (or pending, processing) item must not be reset to
+    pending, which would hide the finished renditions until the bytes
+    are PUT again; only a failed upload starts over.
+
+    Returns the key's subscribe token: a new one, or the one stored with
+    the item already there (None for items written before tokens were).
+    """
+    token = secrets.token_urlsafe(16)
+    try:
+        dynamodb_client.put_item(
+            TableName=STATUS_TABLE,
+            Item=status_item(key, 'pending', size_bytes=size_bytes, subscribe_token=token),
+            ReturnValuesOnConditionCheckFailure='ALL_OLD',
+            **PENDING_CONDITION,
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return stored_token(e.response.get('Item'))
+    return token
+
+def stored_token(item):
+    return (item or {}).get('subscribe_token', {}).get('S')
+
+def put_pending_statuses(sizes):
+    """``put_pending`` for the keys of ``sizes`` (key -> declared size).
+
+    One TransactWriteItems call, since BatchWriteItem takes no conditions.
+    When keys fail their condition the transaction is cancelled as a whole;
+    it is sent again without them. Identical files (same sha256) map to one
+    key, which a transaction rejects twice; the dict holds each key once.
+
+    Returns key -> subscribe token, as ``put_pending`` does.
+    """
+    sizes = dict(sizes)
+    tokens = {key: secrets.token_urlsafe(16) for key in sizes}
+    while sizes:
+        try:
+            dynamodb_client.transact_write_items(TransactItems=[
+                {'Put': {
+                    'TableName': STATUS_TABLE,
+                    'Item': status_item(key, 'pending', size_bytes=size, subscribe_token=tokens[key]),
+                    'ReturnValuesOnConditionCheckFailure': 'ALL_OLD',
+                    **PENDING_CONDITION,
+                }}
+                for key, size in sizes.items()
+            ])
+            return tokens
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            # One reason per item, in order; conflicts and throttles are errors
+            reasons = e.response.get('CancellationReasons', [])
+            in_use = {
+                key: reason for key, reason in zip(sizes, reasons)
+                if reason.get('Code') == 'ConditionalCheckFailed'
+            }
+            if not in_use:
+                raise
+            for key, reason in in_use.items():
+                del sizes[key]
+                tokens[key] = stored_token(reason.get('Item'))
+    return tokens
+
+def batch_put(table_name, items):
+    """Put ``items`` into ``table_name``, WRITE_BATCH_SIZE per BatchWriteItem."""
+    for start in range(0, len(items), WRITE_BATCH_SIZE):
+        requests = {table_name: [
+            {'PutRequest': {'Item': item}}
+            for item in items[start:start + WRITE_BATCH_SIZE]
+        ]}
+        # Throttled writes come back as UnprocessedItems rather than an error
+        for attempt in range(5):
+            requests = dynamodb_client.batch_write_item(RequestItems=requests).get('UnprocessedItems')
+            if not requests:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise ClientError(
+                {'Error': {'Code': 'UnprocessedItems', 'Message': f'Writes to {table_name} were throttled'}},
+                'BatchWriteItem',
+            )
+
+def handle_subscribe(event):
+    """Subscribe a WebSocket connection to completion messages for upload keys.
+
+    The message is ``{"action": "subscribe", "keys": [...], "tokens": [...]}``,
+    with the ``subscribeToken`` presign returned for each key, in the same
+    order: keys derived from a content hash can be guessed, so without it
+    anyone could receive their download URLs. A wrong or missing token
+    refuses the whole message with 403.
+
+    The processor posts a ``connections.status_message`` to the connection
+    once each key is done or failed. Keys that already are get their
+    message right away, since their processor may have finished before the
+    subscription existed (a key can then be reported twice; the browser
+    keeps the first).
+    """
+    request_context = event['requestContext']
+    connection_id = request_context['connectionId']
+    if not CONNECTIONS_TABLE:
+        logger.error("CONNECTIONS_TABLE environment variable not set.")
+        return create_response(500, {'error': 'Server configuration error'})
+    try:
+        body = json.loads(event.get('body') or '{}')
+        keys = body.get('keys') if isinstance(body, dict) else None
+        if not isinstance(keys, list) or not keys or not all(isinstance(key, str) and key for key in keys):
+            return create_response(400, {'error': 'Missing keys'})
+        if len(keys) > MAX_BATCH_UPLOADS:
+            return create_response(400, {'error': f'At most {MAX_BATCH_UPLOADS} keys per subscription'})
+        tokens = body.get('tokens')
+        if not isinstance(tokens, list) or len(tokens) != len(keys) or not all(isinstance(t, str) for t in tokens):
+            return create_response(400, {'error': 'Missing tokens'})
+        expected = {item['upload_key']['S']: stored_token(item) for item in get_statuses(list(dict.fromkeys(keys)))}
+        for key, token in zip(keys, tokens):
+            if not expected.get(key) or not hmac.compare_digest(expected[key].encode(), token.encode()):
+                return create_response(403, {'error': 'Not allowed to subscribe to these keys'})
+        keys = list(dict.fromkeys(keys))
+
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + SUBSCRIPTION_TTL
+        batch_put(CONNECTIONS_TABLE, [
+            {
+                'upload_key': {'S': key},
+                'connection_id': {'S': connection_id},
+                'expires_at': {'N': str(int(expires_at.timestamp()))},
+            }
+            for key in keys
+        ])
+
+        # Written before this read, so a processor finishing now either sees
+        # the subscription or its final status is read here.
+        manager = connection_manager(f"https://{request_context['domainName']}/{request_context['stage']}")
+        for item in get_statuses(keys):
+            key = item['upload_key']['S']
+            status = item['status']['S']
+            if status == 'done':
+                processed_key = item['renditions']['M']['processed']['S']
+                url = download_url(processed_key)
+                manager.post(connection_id, connections.status_message(key, status, url, processed_key))
+            elif status == 'failed':
+                error = item.get('error', {}).get('S', 'Processing failed')
+                manager.post(connection_id, connections.status_message(key, status, error=error))
+        return create_response(200, {'subscribed': len(keys)})
+
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        logger.error(f"Error subscribing {connection_id}: {e}")
+        return create_response(500, {'error': 'Could not subscribe'})
+
+def get_statuses(keys):
+    """Status items for ``keys`` (at most 100), in no particular order."""
+    items = []
+    request = {STATUS_TABLE: {
+        'Keys': [{'upload_key': {'S': key}} for key in keys],
+        'ConsistentRead': True,
+    }}
+    for attempt in range(5):
+        response = dynamodb_client.batch_get_item(RequestItems=request)
+        items += response['Responses'].get(STATUS_TABLE, [])
+        request = response.get('UnprocessedKeys')
+        if not request:
+            return items
+        time.sleep(0.05 * 2 ** attempt)
+    raise ClientError(
+        {'Error': {'Code': 'UnprocessedKeys', 'Message': 'Status reads were throttled'}},
+        'BatchGetItem',
+    )
+
+def connection_manager(endpoint):
+    manager = connection_managers.get(endpoint)
+    if manager is None:
+        manager = connections.ConnectionManager(
+            session.client('apigatewaymanagementapi', region_name=REGION, endpoint_url=endpoint))
+        connection_managers[endpoint] = manager
+    return manager
+
+def handle_get_processed_image_url(event, context=None):
+    """Processing status of an upload, with a download URL once it is done.
+
+    Answers from the status item the processor maintains (one consistent
+    GetItem, no S3 call): 200 with the URL when done, 202 while pending or
+    processing, 422 as soon as processing failed, 404 for unknown keys.
+
+    With ``wait=N`` (seconds, capped at LONG_POLL_MAX_SECONDS) a pending or
+    processing upload is re-checked with backoff until it is done or failed
+    or the time is up, so one request replaces a series of short polls.
+
+    202s carry a ``Retry-After`` header and ``retryAfterMs`` with the
+    expected time left; uploads not expected within the wait get their 202
+    immediately.
+    """
     try:
-        params = event.get('queryStringParameters', {})
-        filename = params.get('filename')
-        if not filename:
-            return create_response(400, {'error': 'Missing filename'})
-
-        # Check if the object exists before generating a URL
-        s3_client.head_object(Bucket=PROCESSED_BUCKET, Key=filename)
-
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': PROCESSED_BUCKET,
-                'Key': filename
-            },
-            ExpiresIn=3600
+        params = event.get('queryStringParameters') or {}
+        key = params.get('key')
+        if not key:
+            return create_response(400, {'error': 'Missing key'})
+        try:
+            wait = min(max(int(params.get('wait') or 0), 0), LONG_POLL_MAX_SECONDS)
+        except ValueError:
+            return create_response(400, {'error': 'wait must be a whole number of seconds'})
+        if context is not None:
+            wait = min(wait, context.get_remaining_time_in_millis() / 1000 - LONG_POLL_MARGIN_SECONDS)
+        deadline = time.monotonic() + wait
+        delay = LONG_POLL_FIRST_DELAY
+
+        while True:
+            item = dynamodb_client.get_item(
+                TableName=STATUS_TABLE,
+                Key={'upload_key': {'S': key}},
+                ConsistentRead=True,
+            ).get('Item')
+            if item is None:
+                return create_response(404, {'error': 'Unknown upload key'})
+
+            status = item['status']['S']
+            if status in ('done', 'failed'):
+                break
+            remaining = deadline - time.monotonic()
+            # Uploads not expected before the wait is over are answered right
+            # away rather than held for nothing
+            eta = estimate_seconds_left(key, item)
+            if remaining <= 0 or eta > remaining:
+                return create_response(202, {'status': status, 'retryAfterMs': int(eta * 1000)}, headers={
+                    'Retry-After': str(max(math.ceil(eta), 1)),
+                    'Access-Control-Expose-Headers': 'Retry-After',
+                })
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, LONG_POLL_MAX_DELAY)
+
+        if status == 'failed':
+            return create_response(422, {'status': status, 'error': item.get('error', {}).get('S', 'Processing failed')})
+
+        processed_key = item['renditions']['M']['processed']['S']
+        return create_response(
+            200, {'status': status, 'url': download_url(processed_key), 'key': processed_key},
+            headers={'Cache-Control': http_caching.FINISHED},
         )
-        return create_response(200, {'url': presigned_url})
 
     except ClientError as e:
-        if e.response['Error']['Code'] == '404':
-            return create_response(404, {'error': 'File not found'})
-        logger.error(f"Error generating get URL: {e}")
-        return create_response(500, {'error': 'Could not generate URL'})
+        logger.error(f"Error reading processing status: {e}")
+        return create_response(500, {'error': 'Could not read processing status'})
+
+def handle_get_processed_image_urls(event, context=None):
+    """Processing status of up to MAX_STATUS_KEYS uploads in one request.
+
+    The body is ``{"keys": [...], "wait"?: N}``. The response lists
+    ``{"key", "status", ...}`` in the same order: ``url`` and
+    ``processedKey`` when done, ``error`` when failed, ``retryAfterMs``
+    while pending or processing, and status ``unknown`` for keys without a
+    status item. ``retryAfterMs`` at the top is the soonest of them.
+
+    With ``wait`` the request is held like the single-key long poll, until
+    at least one upload is done, failed or unknown, or none is expected
+    before the wait is over. A browser uploading a whole shoot keeps one
+    such request open for all its pending files.
+    """
+    try:
+        body = json.loads(event.get('body') or '{}')
+        keys = body.get('keys') if isinstance(body, dict) else None
+        if not isinstance(keys, list) or not keys or not all(isinstance(key, str) and key for key in keys):
+            return create_response(400, {'error': 'Missing keys'})
+        if len(keys) > MAX_STATUS_KEYS:
+            return create_response(400, {'error': f'At most {MAX_STATUS_KEYS} keys per request'})
+        try:
+            wait = min(max(int(body.get('wait') or 0), 0), LONG_POLL_MAX_SECONDS)
+        except (TypeError, ValueError):
+            return create_response(400, {'error': 'wait must be a whole number of seconds'})
+        if context is not None:
+            wait = min(wait, context.get_remaining_time_in_millis() / 1000 - LONG_POLL_MARGIN_SECONDS)
+        deadline = time.monotonic() + wait
+        delay = LONG_POLL_FIRST_DELAY
+
+        while True:
+            # BatchGetItem rejects a key listed twice
+            items = {item['upload_key']['S']: item for item in get_statuses(list(dict.fromkeys(keys)))}
+            etas = {
+                key: estimate_seconds_left(key, item)
+                for key, item in items.items()
+                if item['status']['S'] not in ('done', 'failed')
+            }
+            remaining = deadline - time.monotonic()
+            # Answer once anything changed for the client, or when nothing
+            # is expected before the wait is over
+            if len(etas) < len(set(keys)) or remaining <= 0 or min(etas.values()) > remaining:
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, LONG_POLL_MAX_DELAY)
+
+        response = {'images': [status_entry(key, items.get(key), etas.get(key)) for key in keys]}
+        if etas:
+            response['retryAfterMs'] = int(min(etas.values()) * 1000)
+        return create_response(200, response)
+
+    except json.JSONDecodeError:
+        return create_response(400, {'error': 'Invalid JSON in request body'})
+    except ClientError as e:
+        logger.error(f"Error reading processing statuses: {e}")
+        return create_response(500, {'error': 'Could not read processing status'})
+
+def status_entry(key, item, eta=None):
+    """One upload's entry in a /get-processed-image-urls response."""
+    if item is None:
+        return {'key': key, 'status': 'unknown'}
+    status = item['status']['S']
+    if status == 'done':
+        processed_key = item['renditions']['M']['processed']['S']
+        return {'key': key, 'status': status, 'url': download_url(processed_key), 'processedKey': processed_key}
+    if status == 'failed':
+        return {'key': key, 'status': status, 'error': item.get('error', {}).get('S', 'Processing failed')}
+    return {'key': key, 'status': status, 'retryAfterMs': int(eta * 1000)}
+
+def handle_get_image(event):
+    """Status, original and renditions of an upload in one response.
+
+    ``GET /images/{key}`` answers 200 with the representation built by
+    image_resource.py and its ``ETag``, 304 when ``If-None-Match`` still
+    matches (one status read, no metadata query, no signing), 404 for
+    unknown keys.
+    """
+    key = (event.get('pathParameters') or {}).get('key')
+    if not key:
+        return create_response(400, {'error': 'Missing key'})
+    try:
+        item = dynamodb_client.get_item(
+            TableName=STATUS_TABLE,
+            Key={'upload_key': {'S': key}},
+            ConsistentRead=True,
+        ).get('Item')
+        if item is None:
+            return create_response(404, {'error': 'Unknown upload key'})
+        status_item = deserialize(item)
+
+        tag = image_resource.etag(key, status_item, time.time(), URL_CACHE_TTL)
+        # no-cache: browsers keep the response but revalidate it every time
+        headers = {
+            'ETag': tag,
+            'Cache-Control': http_caching.REVALIDATE,
+            'Access-Control-Expose-Headers': 'ETag',
+        }
+        request_headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+        if image_resource.not_modified(request_headers.get('if-none-match'), tag):
+            return create_response(304, None, headers=headers)
+
+        # The processor writes the metadata before marking the upload done
+        metadata_item = latest_metadata(key) if status_item['status'] == 'done' else None
+        body = image_resource.representation(key, status_item, metadata_item, download_url)
+        return create_response(200, body, headers=headers)
+
+    except ClientError as e:
+        logger.error(f"Error reading image {key}: {e}")
+        return create_response(500, {'error': 'Could not read image'})
+
+def latest_metadata(key):
+    """The newest metadata item for ``key`` (reprocessing adds one per run), or None."""
+    items = dynamodb_client.query(
+        TableName=METADATA_TABLE,
+        KeyConditionExpression='image_key = :key',
+        ExpressionAttributeValues={':key': {'S': key}},
+        ScanIndexForward=False,
+        Limit=1,
+    )['Items']
+    return deserialize(items[0]) if items else None
+
+def deserialize(item):
+    return {name: deserializer.deserialize(value) for name, value in item.items()}
+
+def download_url(processed_key):
+    # Repeated requests for the same image get the same URL, so the browser
+    # can answer them from its HTTP cache.
+    return url_cache.get(
+        'GET', PROCESSED_BUCKET, processed_key,
+        lambda: presigner.presign('GET', PROCESSED_BUCKET, processed_key, URL_EXPIRES_IN),
+    )
+
+def estimate_seconds_left(key, item):
+    """Expected seconds until a pending or processing upload is done.
+
+    Uses the declared size and the time since the status last changed,
+    against the tier's recent processing times (see processing_stats.py).
+    """
+    size_bytes = int(item.get('size_bytes', {}).get('N', 0))
+    elapsed = 0.0
+    if 'updated_at' in item:
+        updated_at = datetime.datetime.fromisoformat(item['updated_at']['S'])
+        elapsed = (datetime.datetime.now(datetime.timezone.utc) - updated_at).total_seconds()
+    tier = 'large' if key.startswith('large/') else 'small'
+    return processing_stats.retry_after(processing_model(tier), item['status']['S'], size_bytes, elapsed)
+
+def processing_model(tier):
+    """The tier's fitted processing-time model, refreshed every STATS_MODEL_TTL seconds."""
+    cached = processing_models.get(tier)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < STATS_MODEL_TTL:
+        return cached[0]
+    model = processing_stats.DEFAULT_MODEL
+    if STATS_TABLE:
+        keys = processing_stats.period_keys(tier, datetime.datetime.now(datetime.timezone.utc))
+        try:
+            items = dynamodb_client.batch_get_item(RequestItems={STATS_TABLE: {
+                'Keys': [{'period': {'S': key}} for key in keys],
+            }})['Responses'].get(STATS_TABLE, [])
+            model = processing_stats.fit([
+                {name: value['N'] for name, value in item.items() if 'N' in value}
+                for item in items
+            ])
+        except ClientError as e:
+            # Only the hint suffers; keep the defaults until the next refresh
+            logger.warning(f"Could not read processing stats: {e}")
+    processing_models[tier] = (model, now)
+    return model
+
+def publish_url_cache_metrics():
+    """Emit the URL cache hits/misses since the last call, at most once a minute.
+
+    Uses CloudWatch embedded metric format like the processor's
+    RejectedObjects, so the counters cost a log line rather than an API call.
+    """
+    now = time.monotonic()
+    if now - _published_stats['at'] < URL_CACHE_METRICS_INTERVAL:
+        return
+    stats = url_cache.stats()
+    hits = stats['hits'] - _published_stats['hits']
+    misses = stats['misses'] - _published_stats['misses']
+    _published_stats.update(hits=stats['hits'], misses=stats['misses'], at=now)
+    if not hits and not misses:
+        return
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(datetime.datetime.now().timestamp() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ImageProcessing',
+                'Dimensions': [[]],
+                'Metrics': [
+                    {'Name': 'UrlCacheHits', 'Unit': 'Count'},
+                    {'Name': 'UrlCacheMisses', 'Unit': 'Count'},
+                ],
+            }],
+        },
+        'UrlCacheHits': hits,
+        'UrlCacheMisses': misses,
+        'UrlCacheSize': stats['size'],
+    }))
 
-def create_response(status_code, body):
+def create_response(status_code, body, headers=None):
     return {
         'statusCode': status_code,
         'headers': {
             'Access-Control-Allow-Origin': '*',
             'Access-Control-Allow-Headers': 'Content-Type',
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET'
+            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
+            # Signed upload URLs, statuses in progress and errors; see http_caching.py
+            'Cache-Control': http_caching.NO_STORE,
+            **(headers or {}),
         },
-        'body': json.dumps(body)
+        # 304s have no body
+        'body': json.dumps(body) if body is not None else ''
     }
@@ -0,0 +1,119 @@
+"""Fast SigV4 query-string presigning for S3.
+
+``generate_presigned_url`` serializes a full request, resolves the endpoint
+rule set and runs the event hooks for every URL, then derives the signing key
+with four HMACs. For the handful of S3 operations presign signs, all of that
+is the same from one URL to the next except the key, the signed headers and
+the timestamp. ``SigV4Presigner`` asks botocore once per bucket for the
+endpoint (scheme, host, path prefix, signing region), caches the derived
+signing key per date/region/service, and builds the canonical request and
+query string directly.
+
+The output is byte-for-byte what botocore's ``S3SigV4QueryAuth`` produces for
+the same inputs and timestamp (see tests/unit/test_sigv4_presign.py).
+"""
+import datetime
+import functools
+import hashlib
+import hmac
+from urllib.parse import parse_qs, quote, urlsplit
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+SIGV4_TIMESTAMP = "%Y%m%dT%H%M%SZ"
+
+
+def _encode(value):
+    # botocore.utils.percent_encode with its default safe characters
+    return quote(str(value).encode("utf-8"), safe="-._~")
+
+
+@functools.lru_cache(maxsize=16)
+def signing_key(secret_key, date, region, service):
+    """The derived SigV4 key; valid for every request on ``date`` (YYYYMMDD)."""
+    key = ("AWS4" + secret_key).encode("utf-8")
+    for part in (date, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode("utf-8"), hashlib.sha256).digest()
+    return key
+
+
+class SigV4Presigner:
+    """Presigns S3 object URLs without botocore's request pipeline.
+
+    ``client`` is an S3 client configured for SigV4; it is only used to
+    resolve each bucket's endpoint once. ``credentials`` is a botocore
+    credentials object, frozen on every call so refreshed credentials are
+    picked up.
+    """
+
+    def __init__(self, client, credentials):
+        self._client = client
+        self._credentials = credentials
+        self._endpoints = {}
+
+    def _endpoint(self, bucket):
+        endpoint = self._endpoints.get(bucket)
+        if endpoint is None:
+            # One real presign shows where botocore sends requests for this
+            # bucket: virtual-hosted or path-style, and the signing region.
+            url = urlsplit(self._client.generate_presigned_url(
+                "get_object", Params={"Bucket": bucket, "Key": "k"}, ExpiresIn=1,
+            ))
+            _, _, region, service, _ = parse_qs(url.query)["X-Amz-Credential"][0].split("/")
+            endpoint = (url.scheme, url.netloc, url.path[:-len("/k")], region, service)
+            self._endpoints[bucket] = endpoint
+        return endpoint
+
+    def presign(self, method, bucket, key, expires_in=3600, query=(), headers=None, now=None):
+        """Presigned URL for ``method`` on ``bucket``/``key``.
+
+        ``query`` holds the operation's query parameters as ``(name, value)``
+        pairs in botocore's order (e.g. ``uploadId``, ``partNumber``);
+        ``headers`` the headers the URL is bound to, such as
+        ``Content-Type`` and ``Content-Length``.
+        """
+        scheme, host, prefix, region, service = self._endpoint(bucket)
+        credentials = self._credentials.get_frozen_credentials()
+        now = now or datetime.datetime.now(datetime.timezone.utc)
+        timestamp = now.strftime(SIGV4_TIMESTAMP)
+        scope = f"{timestamp[:8]}/{region}/{service}/aws4_request"
+
+        signed = {"host": host}
+        for name, value in (headers or {}).items():
+            signed[name.lower()] = " ".join(str(value).split())
+        signed_headers = ";".join(sorted(signed))
+
+        params = [(_encode(name), _encode(value)) for name, value in query]
+        params += [
+            ("X-Amz-Algorithm", ALGORITHM),
+            ("X-Amz-Credential", _encode(f"{credentials.access_key}/{scope}")),
+            ("X-Amz-Date", timestamp),
+            ("X-Amz-Expires", str(expires_in)),
+            ("X-Amz-SignedHeaders", _encode(signed_headers)),
+        ]
+        if credentials.token is not None:
+            params.append(("X-Amz-Security-Token", _encode(credentials.token)))
+
+        path = prefix + "/" + quote(key.encode("utf-8"), safe="/~")
+        canonical_request = "\n".join([
+            method,
+            path,
+            "&".join(f"{name}={value}" for name, value in sorted(params)),
+            "".join(f"{name}:{signed[name]}\n" for name in sorted(signed)),
+            signed_headers,
+            UNSIGNED_PAYLOAD,
+        ])
+        string_to_sign = "\n".join([
+            ALGORITHM,
+            timestamp,
+            scope,
+            hashlib.sha256(canonical_request.encode("utf-8")).hexdigest(),
+        ])
+        signature = hmac.new(
+            signing_key(credentials.secret_key, timestamp[:8], region, service),
+            string_to_sign.encode("utf-8"),
+            hashlib.sha256,
+        ).hexdigest()
+
+        query_string = "&".join(f"{name}={value}" for name, value in params)
+        return f"{scheme}://{host}{path}?{query_string}&X-Amz-Signature={signature}"
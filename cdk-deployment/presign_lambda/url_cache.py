@@ -0,0 +1,63 @@
+"""In-process LRU cache of presigned URLs.
+
+Clients polling for the same processed image, or asking twice for the same
+upload, get the URL signed the first time instead of a fresh signature. That
+saves the signing work, and the stable URL lets browsers reuse their HTTP
+cache for the image. Entries live for ``ttl`` seconds, which must stay well
+below the URLs' ``ExpiresIn`` so every URL handed out remains valid for at
+least ``expires_in - ttl`` seconds.
+"""
+import collections
+import threading
+import time
+
+
+class SignedUrlCache:
+    """LRU of signed URLs keyed by operation, bucket, key and signed headers.
+
+    ``headers`` are the headers the URL is bound to (``Content-Type``,
+    ``Content-Length``, ``x-amz-meta-*``...); a URL is only reused for a
+    request that would be signed with exactly the same ones.
+    """
+
+    def __init__(self, expires_in=3600, ttl=300, maxsize=1024, clock=time.monotonic):
+        if ttl * 2 > expires_in:
+            raise ValueError(f"ttl ({ttl}s) must be at most half of expires_in ({expires_in}s)")
+        self.expires_in = expires_in
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        # The Flask app serves requests from several threads
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, operation, bucket, key, sign, headers=None):
+        """Cached URL for the request, or ``sign()``'s result cached for next time."""
+        cache_key = (operation, bucket, key, tuple(sorted((headers or {}).items())))
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and now - entry[1] < self.ttl:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        url = sign()
+        with self._lock:
+            self._entries[cache_key] = (url, now)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return url
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+            }
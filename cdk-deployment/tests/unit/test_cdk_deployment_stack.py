@@ -1,5 +1,8 @@
+import json
+
 import aws_cdk as core
 import aws_cdk.assertions as assertions
+import pytest
 
 from cdk_deployment.cdk_deployment_stack import CdkDeploymentStack
 
@@ -13,3 +16,388 @@ def test_sqs_queue_created():
 #     template.has_resource_properties("AWS::SQS::Queue", {
 #         "VisibilityTimeout": 300
 #     })
+
+
+def test_processor_tiers_created():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "lambda_function.handler",
+        "MemorySize": 512,
+        "Timeout": 15,
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "lambda_function.handler",
+        "MemorySize": 3008,
+        "Timeout": 300,
+    })
+
+
+def test_uploads_filtered_by_image_suffix():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("Custom::S3BucketNotifications", {
+        "NotificationConfiguration": {
+            "LambdaFunctionConfigurations": assertions.Match.array_with([
+                assertions.Match.object_like({
+                    "Filter": {"Key": {"FilterRules": [
+                        {"Name": "suffix", "Value": ".jpg"},
+                        {"Name": "prefix", "Value": "small/"},
+                    ]}},
+                }),
+            ]),
+        },
+    })
+
+
+def test_status_table():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "image-processing-status",
+        "KeySchema": [{"AttributeName": "upload_key", "KeyType": "HASH"}],
+        "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+    })
+    for handler in ("lambda_function.handler", "presign_handler.handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {"Variables": assertions.Match.object_like({
+                "STATUS_TABLE": assertions.Match.any_value(),
+            })},
+        })
+
+
+def test_batch_presign_route():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::Resource", {
+        "PathPart": "generate-upload-urls",
+    })
+
+
+def test_batch_status_route():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::Resource", {
+        "PathPart": "get-processed-image-urls",
+    })
+
+
+def test_multipart_upload_routes():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    for action in ("create", "parts", "complete", "abort"):
+        template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": action})
+    template.has_resource_properties("AWS::S3::Bucket", {
+        "BucketName": "uploaded-images-bucket-20250910",
+        "LifecycleConfiguration": {"Rules": [assertions.Match.object_like({
+            "AbortIncompleteMultipartUpload": {"DaysAfterInitiation": 1},
+        })]},
+    })
+
+def test_websocket_notifications():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGatewayV2::Api", {"ProtocolType": "WEBSOCKET"})
+    template.has_resource_properties("AWS::ApiGatewayV2::Route", {"RouteKey": "subscribe"})
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "image-processing-connections",
+        "KeySchema": [
+            {"AttributeName": "upload_key", "KeyType": "HASH"},
+            {"AttributeName": "connection_id", "KeyType": "RANGE"},
+        ],
+        "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "lambda_function.handler",
+        "Environment": {"Variables": assertions.Match.object_like({
+            "CONNECTIONS_TABLE": assertions.Match.any_value(),
+            "WEBSOCKET_ENDPOINT": assertions.Match.any_value(),
+        })},
+    })
+
+
+def test_processing_stats_table():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::DynamoDB::Table", {
+        "TableName": "image-processing-stats",
+        "KeySchema": [{"AttributeName": "period", "KeyType": "HASH"}],
+        "TimeToLiveSpecification": {"AttributeName": "expires_at", "Enabled": True},
+    })
+    for handler in ("lambda_function.handler", "presign_handler.handler"):
+        template.has_resource_properties("AWS::Lambda::Function", {
+            "Handler": handler,
+            "Environment": {"Variables": assertions.Match.object_like({
+                "STATS_TABLE": assertions.Match.any_value(),
+            })},
+        })
+
+
+def test_images_endpoint():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::Resource", {"PathPart": "{key+}"})
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "presign_handler.handler",
+        "Environment": {"Variables": assertions.Match.object_like({
+            "METADATA_TABLE": assertions.Match.any_value(),
+        })},
+    })
+
+
+def test_api_compression_and_preflight_caching():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::ApiGateway::RestApi", {"MinimumCompressionSize": 1024})
+    template.has_resource_properties("AWS::ApiGateway::Method", {
+        "HttpMethod": "OPTIONS",
+        "Integration": assertions.Match.object_like({
+            "IntegrationResponses": [assertions.Match.object_like({
+                "ResponseParameters": assertions.Match.object_like({
+                    "method.response.header.Access-Control-Max-Age": "'7200'",
+                }),
+            })],
+        }),
+    })
+
+
+def test_presign_long_poll():
+    app = core.App()
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "presign_handler.handler",
+        "Timeout": 30,
+        "Environment": {"Variables": assertions.Match.object_like({
+            "LONG_POLL_MAX_SECONDS": "20",
+        })},
+    })
+
+
+def test_long_poll_must_fit_api_gateway_timeout():
+    app = core.App(context={"presign.long_poll_seconds": "29", "presign.timeout_seconds": "60"})
+    with pytest.raises(ValueError):
+        CdkDeploymentStack(app, "cdk-deployment")
+
+
+def test_extra_image_formats_from_context():
+    app = core.App(context={"extra_image_formats": '["heif"]'})
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Environment": {"Variables": assertions.Match.object_like({
+            "IMAGE_EXTRA_FORMATS": "HEIF",
+        })},
+    })
+    # Presign accepts exactly what the notifications route
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "presign_handler.handler",
+        "Environment": {"Variables": assertions.Match.object_like({
+            "IMAGE_SUFFIXES": ".jpg,.jpeg,.png,.webp,.gif,.heic,.heif",
+        })},
+    })
+    template.has_resource_properties("Custom::S3BucketNotifications", {
+        "NotificationConfiguration": {
+            "LambdaFunctionConfigurations": assertions.Match.array_with([
+                assertions.Match.object_like({
+                    "Filter": {"Key": {"FilterRules": [
+                        {"Name": "suffix", "Value": ".HEIC"},
+                        {"Name": "prefix", "Value": "large/"},
+                    ]}},
+                }),
+            ]),
+        },
+    })
+
+
+def test_extra_image_format_plugins_are_installed(monkeypatch):
+    from aws_cdk import aws_lambda
+
+    build_args = []
+    from_docker_build = aws_lambda.Code.from_docker_build
+
+    def recording(path, **kwargs):
+        build_args.append((path, kwargs.get("build_args")))
+        return from_docker_build(path, **kwargs)
+
+    monkeypatch.setattr(aws_lambda.Code, "from_docker_build", staticmethod(recording))
+    CdkDeploymentStack(core.App(context={"extra_image_formats": '["AVIF", "HEIF", "TIFF"]'}), "cdk-deployment")
+    CdkDeploymentStack(core.App(), "cdk-deployment")
+
+    processor_builds = [args for path, args in build_args if path == "lambda"]
+    assert processor_builds == [{"EXTRA_REQUIREMENTS": "pillow-avif-plugin==1.4.6 pillow-heif==0.16.0"}, None]
+
+
+def test_arm64_architecture_from_context():
+    app = core.App(context={"architecture": "arm64"})
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    architectures = {
+        function["Properties"]["Handler"]: function["Properties"].get("Architectures")
+        for function in template.find_resources("AWS::Lambda::Function").values()
+        if function["Properties"]["Handler"] in ("lambda_function.handler", "presign_handler.handler")
+    }
+    assert architectures == {
+        "lambda_function.handler": ["arm64"],
+        "presign_handler.handler": ["arm64"],
+    }
+
+
+def backfill_definition(context=None):
+    app = core.App(context={
+        "@aws-cdk/aws-stepfunctions:useDistributedMapResultWriterV2": True,
+        **(context or {}),
+    })
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    state_machines = template.find_resources("AWS::StepFunctions::StateMachine")
+    assert len(state_machines) == 1
+    definition = next(iter(state_machines.values()))["Properties"]["DefinitionString"]
+    # Resolve the Fn::Join into a plain JSON document, replacing references
+    # with the logical ids they refer to and other tokens with placeholders
+    parts = definition["Fn::Join"][1]
+    return json.loads("".join(p if isinstance(p, str) else p.get("Ref", "TOKEN") for p in parts))
+
+
+def test_backfill_distributed_map():
+    backfill_map = backfill_definition()["States"]["BackfillMap"]
+
+    assert backfill_map["ItemProcessor"]["ProcessorConfig"]["Mode"] == "DISTRIBUTED"
+    assert backfill_map["ItemReader"]["ReaderConfig"]["InputType"] == "MANIFEST"
+    assert backfill_map["ItemReader"]["Parameters"] == {
+        "Bucket.$": "$.manifestBucket",
+        "Key.$": "$.manifestKey",
+    }
+    assert backfill_map["ItemBatcher"]["MaxItemsPerBatch"] == 25
+    assert backfill_map["MaxConcurrency"] == 100
+    assert backfill_map["ToleratedFailurePercentage"] == 1
+    assert backfill_map["ResultWriter"]["Parameters"]["Prefix"] == "backfill-results"
+    # Never among the uploads a later backfill reads
+    assert backfill_map["ResultWriter"]["Parameters"]["Bucket"].startswith("BackfillResultsBucket")
+
+
+def test_backfill_settings_from_context():
+    backfill_map = backfill_definition({
+        "backfill.batch_size": "50",
+        "backfill.max_concurrency": "1000",
+        "backfill.tolerated_failure_percentage": "5",
+    })["States"]["BackfillMap"]
+
+    assert backfill_map["ItemBatcher"]["MaxItemsPerBatch"] == 50
+    assert backfill_map["MaxConcurrency"] == 1000
+    assert backfill_map["ToleratedFailurePercentage"] == 5
+
+
+def test_backfill_retries_throttled_batches():
+    process_batch = backfill_definition()["States"]["BackfillMap"]["ItemProcessor"]["States"]["ProcessBackfillBatch"]
+    retry = next(r for r in process_batch["Retry"] if r["ErrorEquals"] == ["Lambda.TooManyRequestsException"])
+    assert retry["MaxAttempts"] == 6
+    assert retry["JitterStrategy"] == "FULL"
+
+
+def test_backfill_concurrency_must_leave_room_for_live_uploads():
+    assert backfill_definition({"profile": "prod"})["States"]["BackfillMap"]["MaxConcurrency"] == 40
+    app = core.App(context={"large_processor.reserved_concurrency": "50", "backfill.max_concurrency": "50"})
+    with pytest.raises(ValueError):
+        CdkDeploymentStack(app, "cdk-deployment")
+
+
+def backfill_read_grants(context=None):
+    app = core.App(context=context)
+    template = assertions.Template.from_stack(CdkDeploymentStack(app, "cdk-deployment"))
+    policy = template.find_resources("AWS::IAM::Policy", {
+        "Properties": {"Roles": [{"Ref": assertions.Match.string_like_regexp("BackfillStateMachineRole")}]},
+    })
+    statements = next(iter(policy.values()))["Properties"]["PolicyDocument"]["Statement"]
+    return [statement["Resource"] for statement in statements if "s3:GetObject*" in statement["Action"]]
+
+
+def test_backfill_reads_manifests_from_one_bucket():
+    # The upload bucket by default
+    [resources] = backfill_read_grants()
+    assert resources != "*"
+    assert all("UploadedImagesBucket" in json.dumps(resource) for resource in resources)
+
+    [resources] = backfill_read_grants({"backfill.manifest_bucket": "my-inventory-bucket"})
+    assert [resource["Fn::Join"][1][-1] for resource in resources] == [
+        ":s3:::my-inventory-bucket",
+        ":s3:::my-inventory-bucket/*",
+    ]
+
+
+def test_prod_profile_capacity():
+    app = core.App(context={"profile": "prod"})
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "MemorySize": 512,
+        "ReservedConcurrentExecutions": 200,
+        "Environment": {"Variables": assertions.Match.object_like({
+            "PROCESSOR_TIER": "small",
+            "WARM_UP": "connect",
+        })},
+    })
+    template.has_resource_properties("AWS::Lambda::Alias", {
+        "Name": "live",
+        "ProvisionedConcurrencyConfig": {"ProvisionedConcurrentExecutions": 2},
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalableTarget", {
+        "MinCapacity": 2,
+        "MaxCapacity": 50,
+        "ScalableDimension": "lambda:function:ProvisionedConcurrency",
+        "ScheduledActions": assertions.Match.array_with([
+            assertions.Match.object_like({
+                "ScheduledActionName": "MorningScaleUp",
+                "ScalableTargetAction": {"MinCapacity": 10},
+            }),
+        ]),
+    })
+    template.has_resource_properties("AWS::ApplicationAutoScaling::ScalingPolicy", {
+        "TargetTrackingScalingPolicyConfiguration": assertions.Match.object_like({
+            "TargetValue": 0.7,
+        }),
+    })
+
+
+def test_capacity_overrides_from_context():
+    app = core.App(context={
+        "large_processor.memory_size": "4096",
+        "presign.reserved_concurrency": "20",
+    })
+    stack = CdkDeploymentStack(app, "cdk-deployment")
+    template = assertions.Template.from_stack(stack)
+
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "lambda_function.handler",
+        "MemorySize": 4096,
+    })
+    template.has_resource_properties("AWS::Lambda::Function", {
+        "Handler": "presign_handler.handler",
+        "ReservedConcurrentExecutions": 20,
+    })
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import boto3
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+
+import connections  # noqa: E402
+
+TABLE = "image-processing-connections"
+
+
+def make_client(service, **kwargs):
+    return boto3.client(
+        service,
+        region_name="us-east-1",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+        **kwargs,
+    )
+
+
+def test_notify_posts_to_subscribers_and_drops_gone_connections():
+    dynamodb = make_client("dynamodb")
+    manager = connections.LocalConnectionManager()
+    manager.connect("open-1")
+    manager.connect("open-2")
+    message = connections.status_message("small/a.jpg", "done", "https://url", "processed-a.jpg")
+
+    with Stubber(dynamodb) as stubber:
+        stubber.add_response("query", {"Items": [
+            {"connection_id": {"S": "open-1"}},
+            {"connection_id": {"S": "closed"}},
+            {"connection_id": {"S": "open-2"}},
+        ]})
+        stubber.add_response("delete_item", {}, {
+            "TableName": TABLE,
+            "Key": {"upload_key": {"S": "small/a.jpg"}, "connection_id": {"S": "closed"}},
+        })
+        connection_ids = connections.subscribers(dynamodb, TABLE, "small/a.jpg")
+        delivered = connections.notify(dynamodb, TABLE, manager, "small/a.jpg", connection_ids, message)
+
+    assert delivered == 2
+    assert manager.messages == {
+        "open-1": [{"type": "status", "key": "small/a.jpg", "status": "done",
+                    "url": "https://url", "processedKey": "processed-a.jpg"}],
+        "open-2": [{"type": "status", "key": "small/a.jpg", "status": "done",
+                    "url": "https://url", "processedKey": "processed-a.jpg"}],
+    }
+
+
+def test_failed_message_carries_the_error():
+    assert connections.status_message("small/a.jpg", "failed", error="not an image") == {
+        "type": "status", "key": "small/a.jpg", "status": "failed", "error": "not an image",
+    }
+
+
+def test_connection_manager_reports_gone_connections():
+    client = make_client(
+        "apigatewaymanagementapi",
+        endpoint_url="https://example.execute-api.us-east-1.amazonaws.com/live",
+    )
+    manager = connections.ConnectionManager(client)
+    with Stubber(client) as stubber:
+        stubber.add_response("post_to_connection", {}, {"ConnectionId": "open", "Data": b'{"status": "done"}'})
+        stubber.add_client_error("post_to_connection", service_error_code="GoneException", http_status_code=410)
+        assert manager.post("open", {"status": "done"}) is True
+        assert manager.post("closed", {"status": "done"}) is False
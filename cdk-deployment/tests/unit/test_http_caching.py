@@ -0,0 +1,43 @@
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "presign_lambda"))
+
+import http_caching  # noqa: E402
+
+
+def test_preferred_encoding_follows_q_values_then_server_order():
+    both = ("br", "gzip")
+    assert http_caching.preferred_encoding("gzip, deflate, br", both) == "br"
+    assert http_caching.preferred_encoding("br;q=0.5, gzip", both) == "gzip"
+    assert http_caching.preferred_encoding("br;q=0, *", both) == "gzip"
+    assert http_caching.preferred_encoding("br", ("gzip",)) is None
+    assert http_caching.preferred_encoding("identity", both) is None
+    assert http_caching.preferred_encoding("", both) is None
+    assert http_caching.preferred_encoding(None, both) is None
+
+
+def test_only_text_bodies_are_compressed():
+    assert http_caching.compressible("application/json")
+    assert http_caching.compressible("text/html; charset=utf-8")
+    assert http_caching.compressible("text/javascript")
+    assert not http_caching.compressible("image/jpeg")
+    assert not http_caching.compressible(None)
+
+
+def test_compress_round_trips_and_is_deterministic():
+    body = b'{"uploads": []}' * 200
+    compressed = http_caching.compress(body, "gzip")
+    assert gzip.decompress(compressed) == body
+    assert http_caching.compress(body, "gzip") == compressed
+    assert len(compressed) < len(body)
+    with pytest.raises(ValueError):
+        http_caching.compress(body, "zstd")
+
+
+def test_compressed_variants_get_weak_etags():
+    assert http_caching.weak_etag('"abc"') == 'W/"abc"'
+    assert http_caching.weak_etag('W/"abc"') == 'W/"abc"'
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+
+import image_codecs  # noqa: E402
+
+AVIF = b"\x00\x00\x00\x20ftypavif"
+TIFF = b"II*\x00\x08\x00\x00\x00\x00\x00\x00\x00"
+
+
+def test_extra_formats_are_sniffed_only_with_their_plugin(monkeypatch):
+    monkeypatch.setattr(image_codecs, "extra_formats", ["AVIF", "TIFF"])
+    monkeypatch.setattr(image_codecs, "_available_extra", None)
+    # The installed Pillow has no AVIF decoder and pillow-avif-plugin is missing
+    monkeypatch.setattr(image_codecs, "EXTRA_FORMATS", {
+        **image_codecs.EXTRA_FORMATS,
+        "AVIF": (("pillow_avif_not_installed",), image_codecs.EXTRA_FORMATS["AVIF"][1]),
+    })
+
+    assert image_codecs.available_extra_formats() == ["TIFF"]
+    assert image_codecs.sniff_format(TIFF) == "TIFF"
+    assert image_codecs.sniff_format(AVIF) is None
+    assert image_codecs.sniff_format(b"\xff\xd8\xff\xe0") == "JPEG"
+
+
+def test_extra_formats_stay_off_unless_enabled(monkeypatch):
+    monkeypatch.setattr(image_codecs, "extra_formats", [])
+    monkeypatch.setattr(image_codecs, "_available_extra", None)
+    assert image_codecs.sniff_format(TIFF) is None
@@ -0,0 +1,79 @@
+import os
+import sys
+from decimal import Decimal
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "presign_lambda"))
+
+import image_resource  # noqa: E402
+
+KEY = "small/3f0c9a.jpg"
+DONE = {
+    "upload_key": KEY,
+    "status": "done",
+    "updated_at": "2025-09-10T14:30:00+00:00",
+    "renditions": {"processed": "processed-3f0c9a.jpg"},
+}
+METADATA = {
+    "image_key": KEY,
+    "original_filename": "IMG 0001.jpg",
+    "original_size_bytes": Decimal(2048),
+    "processed_size_bytes": Decimal(512),
+    "original_dimensions": "400x300",
+    "processed_dimensions": "200x150",
+}
+
+
+def test_done_upload_lists_renditions_with_urls_and_metadata():
+    sign = mock.Mock(return_value="https://signed")
+    assert image_resource.representation(KEY, DONE, METADATA, sign) == {
+        "key": KEY,
+        "status": "done",
+        "updatedAt": "2025-09-10T14:30:00+00:00",
+        "originalFilename": "IMG 0001.jpg",
+        "original": {"sizeBytes": 2048, "width": 400, "height": 300},
+        "renditions": {"processed": {
+            "key": "processed-3f0c9a.jpg",
+            "url": "https://signed",
+            "sizeBytes": 512,
+            "width": 200,
+            "height": 150,
+        }},
+    }
+    sign.assert_called_once_with("processed-3f0c9a.jpg")
+
+
+def test_pre_resized_upload_reports_the_uploaded_size():
+    metadata = {**METADATA, "original_size_bytes": Decimal(9000000), "uploaded_size_bytes": Decimal(2048)}
+    original = image_resource.representation(KEY, DONE, metadata, mock.Mock())["original"]
+    assert original == {"sizeBytes": 9000000, "uploadedSizeBytes": 2048, "width": 400, "height": 300}
+
+
+def test_unfinished_uploads_are_not_signed():
+    sign = mock.Mock()
+    pending = {"upload_key": KEY, "status": "pending", "size_bytes": Decimal(2048)}
+    failed = {"upload_key": KEY, "status": "failed", "error": "not an image"}
+    assert image_resource.representation(KEY, pending, None, sign)["original"] == {"sizeBytes": 2048}
+    assert image_resource.representation(KEY, failed, None, sign)["error"] == "not an image"
+    sign.assert_not_called()
+
+
+def test_etag_follows_status_changes_and_url_windows():
+    tag = image_resource.etag(KEY, DONE, now=1000, url_ttl=300)
+    # Weak: bodies sharing it may carry differently signed URLs
+    assert tag.startswith('W/"') and tag.endswith('"')
+    assert image_resource.etag(KEY, DONE, now=1100, url_ttl=300) == tag
+    assert image_resource.etag(KEY, DONE, now=1200, url_ttl=300) != tag
+    assert image_resource.etag(KEY, {**DONE, "updated_at": "2025-09-10T15:00:00+00:00"}, 1000, 300) != tag
+    processing = {"upload_key": KEY, "status": "processing", "updated_at": "2025-09-10T14:29:00+00:00"}
+    assert image_resource.etag(KEY, processing, 0, 300) == image_resource.etag(KEY, processing, 10 ** 6, 300)
+
+
+def test_if_none_match():
+    tag = image_resource.etag(KEY, DONE, 1000, 300)
+    assert image_resource.not_modified(tag, tag)
+    assert image_resource.not_modified(f'"other", {tag}', tag)
+    assert image_resource.not_modified(tag.removeprefix("W/"), tag)
+    assert image_resource.not_modified("*", tag)
+    assert not image_resource.not_modified('"other"', tag)
+    assert not image_resource.not_modified(None, tag)
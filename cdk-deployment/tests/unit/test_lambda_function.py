@@ -0,0 +1,154 @@
+import io
+import os
+import sys
+
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+
+# Read by the handler module at import
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("PROCESSED_BUCKET", "processed-images-bucket")
+os.environ.setdefault("METADATA_TABLE", "image-metadata")
+
+import lambda_function  # noqa: E402
+
+UPLOAD_BUCKET = "uploaded-images-bucket"
+STATUS_TABLE = "image-processing-status"
+
+
+class StatusIs:
+    """Matches the ExpressionAttributeValues of a set_status() write."""
+
+    def __init__(self, status, size_bytes=None):
+        self.status = status
+        self.size_bytes = size_bytes
+
+    def __eq__(self, values):
+        if self.size_bytes is not None and values.get(":size_bytes") != {"N": str(self.size_bytes)}:
+            return False
+        return values[":status"] == {"S": self.status}
+
+    def __repr__(self):
+        return f"StatusIs({self.status!r}, {self.size_bytes!r})"
+
+
+def jpeg(width=64, height=48):
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (width, height), "red").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def get_object_response(data, metadata=None):
+    return {
+        "Body": StreamingBody(io.BytesIO(data), len(data)),
+        "ContentLength": len(data),
+        "Metadata": metadata or {},
+    }
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """Stubbed S3 and DynamoDB clients of the handler, plus the uploads it made."""
+    monkeypatch.setattr(lambda_function, "status_table_name", STATUS_TABLE)
+    uploads = []
+    monkeypatch.setattr(
+        lambda_function.s3, "upload_fileobj",
+        lambda fileobj, bucket, key, ExtraArgs=None: uploads.append((bucket, key, ExtraArgs)),
+    )
+    with Stubber(lambda_function.s3) as s3, Stubber(lambda_function.dynamodb) as dynamodb:
+        yield s3, dynamodb, uploads
+        s3.assert_no_pending_responses()
+        dynamodb.assert_no_pending_responses()
+
+
+def expect_status(dynamodb, key, status, size_bytes=None):
+    dynamodb.add_response("update_item", {}, {
+        "TableName": STATUS_TABLE,
+        "Key": {"upload_key": {"S": key}},
+        "UpdateExpression": ANY,
+        "ExpressionAttributeNames": ANY,
+        "ExpressionAttributeValues": StatusIs(status, size_bytes),
+    })
+
+
+def expect_get(s3, key, data, metadata=None):
+    s3.add_response("get_object", get_object_response(data, metadata), {"Bucket": UPLOAD_BUCKET, "Key": key})
+
+
+def s3_event(key, size):
+    return {"Records": [{"s3": {"bucket": {"name": UPLOAD_BUCKET}, "object": {"key": key, "size": size}}}]}
+
+
+def inventory_event(*rows):
+    return {"Items": [{"Bucket": UPLOAD_BUCKET, **row} for row in rows]}
+
+
+def test_inventory_rows_without_size_are_not_empty(aws):
+    s3, dynamodb, uploads = aws
+    records = lambda_function.records_from_event(inventory_event({"Key": "large/a.jpg"}, {"Key": "large/b.jpg", "Size": "7"}))
+    assert [record["s3"]["object"]["size"] for record in records] == [None, 7]
+
+    data = jpeg()
+    expect_get(s3, "large/a.jpg", data)
+    expect_status(dynamodb, "large/a.jpg", "processing", size_bytes=len(data))
+    dynamodb.add_response("put_item", {})
+    expect_status(dynamodb, "large/a.jpg", "done")
+    result = lambda_function.handler(inventory_event({"Key": "large/a.jpg"}), None)
+
+    assert (result["processed"], result["rejected"]) == (1, 0)
+    assert uploads == [("processed-images-bucket", "processed-a.jpg", {"ContentType": "image/jpeg"})]
+
+
+def test_empty_objects_of_unknown_size_are_rejected_once_read(aws):
+    s3, dynamodb, _ = aws
+    expect_get(s3, "large/a.jpg", b"")
+    expect_status(dynamodb, "large/a.jpg", "failed")
+    result = lambda_function.handler(inventory_event({"Key": "large/a.jpg"}), None)
+
+    assert (result["processed"], result["rejected"]) == (0, 1)
+
+
+def test_processed_images_go_from_processing_to_done(aws):
+    s3, dynamodb, uploads = aws
+    data = jpeg(64, 48)
+    expect_get(s3, "small/a.jpg", data, {"original-filename": "IMG%200001.jpg"})
+    expect_status(dynamodb, "small/a.jpg", "processing", size_bytes=len(data))
+    dynamodb.add_response("put_item", {}, {"TableName": "image-metadata", "Item": ANY})
+    expect_status(dynamodb, "small/a.jpg", "done")
+    result = lambda_function.handler(s3_event("small/a.jpg", len(data)), None)
+
+    assert (result["processed"], result["failed"], result["rejected"]) == (1, 0, 0)
+    assert uploads == [("processed-images-bucket", "processed-a.jpg", {
+        "ContentType": "image/jpeg",
+        "CacheControl": lambda_function.IMMUTABLE_CACHE_CONTROL,
+    })]
+
+
+def test_images_that_cannot_be_decoded_fail_after_processing_starts(aws):
+    s3, dynamodb, uploads = aws
+    # A JPEG signature followed by garbage passes the sniff
+    data = b"\xff\xd8\xff\xe0" + b"\x00" * 100
+    expect_get(s3, "small/a.jpg", data)
+    expect_status(dynamodb, "small/a.jpg", "processing")
+    expect_status(dynamodb, "small/a.jpg", "failed")
+    result = lambda_function.handler(s3_event("small/a.jpg", len(data)), None)
+
+    assert (result["processed"], result["failed"]) == (0, 1)
+    assert uploads == []
+
+
+def test_rejected_objects_never_enter_processing(aws):
+    s3, dynamodb, _ = aws
+    # Empty: not even read
+    expect_status(dynamodb, "small/empty.jpg", "failed")
+    assert lambda_function.handler(s3_event("small/empty.jpg", 0), None)["rejected"] == 1
+
+    # Not an image: read up to the sniff, then only the failure is written
+    expect_get(s3, "small/notes.jpg", b"just some text, not a photo")
+    expect_status(dynamodb, "small/notes.jpg", "failed")
+    assert lambda_function.handler(s3_event("small/notes.jpg", 27), None)["rejected"] == 1
@@ -0,0 +1,42 @@
+import marshal
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+
+import model_cache  # noqa: E402
+
+CREDENTIALS = {"aws_access_key_id": "test", "aws_secret_access_key": "test"}
+
+
+def loader_of(session):
+    return session._session.get_component("data_loader")
+
+
+def test_cached_clients_resolve_endpoints(tmp_path):
+    cache_file = str(tmp_path / "botocore_models.marshal")
+    assert model_cache.build(["s3", "dynamodb"], cache_file) > 0
+    session = model_cache.create_session(cache_file)
+    assert isinstance(loader_of(session), model_cache.CachedLoader)
+
+    s3 = session.client("s3", region_name="eu-west-1", **CREDENTIALS)
+    assert s3.meta.endpoint_url == "https://s3.eu-west-1.amazonaws.com"
+    dynamodb = session.client("dynamodb", region_name="us-west-2", **CREDENTIALS)
+    assert dynamodb.meta.endpoint_url == "https://dynamodb.us-west-2.amazonaws.com"
+    # Not in the cache: loaded from disk, endpoints still resolve
+    sqs = session.client("sqs", region_name="eu-west-1", **CREDENTIALS)
+    assert sqs.meta.endpoint_url == "https://sqs.eu-west-1.amazonaws.com"
+
+
+def test_cache_from_another_botocore_is_ignored(tmp_path):
+    cache_file = str(tmp_path / "botocore_models.marshal")
+    model_cache.build(["s3"], cache_file)
+    with open(cache_file, "rb") as fp:
+        models = marshal.loads(fp.read())
+    models["tag"] = "botocore-0.0.0-" + sys.implementation.cache_tag
+    with open(cache_file, "wb") as fp:
+        marshal.dump(models, fp)
+    assert not isinstance(loader_of(model_cache.create_session(cache_file)), model_cache.CachedLoader)
+    # A missing cache is no error either
+    missing = model_cache.create_session(str(tmp_path / "missing.marshal"))
+    assert not isinstance(loader_of(missing), model_cache.CachedLoader)
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+
+import pre_resize  # noqa: E402
+
+MAX_BYTES = 200 * 1024 * 1024
+
+
+def test_declaration_is_validated():
+    assert pre_resize.declared_original(None, MAX_BYTES) is None
+    assert pre_resize.declared_original(
+        {"width": 4032, "height": 3024, "sizeBytes": 9_000_000}, MAX_BYTES) == (4032, 3024, 9_000_000)
+    for bad in ("4032x3024", {"width": 4032, "height": 3024}, {"width": 0, "height": 3024, "sizeBytes": 1},
+                {"width": True, "height": 3024, "sizeBytes": 1}, {"width": "4032", "height": 3024, "sizeBytes": 1},
+                {"width": 70000, "height": 3024, "sizeBytes": 1},
+                {"width": 4032, "height": 3024, "sizeBytes": MAX_BYTES + 1}):
+        with pytest.raises(ValueError):
+            pre_resize.declared_original(bad, MAX_BYTES)
+
+
+def test_declaration_round_trips_through_object_metadata():
+    headers = pre_resize.metadata_headers((4032, 3024, 9_000_000))
+    # S3 returns user metadata without the x-amz-meta- prefix
+    metadata = {name[len("x-amz-meta-"):]: value for name, value in headers.items()}
+    assert pre_resize.accepted_original(metadata, (2016, 1512)) == (4032, 3024, 9_000_000)
+
+
+def test_uploads_not_at_the_rendition_size_are_processed_in_full():
+    metadata = {"original-dimensions": "4033x3025", "original-size": "9000000"}
+    assert pre_resize.accepted_original(metadata, (2016, 1512)) == (4033, 3025, 9_000_000)
+    assert pre_resize.accepted_original(metadata, (4033, 3025)) is None
+    assert pre_resize.accepted_original(metadata, (1512, 2016)) is None
+    assert pre_resize.accepted_original({"original-dimensions": "big", "original-size": "1"}, (1, 1)) is None
+    assert pre_resize.accepted_original({"original-filename": "IMG_0001.jpg"}, (2016, 1512)) is None
@@ -0,0 +1,465 @@
+import json
+import os
+import sys
+
+import pytest
+from botocore.stub import Stubber
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(HERE, "..", "..", "lambda"))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "presign_lambda"))
+
+# Clients and the signer are created at import
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+import presign_handler  # noqa: E402
+
+STATUS_TABLE = "image-processing-status"
+
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    """Stubbed DynamoDB client of the presign handler."""
+    monkeypatch.setattr(presign_handler, "UPLOAD_BUCKET", "uploaded-images-bucket")
+    monkeypatch.setattr(presign_handler, "PROCESSED_BUCKET", "processed-images-bucket")
+    monkeypatch.setattr(presign_handler, "STATUS_TABLE", STATUS_TABLE)
+    monkeypatch.setattr(presign_handler, "STATS_TABLE", None)
+    monkeypatch.setattr(presign_handler, "processing_models", {})
+    with Stubber(presign_handler.dynamodb_client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def status(key, value, **attributes):
+    item = {"upload_key": {"S": key}, "status": {"S": value}}
+    if value == "done":
+        item["renditions"] = {"M": {"processed": {"S": "processed-" + key.split("/")[-1]}}}
+    item.update(attributes)
+    return item
+
+
+def expect_get(dynamodb, key, item):
+    dynamodb.add_response(
+        "get_item", {"Item": item} if item else {},
+        {"TableName": STATUS_TABLE, "Key": {"upload_key": {"S": key}}, "ConsistentRead": True},
+    )
+
+
+def get_status(key, wait=None, context=None):
+    params = {"key": key}
+    if wait is not None:
+        params["wait"] = str(wait)
+    response = presign_handler.handler(
+        {"path": "/get-processed-image-url", "queryStringParameters": params}, context)
+    return response["statusCode"], json.loads(response["body"]), response["headers"]
+
+
+def test_status_answers(dynamodb):
+    expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "done"))
+    code, body, headers = get_status("small/a.jpg")
+    assert (code, body["key"]) == (200, "processed-a.jpg")
+    assert body["url"].startswith("https://processed-images-bucket.s3.amazonaws.com/processed-a.jpg?")
+    assert headers["Cache-Control"] == "private, max-age=60"
+
+    expect_get(dynamodb, "small/b.jpg", status("small/b.jpg", "processing", size_bytes={"N": "1048576"}))
+    code, body, headers = get_status("small/b.jpg")
+    assert (code, body["status"]) == (202, "processing")
+    assert body["retryAfterMs"] > 0
+    assert int(headers["Retry-After"]) >= 1
+    assert headers["Cache-Control"] == "no-store"
+
+    expect_get(dynamodb, "small/c.jpg", status("small/c.jpg", "failed", error={"S": "not an image"}))
+    assert get_status("small/c.jpg")[:2] == (422, {"status": "failed", "error": "not an image"})
+
+    expect_get(dynamodb, "small/d.jpg", None)
+    assert get_status("small/d.jpg")[0] == 404
+    assert get_status("")[0] == 400
+
+
+class Recorded:
+    """Matches any parameter value and keeps it for the test to inspect."""
+
+    def __init__(self):
+        self.values = []
+
+    def __eq__(self, value):
+        self.values.append(value)
+        return True
+
+
+def put_keys(request_items):
+    return [request["PutRequest"]["Item"]["upload_key"]["S"] for request in request_items[STATUS_TABLE]]
+
+
+def transaction_keys(transact_items):
+    return [item["Put"]["Item"]["upload_key"]["S"] for item in transact_items]
+
+
+def generate_upload_urls(files):
+    response = presign_handler.handler(
+        {"path": "/generate-upload-urls", "body": json.dumps({"files": files})}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_batch_presign_keeps_order_and_collapses_identical_files(dynamodb):
+    same = "ab" * 32
+    files = [
+        {"filename": "IMG_0001.JPG", "contentType": "image/jpeg", "contentLength": 1000, "sha256": same},
+        {"filename": "IMG_0002.png", "contentType": "image/png", "contentLength": 6 * 2**20},
+        {"filename": "copy of IMG_0001.jpg", "contentType": "image/jpeg", "contentLength": 1000, "sha256": same},
+    ]
+    written = Recorded()
+    dynamodb.add_response("transact_write_items", {}, {"TransactItems": written})
+    code, body = generate_upload_urls(files)
+
+    assert code == 200
+    uploads = body["uploads"]
+    assert [upload["filename"] for upload in uploads] == [f["filename"] for f in files]
+    assert uploads[0]["key"] == uploads[2]["key"] == f"small/{same}.jpg"
+    assert uploads[1]["key"].startswith("large/") and uploads[1]["key"].endswith(".png")
+    # One pending item per distinct key
+    assert transaction_keys(written.values[0]) == [uploads[0]["key"], uploads[1]["key"]]
+
+
+def test_batch_presign_is_capped(dynamodb):
+    files = [{"filename": f"IMG_{i}.jpg", "contentType": "image/jpeg", "contentLength": 1000} for i in range(51)]
+    assert generate_upload_urls(files)[0] == 400
+    assert generate_upload_urls(files[:1] + [{"filename": "IMG.jpg"}])[0] == 400
+    assert generate_upload_urls([])[0] == 400
+
+
+def test_batch_put_retries_unprocessed_items(dynamodb, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(presign_handler.time, "sleep", sleeps.append)
+    items = [{"upload_key": {"S": f"small/{i}.jpg"}} for i in range(30)]
+    requests = [Recorded() for _ in range(3)]
+    # 25 per call; the throttled item is sent again before the last 5
+    dynamodb.add_response("batch_write_item", {"UnprocessedItems": {STATUS_TABLE: [
+        {"PutRequest": {"Item": items[3]}},
+    ]}}, {"RequestItems": requests[0]})
+    dynamodb.add_response("batch_write_item", {"UnprocessedItems": {}}, {"RequestItems": requests[1]})
+    dynamodb.add_response("batch_write_item", {}, {"RequestItems": requests[2]})
+    presign_handler.batch_put(STATUS_TABLE, items)
+
+    assert [put_keys(request.values[0]) for request in requests] == [
+        [f"small/{i}.jpg" for i in range(25)],
+        ["small/3.jpg"],
+        [f"small/{i}.jpg" for i in range(25, 30)],
+    ]
+    assert sleeps == [0.05]
+
+
+def test_batch_put_gives_up_when_throttled_throughout(dynamodb, monkeypatch):
+    monkeypatch.setattr(presign_handler.time, "sleep", lambda seconds: None)
+    items = [{"upload_key": {"S": "small/a.jpg"}}]
+    for _ in range(5):
+        dynamodb.add_response("batch_write_item", {"UnprocessedItems": {STATUS_TABLE: [
+            {"PutRequest": {"Item": items[0]}},
+        ]}})
+    with pytest.raises(presign_handler.ClientError):
+        presign_handler.batch_put(STATUS_TABLE, items)
+
+
+def test_every_single_put_declares_a_positive_whole_size(dynamodb):
+    for content_length in (None, -5, 0, 1.5, "1000", True):
+        file = {"filename": "IMG.jpg", "contentType": "image/jpeg"}
+        if content_length is not None:
+            file["contentLength"] = content_length
+        response = presign_handler.handler({"path": "/generate-upload-url", "body": json.dumps(file)}, None)
+        assert response["statusCode"] == 400, content_length
+        assert generate_upload_urls([file])[0] == 400, content_length
+    file = {"filename": "IMG.jpg", "contentType": "image/jpeg", "contentLength": presign_handler.MAX_UPLOAD_BYTES + 1}
+    assert generate_upload_urls([file])[0] == 413
+
+
+MULTIPART_SIZE = 20 * 2**20
+
+
+def multipart_status(upload_id="upload-1", size=MULTIPART_SIZE):
+    return status("large/a.jpg", "pending", size_bytes={"N": str(size)}, upload_id={"S": upload_id})
+
+
+def multipart(path, **body):
+    response = presign_handler.handler({"path": f"/multipart-upload/{path}", "body": json.dumps({
+        "key": "large/a.jpg", "uploadId": "upload-1", **body,
+    })}, None)
+    return response["statusCode"], json.loads(response["body"])
+
+
+def test_part_numbers_are_whole_numbers(dynamodb):
+    expect_get(dynamodb, "large/a.jpg", multipart_status())
+    code, body = multipart("parts", partNumbers=[1, 3])
+    assert code == 200
+    assert [part["partNumber"] for part in body["parts"]] == [1, 3]
+    assert "partNumber=3" in body["parts"][1]["url"]
+    for bad in ([True], [1.0], ["1"], [0], [4]):
+        expect_get(dynamodb, "large/a.jpg", multipart_status())
+        assert multipart("parts", partNumbers=bad)[0] == 400, bad
+
+
+def test_parts_are_signed_for_the_size_declared_at_create(dynamodb):
+    # A larger contentLength sent now does not add parts
+    expect_get(dynamodb, "large/a.jpg", multipart_status())
+    assert multipart("parts", contentLength=200 * 2**20, partNumbers=[4])[0] == 400
+    # Nor can another upload's size be borrowed
+    expect_get(dynamodb, "large/a.jpg", multipart_status(upload_id="upload-2"))
+    assert multipart("parts", partNumbers=[1])[0] == 404
+    expect_get(dynamodb, "large/a.jpg", None)
+    assert multipart("parts", partNumbers=[1])[0] == 404
+
+
+@pytest.fixture
+def s3():
+    """Stubbed S3 client of the presign handler."""
+    with Stubber(presign_handler.s3_client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_complete_checks_the_assembled_size(dynamodb, s3):
+    parts = [{"partNumber": n, "etag": f'"etag-{n}"'} for n in (1, 2, 3)]
+    listing = {"Bucket": "uploaded-images-bucket", "Key": "large/a.jpg", "UploadId": "upload-1"}
+
+    # A part left out: S3 would assemble a smaller object
+    expect_get(dynamodb, "large/a.jpg", multipart_status())
+    assert multipart("complete", parts=parts[:2])[0] == 400
+
+    # Parts that do not add up to the declared size
+    expect_get(dynamodb, "large/a.jpg", multipart_status())
+    s3.add_response("list_parts", {"Parts": [
+        {"PartNumber": 1, "Size": 8 * 2**20}, {"PartNumber": 2, "Size": 8 * 2**20}, {"PartNumber": 3, "Size": 1},
+    ]}, listing)
+    code, body = multipart("complete", parts=parts)
+    assert code == 400 and "declared" in body["error"]
+
+    expect_get(dynamodb, "large/a.jpg", multipart_status())
+    s3.add_response("list_parts", {"Parts": [
+        {"PartNumber": 1, "Size": 8 * 2**20}, {"PartNumber": 2, "Size": 8 * 2**20}, {"PartNumber": 3, "Size": 4 * 2**20},
+    ]}, listing)
+    s3.add_response("complete_multipart_upload", {}, {**listing, "MultipartUpload": {"Parts": [
+        {"PartNumber": n, "ETag": f'"etag-{n}"'} for n in (1, 2, 3)
+    ]}})
+    assert multipart("complete", parts=list(reversed(parts))) == (200, {"key": "large/a.jpg"})
+
+
+def test_presigning_a_processed_file_again_keeps_its_status(dynamodb):
+    done, new = "ab" * 32, "cd" * 32
+    files = [{"filename": "IMG.jpg", "contentType": "image/jpeg", "contentLength": 1000, "sha256": sha}
+             for sha in (done, new)]
+    first, second = Recorded(), Recorded()
+    # The transaction is cancelled as a whole, then sent again for the new key only
+    dynamodb.add_client_error(
+        "transact_write_items", "TransactionCanceledException",
+        modeled_fields={"CancellationReasons": [
+            {"Code": "ConditionalCheckFailed", "Item": {"subscribe_token": {"S": "stored-token"}}},
+            {"Code": "None"},
+        ]},
+        expected_params={"TransactItems": first},
+    )
+    dynamodb.add_response("transact_write_items", {}, {"TransactItems": second})
+    code, body = generate_upload_urls(files)
+
+    assert code == 200
+    # The processed file keeps the token it was first presigned with
+    assert [upload["subscribeToken"] for upload in body["uploads"]] == [
+        "stored-token", second.values[0][0]["Put"]["Item"]["subscribe_token"]["S"]]
+    assert transaction_keys(first.values[0]) == [f"small/{done}.jpg", f"small/{new}.jpg"]
+    assert transaction_keys(second.values[0]) == [f"small/{new}.jpg"]
+    put = second.values[0][0]["Put"]
+    assert put["ConditionExpression"] == "attribute_not_exists(upload_key) OR #status = :failed"
+    assert put["ExpressionAttributeValues"] == {":failed": {"S": "failed"}}
+
+    # Single presigns: the failed condition is not an error
+    dynamodb.add_client_error("put_item", "ConditionalCheckFailedException")
+    response = presign_handler.handler({"path": "/generate-upload-url", "body": json.dumps(files[0])}, None)
+    assert response["statusCode"] == 200
+
+    # Other cancellations are
+    dynamodb.add_client_error(
+        "transact_write_items", "TransactionCanceledException",
+        modeled_fields={"CancellationReasons": [{"Code": "TransactionConflict"}]},
+    )
+    assert generate_upload_urls(files[:1])[0] == 500
+
+
+class Clock:
+    """Stands in for time.monotonic and time.sleep: sleeping moves it forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Context:
+    def __init__(self, remaining_ms):
+        self.remaining_ms = remaining_ms
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(presign_handler.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(presign_handler.time, "sleep", clock.sleep)
+    return clock
+
+
+def expect_eta(monkeypatch, seconds):
+    monkeypatch.setattr(presign_handler, "estimate_seconds_left", lambda key, item: seconds)
+
+
+def test_long_poll_backs_off_until_the_deadline(dynamodb, clock, monkeypatch):
+    expect_eta(monkeypatch, 0)
+    for _ in range(7):
+        expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "processing"))
+    code, body, _ = get_status("small/a.jpg", wait=2)
+
+    assert (code, body["status"]) == (202, "processing")
+    # Doubling up to LONG_POLL_MAX_DELAY, the last sleep cut to the deadline
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5, 0.3])
+
+
+def test_long_poll_returns_once_settled(dynamodb, clock, monkeypatch):
+    expect_eta(monkeypatch, 0)
+    expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "pending"))
+    expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "processing"))
+    expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "done"))
+    assert get_status("small/a.jpg", wait=20)[0] == 200
+    assert clock.sleeps == pytest.approx([0.1, 0.2])
+
+
+def test_long_poll_answers_at_once_when_not_expected_within_the_wait(dynamodb, clock, monkeypatch):
+    expect_eta(monkeypatch, 30)
+    expect_get(dynamodb, "large/a.jpg", status("large/a.jpg", "processing"))
+    code, body, headers = get_status("large/a.jpg", wait=20)
+
+    assert (code, body["retryAfterMs"], headers["Retry-After"]) == (202, 30000, "30")
+    assert clock.sleeps == []
+
+    # Expected within the wait, but not before it runs out
+    expect_eta(monkeypatch, 1)
+    for _ in range(5):
+        expect_get(dynamodb, "large/a.jpg", status("large/a.jpg", "processing"))
+    assert get_status("large/a.jpg", wait=2)[0] == 202
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.5])
+
+
+def test_long_poll_ends_before_the_invocation_does(dynamodb, clock, monkeypatch):
+    expect_eta(monkeypatch, 0)
+    for _ in range(7):
+        expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "processing"))
+    # 3 s left in the invocation: waits 2 s, not the 20 asked for
+    get_status("small/a.jpg", wait=20, context=Context(3000))
+    assert sum(clock.sleeps) == pytest.approx(3 - presign_handler.LONG_POLL_MARGIN_SECONDS)
+
+    expect_get(dynamodb, "small/a.jpg", status("small/a.jpg", "processing"))
+    assert get_status("small/a.jpg", wait=20, context=Context(500))[0] == 202
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5, 0.3])
+
+
+def expect_batch_get(dynamodb, *items):
+    dynamodb.add_response("batch_get_item", {"Responses": {STATUS_TABLE: list(items)}})
+
+
+def get_statuses(keys, wait, context=None):
+    response = presign_handler.handler(
+        {"path": "/get-processed-image-urls", "body": json.dumps({"keys": keys, "wait": wait})}, context)
+    return json.loads(response["body"])
+
+
+def test_batch_long_poll_returns_once_any_key_settles(dynamodb, clock, monkeypatch):
+    expect_eta(monkeypatch, 0.25)
+    pending = [status("small/a.jpg", "processing"), status("small/b.jpg", "pending")]
+    expect_batch_get(dynamodb, *pending)
+    expect_batch_get(dynamodb, *pending)
+    expect_batch_get(dynamodb, pending[0], status("small/b.jpg", "done"))
+    body = get_statuses(["small/a.jpg", "small/b.jpg"], wait=20)
+
+    assert [image["status"] for image in body["images"]] == ["processing", "done"]
+    assert body["retryAfterMs"] == 250
+    assert clock.sleeps == pytest.approx([0.1, 0.2])
+
+
+def test_batch_long_poll_deadline_and_early_answer(dynamodb, clock, monkeypatch):
+    # The soonest upload is not expected within the wait
+    expect_eta(monkeypatch, 30)
+    expect_batch_get(dynamodb, status("large/a.jpg", "processing"))
+    assert get_statuses(["large/a.jpg"], wait=20)["retryAfterMs"] == 30000
+    assert clock.sleeps == []
+
+    # Held until the invocation is about to run out
+    expect_eta(monkeypatch, 0)
+    for _ in range(5):
+        expect_batch_get(dynamodb, status("large/a.jpg", "processing"))
+    get_statuses(["large/a.jpg"], wait=20, context=Context(2000))
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.4, 0.3])
+
+
+def test_files_the_processors_never_see_are_refused(dynamodb):
+    for filename in ("notes.txt", "IMG_0001", "IMG.heic", ".jpg"):
+        file = {"filename": filename, "contentType": "image/jpeg", "contentLength": 1000}
+        response = presign_handler.handler({"path": "/generate-upload-url", "body": json.dumps(file)}, None)
+        assert response["statusCode"] == 415, filename
+        ok = {**file, "filename": "IMG.JPG"}
+        assert generate_upload_urls([ok, file])[0] == 415, filename
+        file["contentLength"] = 20 * 2**20
+        response = presign_handler.handler({"path": "/multipart-upload/create", "body": json.dumps(file)}, None)
+        assert response["statusCode"] == 415, filename
+
+
+class Manager:
+    def __init__(self):
+        self.posted = []
+
+    def post(self, connection_id, message):
+        self.posted.append((connection_id, message))
+
+
+def subscribe(keys, tokens=None):
+    body = {"action": "subscribe", "keys": keys}
+    if tokens is not None:
+        body["tokens"] = tokens
+    event = {
+        "requestContext": {
+            "routeKey": "subscribe", "connectionId": "conn-1",
+            "domainName": "example.execute-api.us-east-1.amazonaws.com", "stage": "live",
+        },
+        "body": json.dumps(body),
+    }
+    return presign_handler.handler(event, None)["statusCode"]
+
+
+def test_subscribing_takes_the_token_issued_at_presign(dynamodb, monkeypatch):
+    monkeypatch.setattr(presign_handler, "CONNECTIONS_TABLE", "image-processing-connections")
+    manager = Manager()
+    monkeypatch.setattr(presign_handler, "connection_manager", lambda endpoint: manager)
+    keys = ["small/a.jpg", "small/b.jpg"]
+    tokens = {key: status(key, "pending", subscribe_token={"S": f"token-{key}"}) for key in keys}
+
+    assert subscribe(keys) == 400
+    assert subscribe(keys, ["token-small/a.jpg"]) == 400
+    for wrong in (["token-small/a.jpg", "token-small/a.jpg"], ["token-small/a.jpg", "tökén"]):
+        expect_batch_get(dynamodb, *tokens.values())
+        assert subscribe(keys, wrong) == 403
+    # Unknown keys, and items without a token, cannot be subscribed to
+    expect_batch_get(dynamodb, tokens["small/a.jpg"], status("small/b.jpg", "pending"))
+    assert subscribe(keys, ["token-small/a.jpg", ""]) == 403
+    expect_batch_get(dynamodb, tokens["small/a.jpg"])
+    assert subscribe(keys, [f"token-{key}" for key in keys]) == 403
+
+    expect_batch_get(dynamodb, *tokens.values())
+    dynamodb.add_response("batch_write_item", {})
+    expect_batch_get(dynamodb, tokens["small/a.jpg"], status("small/b.jpg", "failed"))
+    assert subscribe(keys, [f"token-{key}" for key in keys]) == 200
+    assert [message["status"] for _, message in manager.posted] == ["failed"]
@@ -0,0 +1,71 @@
+import datetime
+import os
+import sys
+
+import boto3
+from botocore.stub import Stubber
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
+
+import processing_stats  # noqa: E402
+
+TABLE = "image-processing-stats"
+MIB = processing_stats.MIB
+
+
+def totals(samples):
+    """A stats item for ``(size_mib, seconds)`` samples, as the processors add them up."""
+    item = dict.fromkeys(processing_stats.STAT_FIELDS, 0.0)
+    for mib, seconds in samples:
+        for name, value in zip(processing_stats.STAT_FIELDS, (1, mib, seconds, mib * seconds, mib * mib)):
+            item[name] += value
+    return item
+
+
+def test_fit_recovers_a_linear_model():
+    samples = [(mib, 0.4 + 0.3 * mib) for mib in (0.5, 1, 2, 4, 8, 16)]
+    base, per_mib = processing_stats.fit([totals(samples[:3]), totals(samples[3:])])
+    assert round(base, 6) == 0.4
+    assert round(per_mib, 6) == 0.3
+
+
+def test_fit_falls_back_without_enough_samples_or_slope():
+    assert processing_stats.fit([]) == processing_stats.DEFAULT_MODEL
+    assert processing_stats.fit([totals([(1, 2.0)] * 2)]) == processing_stats.DEFAULT_MODEL
+    assert processing_stats.fit([totals([(1, 2.0), (1, 4.0)] * 3)]) == (3.0, 0.0)
+
+
+def test_retry_after_is_the_time_left_within_bounds():
+    model = (1.0, 0.5)
+    assert processing_stats.retry_after(model, "processing", 4 * MIB, 1.0) == 2.0
+    assert processing_stats.retry_after(model, "pending", 4 * MIB, 1.0) == 2.0 + processing_stats.QUEUE_SECONDS
+    assert processing_stats.retry_after(model, "processing", 4 * MIB, 60.0) == processing_stats.MIN_RETRY_AFTER
+    assert processing_stats.retry_after(model, "processing", 500 * MIB, 0.0) == processing_stats.MAX_RETRY_AFTER
+
+
+def test_record_adds_to_the_hourly_item():
+    dynamodb = boto3.client(
+        "dynamodb",
+        region_name="us-east-1",
+        aws_access_key_id="test",
+        aws_secret_access_key="test",
+    )
+    now = datetime.datetime(2025, 9, 10, 14, 30, tzinfo=datetime.timezone.utc)
+    with Stubber(dynamodb) as stubber:
+        stubber.add_response("update_item", {}, {
+            "TableName": TABLE,
+            "Key": {"period": {"S": "large#2025091014"}},
+            "UpdateExpression": "ADD samples :samples, sum_mib :sum_mib, sum_seconds :sum_seconds, "
+                                "sum_mib_seconds :sum_mib_seconds, sum_mib_squared :sum_mib_squared "
+                                "SET expires_at = :expires_at",
+            "ExpressionAttributeValues": {
+                ":samples": {"N": "1.000000"},
+                ":sum_mib": {"N": "2.000000"},
+                ":sum_seconds": {"N": "1.500000"},
+                ":sum_mib_seconds": {"N": "3.000000"},
+                ":sum_mib_squared": {"N": "4.000000"},
+                ":expires_at": {"N": str(int((now + datetime.timedelta(days=1)).timestamp()))},
+            },
+        })
+        processing_stats.record(dynamodb, TABLE, "large", 2 * MIB, 1.5, now=now)
+    assert processing_stats.period_keys("large", now) == ["large#2025091014", "large#2025091013"]
@@ -0,0 +1,153 @@
+import datetime
+import os
+import sys
+from unittest import mock
+
+import boto3
+import botocore.auth
+import pytest
+from botocore.config import Config
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "presign_lambda"))
+
+from sigv4_presign import SigV4Presigner  # noqa: E402
+
+NOW = datetime.datetime(2025, 9, 10, 12, 34, 56)
+
+KEYS = [
+    "small/photo.jpg",
+    "large/IMG 0001 (1).JPG",
+    "small/été/naïve+plus=equals&amp.png",
+    "small/~tilde/percent%20already.webp",
+]
+
+
+def frozen_botocore_clock():
+    # botocore >= 1.36 reads the clock through get_current_datetime()
+    if hasattr(botocore.auth, "get_current_datetime"):
+        return mock.patch.object(botocore.auth, "get_current_datetime", return_value=NOW)
+    clock = mock.Mock(wraps=datetime)
+    clock.datetime.utcnow.return_value = NOW
+    return mock.patch.object(botocore.auth, "datetime", clock)
+
+
+def make_presigner(region, token=None):
+    session = boto3.Session(
+        aws_access_key_id="AKIDEXAMPLE",
+        aws_secret_access_key="wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+        aws_session_token=token,
+        region_name=region,
+    )
+    client = session.client("s3", config=Config(signature_version="s3v4"))
+    return client, SigV4Presigner(client, session.get_credentials())
+
+
+@pytest.mark.parametrize("region", ["us-east-1", "eu-west-1"])
+@pytest.mark.parametrize("token", [None, "FwoGZXIvYXdzE/token+with=chars"])
+@pytest.mark.parametrize("bucket", ["uploaded-images-bucket-20250910", "dotted.bucket.name"])
+@pytest.mark.parametrize("key", KEYS)
+def test_put_object_matches_botocore(region, token, bucket, key):
+    client, presigner = make_presigner(region, token)
+    with frozen_botocore_clock():
+        expected = client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": bucket, "Key": key, "ContentType": "image/jpeg", "ContentLength": 1234},
+            ExpiresIn=3600,
+        )
+    actual = presigner.presign(
+        "PUT", bucket, key, 3600,
+        headers={"Content-Type": "image/jpeg", "Content-Length": 1234}, now=NOW,
+    )
+    assert actual == expected
+
+
+@pytest.mark.parametrize("key", KEYS)
+def test_put_object_without_length_matches_botocore(key):
+    client, presigner = make_presigner("us-east-1")
+    with frozen_botocore_clock():
+        expected = client.generate_presigned_url(
+            "put_object",
+            Params={"Bucket": "uploaded-images-bucket-20250910", "Key": key, "ContentType": "image/png"},
+            ExpiresIn=3600,
+        )
+    actual = presigner.presign(
+        "PUT", "uploaded-images-bucket-20250910", key, 3600,
+        headers={"Content-Type": "image/png"}, now=NOW,
+    )
+    assert actual == expected
+
+
+def test_put_object_with_metadata_and_checksum_matches_botocore():
+    client, presigner = make_presigner("us-east-1", "token")
+    key = "small/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08.jpg"
+    checksum = "n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg="
+    filename = "IMG%200001%20%C3%A9t%C3%A9.jpg"
+    with frozen_botocore_clock():
+        expected = client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": "uploaded-images-bucket-20250910",
+                "Key": key,
+                "ContentType": "image/jpeg",
+                "ContentLength": 1234,
+                "Metadata": {"original-filename": filename},
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=3600,
+        )
+    actual = presigner.presign(
+        "PUT", "uploaded-images-bucket-20250910", key, 3600,
+        headers={
+            "Content-Type": "image/jpeg",
+            "x-amz-meta-original-filename": filename,
+            "x-amz-checksum-sha256": checksum,
+            "Content-Length": 1234,
+        },
+        now=NOW,
+    )
+    assert actual == expected
+
+
+@pytest.mark.parametrize("key", KEYS)
+def test_get_object_matches_botocore(key):
+    client, presigner = make_presigner("eu-west-1", "token")
+    with frozen_botocore_clock():
+        expected = client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": "processed-images-bucket-20250910", "Key": key},
+            ExpiresIn=3600,
+        )
+    actual = presigner.presign("GET", "processed-images-bucket-20250910", key, 3600, now=NOW)
+    assert actual == expected
+
+
+@pytest.mark.parametrize("part_number", [1, 2, 10000])
+def test_upload_part_matches_botocore(part_number):
+    client, presigner = make_presigner("us-east-1", "token")
+    upload_id = "VXBsb2FkIElEIGZvciA2aWWpbmcncyBteS1tb3ZpZS5tMnRzIHVwbG9hZA--"
+    with frozen_botocore_clock():
+        expected = client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": "uploaded-images-bucket-20250910",
+                "Key": "large/scan.tiff",
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+                "ContentLength": 8388608,
+            },
+            ExpiresIn=3600,
+        )
+    actual = presigner.presign(
+        "PUT", "uploaded-images-bucket-20250910", "large/scan.tiff", 3600,
+        query=[("uploadId", upload_id), ("partNumber", part_number)],
+        headers={"Content-Length": 8388608}, now=NOW,
+    )
+    assert actual == expected
+
+
+def test_endpoint_resolved_once_per_bucket():
+    client, presigner = make_presigner("us-east-1")
+    with mock.patch.object(client, "generate_presigned_url", wraps=client.generate_presigned_url) as resolve:
+        for key in KEYS:
+            presigner.presign("GET", "processed-images-bucket-20250910", key, now=NOW)
+    assert resolve.call_count == 1
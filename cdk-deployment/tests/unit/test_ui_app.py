@@ -0,0 +1,244 @@
+import importlib.util
+import os
+import sys
+from urllib.parse import unquote_plus
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+pytest.importorskip("flask")
+
+UI_APP = os.path.join(os.path.dirname(__file__), "..", "..", "..", "ui_app", "app.py")
+STATUS_TABLE = "image-processing-status"
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "test")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "test")
+
+# Loaded by path: cdk-deployment/app.py is the CDK app
+spec = importlib.util.spec_from_file_location("ui_app", UI_APP)
+ui = importlib.util.module_from_spec(spec)
+# Flask finds its static folder through the module
+sys.modules["ui_app"] = ui
+spec.loader.exec_module(ui)
+
+
+class Recorded:
+    """Matches any parameter value and keeps it for the test to inspect."""
+
+    def __init__(self):
+        self.values = []
+
+    def __eq__(self, value):
+        self.values.append(value)
+        return True
+
+
+@pytest.fixture
+def client():
+    return ui.app.test_client()
+
+
+@pytest.fixture
+def dynamodb():
+    """Stub of the one DynamoDB resource in the app's pool."""
+    resource = boto3.resource("dynamodb", region_name="us-east-1")
+    while not ui.idle_resources.empty():
+        ui.idle_resources.get_nowait()
+    ui.idle_resources.put((resource, {}))
+    with Stubber(resource.meta.client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_batch_presign_keeps_order_and_collapses_identical_files(client, dynamodb):
+    same = "cd" * 32
+    files = [
+        {"filename": "IMG_0001.jpg", "contentType": "image/jpeg", "contentLength": 1000, "sha256": same},
+        {"filename": "IMG_0002.jpg", "contentType": "image/jpeg", "contentLength": 6 * 2**20},
+        {"filename": "IMG_0001 (1).jpg", "contentType": "image/jpeg", "contentLength": 1000, "sha256": same},
+    ]
+    written = [Recorded(), Recorded()]
+    # Already uploaded by someone else: the pending write is refused
+    dynamodb.add_client_error(
+        "put_item", "ConditionalCheckFailedException",
+        modeled_fields={"Item": {"subscribe_token": {"S": "stored-token"}}},
+        expected_params={
+            "TableName": STATUS_TABLE, "Item": written[0],
+            "ConditionExpression": ANY, "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        },
+    )
+    dynamodb.add_response("put_item", {}, {
+        "TableName": STATUS_TABLE, "Item": written[1],
+        "ConditionExpression": ANY, "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+    })
+    response = client.post("/generate-upload-urls", json={"files": files})
+
+    assert response.status_code == 200
+    uploads = response.get_json()["uploads"]
+    assert [upload["filename"] for upload in uploads] == [f["filename"] for f in files]
+    assert uploads[0]["key"] == uploads[2]["key"] == f"small/{same}.jpg"
+    assert uploads[1]["key"].startswith("large/")
+    # One pending write per distinct key
+    assert [w.values[0]["upload_key"]["S"] for w in written] == [uploads[0]["key"], uploads[1]["key"]]
+    # Identical files share the token already stored, new keys get their own
+    assert uploads[0]["subscribeToken"] == uploads[2]["subscribeToken"] == "stored-token"
+    assert uploads[1]["subscribeToken"] == written[1].values[0]["subscribe_token"]["S"]
+
+
+def test_batch_presign_is_capped(client, dynamodb):
+    files = [{"filename": f"IMG_{i}.jpg", "contentType": "image/jpeg", "contentLength": 1000} for i in range(51)]
+    assert client.post("/generate-upload-urls", json={"files": files}).status_code == 400
+    assert client.post("/generate-upload-urls", json={"files": []}).status_code == 400
+
+
+def test_every_single_put_declares_a_positive_whole_size(client, dynamodb):
+    for query in ("", "&contentLength=-5", "&contentLength=0", "&contentLength=1.5"):
+        assert client.get(f"/generate-upload-url?filename=IMG.jpg&contentType=image/jpeg{query}").status_code == 400
+    for content_length in (None, -5, 1.5, "1000", True):
+        file = {"filename": "IMG.jpg", "contentType": "image/jpeg", "contentLength": content_length}
+        assert client.post("/generate-upload-urls", json={"files": [file]}).status_code == 400
+
+
+def test_status_batch_reads_unprocessed_keys_again(client, dynamodb, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(ui.time, "sleep", sleeps.append)
+    keys = ["small/a.jpg", "small/b.jpg"]
+    failed = {"upload_key": {"S": "small/a.jpg"}, "status": {"S": "failed"}}
+    dynamodb.add_response("batch_get_item", {
+        "Responses": {STATUS_TABLE: [failed]},
+        "UnprocessedKeys": {STATUS_TABLE: {"Keys": [{"upload_key": {"S": "small/b.jpg"}}], "ConsistentRead": True}},
+    })
+    dynamodb.add_response("batch_get_item", {
+        "Responses": {STATUS_TABLE: [{"upload_key": {"S": "small/b.jpg"}, "status": {"S": "failed"}}]},
+    }, {"RequestItems": {STATUS_TABLE: {"Keys": [{"upload_key": "small/b.jpg"}], "ConsistentRead": True}}})
+    response = client.post("/get-processed-image-urls", json={"keys": keys})
+
+    # Throttled keys are not reported as unknown
+    assert [image["status"] for image in response.get_json()["images"]] == ["failed", "failed"]
+    assert sleeps == [0.05]
+
+    for _ in range(5):
+        dynamodb.add_response("batch_get_item", {
+            "Responses": {},
+            "UnprocessedKeys": {STATUS_TABLE: {"Keys": [{"upload_key": {"S": "small/a.jpg"}}]}},
+        })
+    assert client.post("/get-processed-image-urls", json={"keys": keys[:1]}).status_code == 500
+
+
+def test_files_the_processors_never_see_are_refused(client, dynamodb):
+    for filename in ("notes.txt", "IMG_0001"):
+        query = f"filename={filename}&contentType=image/jpeg&contentLength=1000"
+        assert client.get(f"/generate-upload-url?{query}").status_code == 415
+        files = [{"filename": name, "contentType": "image/jpeg", "contentLength": 1000}
+                 for name in ("IMG.JPG", filename)]
+        assert client.post("/generate-upload-urls", json={"files": files}).status_code == 415
+
+
+def test_the_page_loads_the_versioned_script_from_the_static_route(client):
+    page = client.get("/").get_data(as_text=True)
+    src = f'/static/uploader.js?v={ui.asset_version("uploader.js")}'
+    assert f'<script src="{src}">' in page
+    response = client.get(src)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == ui.http_caching.IMMUTABLE
+    response.close()
+
+
+MULTIPART_SIZE = 20 * 2**20
+
+
+@pytest.fixture
+def s3():
+    """Stub of the app's S3 client."""
+    with Stubber(ui.s3_client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def expect_multipart_status(dynamodb, upload_id="upload-1", size=MULTIPART_SIZE):
+    dynamodb.add_response("get_item", {"Item": {
+        "upload_key": {"S": "large/a.jpg"}, "status": {"S": "pending"},
+        "size_bytes": {"N": str(size)}, "upload_id": {"S": upload_id},
+    }}, {"TableName": STATUS_TABLE, "Key": {"upload_key": "large/a.jpg"}, "ConsistentRead": True})
+
+
+def multipart(client, path, **body):
+    response = client.post(f"/multipart-upload/{path}", json={"key": "large/a.jpg", "uploadId": "upload-1", **body})
+    return response.status_code, response.get_json()
+
+
+def test_multipart_create_stores_the_declared_size(client, dynamodb, s3):
+    s3.add_response("create_multipart_upload", {"UploadId": "upload-1"}, {
+        "Bucket": ui.UPLOAD_BUCKET, "Key": ANY, "ContentType": "image/jpeg",
+        "Metadata": {"original-filename": "IMG.JPG"},
+    })
+    written = Recorded()
+    dynamodb.add_response("put_item", {}, {"TableName": STATUS_TABLE, "Item": written})
+    code, body = multipart(client, "create", filename="IMG.JPG", contentType="image/jpeg", contentLength=MULTIPART_SIZE)
+
+    assert code == 200
+    assert body["key"].startswith("large/") and body["key"].endswith(".jpg")
+    assert (body["partSize"], body["partCount"]) == (8 * 2**20, 3)
+    item = written.values[0]
+    assert item["upload_id"] == {"S": "upload-1"}
+    assert item["size_bytes"] == {"N": str(MULTIPART_SIZE)}
+    assert item["subscribe_token"] == {"S": body["subscribeToken"]}
+
+
+def test_multipart_parts_are_signed_for_the_size_declared_at_create(client, dynamodb):
+    expect_multipart_status(dynamodb)
+    code, body = multipart(client, "parts", partNumbers=[1, 3])
+    assert code == 200
+    assert [part["partNumber"] for part in body["parts"]] == [1, 3]
+    assert "uploadId=upload-1" in body["parts"][1]["url"] and "partNumber=3" in body["parts"][1]["url"]
+    for bad in ([True], ["1"], [0], [4]):
+        expect_multipart_status(dynamodb)
+        assert multipart(client, "parts", partNumbers=bad)[0] == 400, bad
+    # Another upload's size cannot be borrowed
+    expect_multipart_status(dynamodb, upload_id="upload-2")
+    assert multipart(client, "parts", partNumbers=[1])[0] == 404
+
+
+def test_multipart_complete_checks_the_assembled_size(client, dynamodb, s3):
+    parts = [{"partNumber": n, "etag": f'"etag-{n}"'} for n in (1, 2, 3)]
+    listing = {"Bucket": ui.UPLOAD_BUCKET, "Key": "large/a.jpg", "UploadId": "upload-1"}
+
+    expect_multipart_status(dynamodb)
+    assert multipart(client, "complete", parts=parts[:2])[0] == 400
+
+    expect_multipart_status(dynamodb)
+    s3.add_response("list_parts", {"Parts": [
+        {"PartNumber": 1, "Size": 8 * 2**20}, {"PartNumber": 2, "Size": 8 * 2**20}, {"PartNumber": 3, "Size": 1},
+    ]}, listing)
+    code, body = multipart(client, "complete", parts=parts)
+    assert code == 400 and "declared" in body["error"]
+
+    expect_multipart_status(dynamodb)
+    s3.add_response("list_parts", {"Parts": [
+        {"PartNumber": 1, "Size": 8 * 2**20}, {"PartNumber": 2, "Size": 8 * 2**20}, {"PartNumber": 3, "Size": 4 * 2**20},
+    ]}, listing)
+    s3.add_response("complete_multipart_upload", {}, {**listing, "MultipartUpload": {"Parts": [
+        {"PartNumber": n, "ETag": f'"etag-{n}"'} for n in (1, 2, 3)
+    ]}})
+    assert multipart(client, "complete", parts=list(reversed(parts))) == (200, {"key": "large/a.jpg"})
+
+
+def test_local_uploads_invoke_the_processor_only_where_the_stack_would(monkeypatch):
+    monkeypatch.syspath_prepend(os.path.dirname(UI_APP))
+    import local_aws
+
+    submitted = []
+    monkeypatch.setattr(local_aws, "upload_bucket", ui.UPLOAD_BUCKET)
+    monkeypatch.setattr(local_aws, "image_suffixes", (".jpg", ".JPG"))
+    monkeypatch.setattr(local_aws.executor, "submit", lambda fn, event: submitted.append(event))
+
+    for bucket, key in ((ui.UPLOAD_BUCKET, "small/a.txt"), (ui.UPLOAD_BUCKET, "originals/a.jpg"),
+                        (ui.UPLOAD_BUCKET, "small/a.Jpg"), (ui.PROCESSED_BUCKET, "small/a.jpg")):
+        assert not local_aws.object_created(bucket, key, 1)
+    assert local_aws.object_created(ui.UPLOAD_BUCKET, "large/a b.JPG", 30, "ObjectCreated:CompleteMultipartUpload")
+    [record] = submitted[0]["Records"]
+    assert record["eventName"] == "ObjectCreated:CompleteMultipartUpload"
+    assert unquote_plus(record["s3"]["object"]["key"]) == "large/a b.JPG"
+    assert record["s3"]["object"]["size"] == 30
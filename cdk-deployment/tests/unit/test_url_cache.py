@@ -0,0 +1,65 @@
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "presign_lambda"))
+
+from url_cache import SignedUrlCache  # noqa: E402
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_identical_requests_share_a_url():
+    cache = SignedUrlCache(clock=Clock())
+    sign = mock.Mock(side_effect=["url-1", "url-2"])
+    assert cache.get("GET", "processed", "processed-a.jpg", sign) == "url-1"
+    assert cache.get("GET", "processed", "processed-a.jpg", sign) == "url-1"
+    assert sign.call_count == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_signed_headers_are_part_of_the_key():
+    cache = SignedUrlCache(clock=Clock())
+    sign = mock.Mock(side_effect=["png", "jpeg", "jpeg-1234", "get"])
+    assert cache.get("PUT", "uploads", "small/a", sign, {"Content-Type": "image/png"}) == "png"
+    assert cache.get("PUT", "uploads", "small/a", sign, {"Content-Type": "image/jpeg"}) == "jpeg"
+    headers = {"Content-Type": "image/jpeg", "Content-Length": 1234}
+    assert cache.get("PUT", "uploads", "small/a", sign, headers) == "jpeg-1234"
+    assert cache.get("PUT", "uploads", "small/a", sign, dict(reversed(headers.items()))) == "jpeg-1234"
+    assert cache.get("GET", "uploads", "small/a", sign) == "get"
+    assert cache.stats() == {"hits": 1, "misses": 4, "evictions": 0, "size": 4}
+
+
+def test_entries_expire_after_ttl():
+    clock = Clock()
+    cache = SignedUrlCache(expires_in=3600, ttl=300, clock=clock)
+    sign = mock.Mock(side_effect=["url-1", "url-2"])
+    cache.get("GET", "processed", "k", sign)
+    clock.now += 299
+    assert cache.get("GET", "processed", "k", sign) == "url-1"
+    clock.now += 1
+    assert cache.get("GET", "processed", "k", sign) == "url-2"
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SignedUrlCache(maxsize=2, clock=Clock())
+    cache.get("GET", "b", "a", lambda: "a")
+    cache.get("GET", "b", "b", lambda: "b")
+    cache.get("GET", "b", "a", lambda: "a-again")
+    cache.get("GET", "b", "c", lambda: "c")
+    assert cache.get("GET", "b", "a", lambda: "a-new") == "a"
+    assert cache.get("GET", "b", "b", lambda: "b-new") == "b-new"
+    assert cache.stats()["evictions"] == 2
+
+
+def test_ttl_must_leave_most_of_the_validity():
+    with pytest.raises(ValueError):
+        SignedUrlCache(expires_in=600, ttl=400)
@@ -1,7 +1,35 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, g, request, jsonify, render_template, make_response
 import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config
 from botocore.exceptions import ClientError
+import base64
+import datetime
+import hashlib
+import math
 import os
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import quote
+
+# The URL signing and cache, the /images representation and the caching
+# policies are shared with the presign Lambda
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cdk-deployment", "presign_lambda"))
+import http_caching  # noqa: E402
+import image_resource  # noqa: E402
+from sigv4_presign import SigV4Presigner  # noqa: E402
+from url_cache import SignedUrlCache  # noqa: E402
+# ...and so are the processing-time statistics and the pre-resize
+# declarations. Appended: lambda/ also vendors boto3, which must not
+# shadow the installed one.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cdk-deployment", "lambda"))
+import pre_resize  # noqa: E402
+import processing_stats  # noqa: E402
 
 app = Flask(__name__)
 
@@ -9,62 +37,625 @@ app = Flask(__name__)
 # These should match the bucket names in your CDK stack
 UPLOAD_BUCKET = "uploaded-images-bucket-20250910"
 PROCESSED_BUCKET = "processed-images-bucket-20250910"
-REGION = boto3.Session().region_name or "us-east-1"
+STATUS_TABLE = "image-processing-status"
+STATS_TABLE = "image-processing-stats"
+# The metadata table's name is generated; copy the stack's MetadataTableName
+# output. Without it /images leaves out sizes and dimensions.
+METADATA_TABLE = os.environ.get("METADATA_TABLE")
+# The stack's NotificationsWebSocketUrl output: the page then gets results
+# pushed instead of polling for them. Not used in local mode.
+NOTIFICATIONS_WEBSOCKET_URL = os.environ.get("NOTIFICATIONS_WEBSOCKET_URL", "")
+# Extensions the stack's bucket notifications route to a processor; other
+# files are refused with 415 (same as the presign Lambda). Add the suffixes
+# of the stack's extra_image_formats here when they are enabled; local mode
+# routes the same ones.
+IMAGE_SUFFIXES = tuple(os.environ.get("IMAGE_SUFFIXES", ".jpg,.jpeg,.png,.webp,.gif").split(","))
+# UI_LOCAL=1 runs the whole pipeline offline: S3 and DynamoDB in memory,
+# uploads processed in-process by the Lambda handler (see local_aws.py)
+LOCAL_MODE = os.environ.get("UI_LOCAL") == "1"
+if LOCAL_MODE:
+    import local_aws  # noqa: E402
+    METADATA_TABLE = METADATA_TABLE or local_aws.METADATA_TABLE
+    local_aws.start(UPLOAD_BUCKET, PROCESSED_BUCKET, STATUS_TABLE, STATS_TABLE, IMAGE_SUFFIXES, METADATA_TABLE)
+    app.register_blueprint(local_aws.blueprint)
+session = boto3.Session()
+REGION = session.region_name or "us-east-1"
+# Uploads larger than this go under large/ and are handled by the large-image processor tier
+LARGE_IMAGE_THRESHOLD_BYTES = 5 * 1024 * 1024
+# Most files one /generate-upload-urls request may sign (same as the presign Lambda)
+MAX_BATCH_UPLOADS = 50
+# Most keys one /get-processed-image-urls request may ask about (same as the presign Lambda)
+MAX_STATUS_KEYS = 100
+# Multipart uploads: the part size and the most part URLs one
+# /multipart-upload/parts request may sign (same as the presign Lambda)
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+MAX_PART_URLS = 100
+# Declared sizes above this are refused (same as the presign Lambda)
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# Client-computed content hashes: hex SHA-256 of the whole file
+SHA256_HEX = re.compile(r'[0-9a-fA-F]{64}')
+# Presigned URLs last an hour; identical requests within five minutes get
+# the same URL back (same settings as the presign Lambda)
+URL_EXPIRES_IN = 3600
+URL_CACHE_TTL = 300
+# Longest /get-processed-image-url?wait= a request is held for, re-reading
+# the status with a delay doubling from 100 ms to 500 ms (same as the Lambda)
+LONG_POLL_MAX_SECONDS = 20
+# Processing-time models fitted from the stats table are reused this long
+STATS_MODEL_TTL = 60
 
-s3_client = boto3.client('s3', region_name=REGION)
+# One S3 client per process (gunicorn workers import the app after the
+# fork), used to sign URLs and for the multipart calls: SigV4 so the
+# signed Content-Length is enforced by S3, through the presign Lambda's
+# fast path.
+s3_client = session.client('s3', region_name=REGION, config=Config(signature_version='s3v4'))
+presigner = SigV4Presigner(s3_client, session.get_credentials())
+if LOCAL_MODE:
+    # URLs of this app's /local-s3 routes
+    presigner = local_aws.LocalPresigner()
+# boto3 resources must not be shared between threads: each request
+# borrows a (resource, {table name: Table}) pair from this pool, which grows
+# to the number of concurrent requests. Kept-alive connections and the
+# Table objects (a few ms each to build) are reused with it.
+dynamodb_config = Config(tcp_keepalive=True, retries={'mode': 'standard'})
+idle_resources = queue.SimpleQueue()
+# Creating clients from one session is not thread-safe either
+session_lock = threading.Lock()
+url_cache = SignedUrlCache(expires_in=URL_EXPIRES_IN, ttl=URL_CACHE_TTL)
+# tier -> (processing-time model, time.monotonic() it was fitted at)
+processing_models = {}
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # In local mode the page talks to this app instead of API Gateway. The
+    # script URL carries a hash of its content, so the script is cached for
+    # good and the page itself is revalidated by ETag.
+    response = make_response(render_template(
+        'index.html',
+        api_base_url=request.host_url.rstrip('/') if LOCAL_MODE else '',
+        websocket_url='' if LOCAL_MODE else NOTIFICATIONS_WEBSOCKET_URL,
+        asset_version=asset_version('uploader.js'),
+    ))
+    response.headers['Cache-Control'] = http_caching.REVALIDATE
+    response.add_etag()
+    return response.make_conditional(request)
+
+def asset_version(filename):
+    with open(os.path.join(app.static_folder, filename), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+@app.after_request
+def cache_and_compress(response):
+    # Responses that do not set a policy are not stored (see http_caching.py)
+    if request.endpoint == 'static' and request.args.get('v'):
+        response.headers['Cache-Control'] = http_caching.IMMUTABLE
+    response.headers.setdefault('Cache-Control', http_caching.NO_STORE)
+
+    if not http_caching.compressible(response.mimetype):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = http_caching.preferred_encoding(request.headers.get('Accept-Encoding'))
+    if response.status_code != 200 or encoding is None or 'Content-Encoding' in response.headers:
+        return response
+    # Static files are sent from disk unless read here
+    response.direct_passthrough = False
+    data = response.get_data()
+    if len(data) < http_caching.MIN_COMPRESSION_BYTES:
+        return response
+    response.set_data(http_caching.compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    if 'ETag' in response.headers:
+        response.headers['ETag'] = http_caching.weak_etag(response.headers['ETag'])
+    return response
+
+def presign_upload(filename, content_type, content_length, sha256=None, original=None):
+    key = upload_key_for(filename, content_length, sha256)
+
+    # Headers the browser's PUT must send; the filename is kept as metadata
+    headers = {
+        "Content-Type": content_type,
+        "x-amz-meta-original-filename": quote(filename),
+    }
+    if original is not None:
+        # Downscaled in the browser: the original's dimensions and size too
+        headers.update(pre_resize.metadata_headers(original))
+    if sha256:
+        # S3 rejects a body whose SHA-256 does not match
+        headers["x-amz-checksum-sha256"] = base64.b64encode(bytes.fromhex(sha256)).decode()
+    # Browsers set Content-Length themselves; it is signed but not returned.
+    # S3 rejects a body of any other size.
+    signed_headers = {**headers, "Content-Length": content_length}
+    presigned_url = url_cache.get(
+        'PUT', UPLOAD_BUCKET, key,
+        lambda: presigner.presign('PUT', UPLOAD_BUCKET, key, URL_EXPIRES_IN, headers=signed_headers),
+        headers=signed_headers,
+    )
+    return {"url": presigned_url, "key": key, "headers": headers}
+
+def upload_key_for(filename, content_length, sha256=None):
+    # Keys are never the client's filename, so uploads cannot overwrite each
+    # other: the content hash when the client sent one, else a random UUID.
+    # Only the extension is kept, for the bucket notifications' suffix filters;
+    # the routes refuse files without one of IMAGE_SUFFIXES first.
+    stem = sha256.lower() if sha256 else uuid.uuid4().hex
+    extension = image_extension(filename)
+    # The key prefix selects the processor tier through the bucket notifications
+    tier = "large" if content_length > LARGE_IMAGE_THRESHOLD_BYTES else "small"
+    return f"{tier}/{stem}{extension}"
+
+def valid_sha256(sha256):
+    return sha256 is None or (isinstance(sha256, str) and SHA256_HEX.fullmatch(sha256) is not None)
+
+def valid_content_length(content_length):
+    # Required and signed into every URL, as in the presign Lambda
+    return isinstance(content_length, int) and not isinstance(content_length, bool) and content_length > 0
+
+def too_large(content_length):
+    return content_length > MAX_UPLOAD_BYTES
+
+def image_extension(filename):
+    # The lower-cased extension if the notifications route it, else None
+    if not isinstance(filename, str):
+        return None
+    extension = os.path.splitext(filename)[1].lower()
+    return extension if extension in IMAGE_SUFFIXES else None
+
+def status_item(key, status, size_bytes=None, subscribe_token=None, upload_id=None, error=None):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    item = {
+        "upload_key": key,
+        "status": status,
+        "updated_at": now.isoformat(),
+        "expires_at": int((now + datetime.timedelta(days=7)).timestamp()),
+    }
+    # The declared size, from which the status endpoint estimates an ETA
+    if size_bytes is not None:
+        item["size_bytes"] = int(size_bytes)
+    # What the presign Lambda's WebSocket subscriptions must present
+    if subscribe_token is not None:
+        item["subscribe_token"] = subscribe_token
+    # Multipart uploads: the upload the declared size belongs to
+    if upload_id is not None:
+        item["upload_id"] = upload_id
+    if error is not None:
+        item["error"] = error
+    return item
+
+def put_pending(key, size_bytes):
+    # Only new keys and failed uploads become pending: identical bytes
+    # presigned again must not reset a done upload (as in the presign Lambda).
+    # Returns the key's subscribe token, new or the one already stored.
+    token = secrets.token_urlsafe(16)
+    try:
+        status_table().put_item(
+            Item=status_item(key, "pending", size_bytes, token),
+            ConditionExpression=Attr("upload_key").not_exists() | Attr("status").eq("failed"),
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        # Error responses are not deserialized by the Table resource
+        return e.response.get("Item", {}).get("subscribe_token", {}).get("S")
+    return token
+
+def dynamodb():
+    # This request's DynamoDB resource
+    if "dynamodb" not in g:
+        try:
+            g.dynamodb = idle_resources.get_nowait()
+        except queue.Empty:
+            with session_lock:
+                g.dynamodb = (session.resource('dynamodb', region_name=REGION, config=dynamodb_config), {})
+    return g.dynamodb[0]
+
+def table(name):
+    resource = dynamodb()
+    tables = g.dynamodb[1]
+    if name not in tables:
+        tables[name] = resource.Table(name)
+    return tables[name]
+
+@app.teardown_appcontext
+def release_dynamodb(exception):
+    borrowed = g.pop("dynamodb", None)
+    if borrowed is not None:
+        idle_resources.put(borrowed)
+
+def status_table():
+    return table(STATUS_TABLE)
+
+def processing_model(tier):
+    # Same model and refresh interval as the presign Lambda
+    cached = processing_models.get(tier)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < STATS_MODEL_TTL:
+        return cached[0]
+    model = processing_stats.DEFAULT_MODEL
+    keys = processing_stats.period_keys(tier, datetime.datetime.now(datetime.timezone.utc))
+    try:
+        items = dynamodb().batch_get_item(RequestItems={STATS_TABLE: {
+            "Keys": [{"period": key} for key in keys],
+        }})["Responses"].get(STATS_TABLE, [])
+        model = processing_stats.fit(items)
+    except ClientError as e:
+        app.logger.warning(f"Could not read processing stats: {e}")
+    processing_models[tier] = (model, now)
+    return model
+
+def estimate_seconds_left(key, item):
+    elapsed = 0.0
+    if "updated_at" in item:
+        updated_at = datetime.datetime.fromisoformat(item["updated_at"])
+        elapsed = (datetime.datetime.now(datetime.timezone.utc) - updated_at).total_seconds()
+    tier = "large" if key.startswith("large/") else "small"
+    return processing_stats.retry_after(
+        processing_model(tier), item["status"], int(item.get("size_bytes", 0)), elapsed)
 
 @app.route('/generate-upload-url')
 def generate_upload_url():
     filename = request.args.get('filename')
     content_type = request.args.get('contentType')
+    content_length = request.args.get('contentLength', type=int)
+    sha256 = request.args.get('sha256')
 
     if not filename or not content_type:
         return jsonify({"error": "Missing filename or contentType"}), 400
+    if not valid_sha256(sha256):
+        return jsonify({"error": "sha256 must be 64 hex digits"}), 400
+    if not valid_content_length(content_length):
+        return jsonify({"error": "contentLength must be a positive whole number of bytes"}), 400
+    if too_large(content_length):
+        return jsonify({"error": f"Files are limited to {MAX_UPLOAD_BYTES} bytes"}), 413
+    if image_extension(filename) is None:
+        return jsonify({"error": f"Only {', '.join(IMAGE_SUFFIXES)} files are accepted"}), 415
+
+    try:
+        upload = presign_upload(filename, content_type, content_length, sha256)
+        # The processor moves this on to processing, done or failed
+        upload["subscribeToken"] = put_pending(upload["key"], content_length)
+        return jsonify(upload)
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/generate-upload-urls', methods=['POST'])
+def generate_upload_urls():
+    body = request.get_json(silent=True)
+    files = body.get("files") if isinstance(body, dict) else None
+    if not isinstance(files, list) or not files:
+        return jsonify({"error": "Missing files"}), 400
+    if len(files) > MAX_BATCH_UPLOADS:
+        return jsonify({"error": f"At most {MAX_BATCH_UPLOADS} files per request"}), 400
+    if not all(isinstance(f, dict) and f.get("filename") and f.get("contentType") for f in files):
+        return jsonify({"error": "Missing filename or contentType"}), 400
+    if not all(valid_sha256(f.get("sha256")) for f in files):
+        return jsonify({"error": "sha256 must be 64 hex digits"}), 400
+    if not all(valid_content_length(f.get("contentLength")) for f in files):
+        return jsonify({"error": "contentLength must be a positive whole number of bytes"}), 400
+    if any(too_large(f["contentLength"]) for f in files):
+        return jsonify({"error": f"Files are limited to {MAX_UPLOAD_BYTES} bytes"}), 413
+    if any(image_extension(f["filename"]) is None for f in files):
+        return jsonify({"error": f"Only {', '.join(IMAGE_SUFFIXES)} files are accepted"}), 415
+    try:
+        originals = [pre_resize.declared_original(f.get("preResized"), MAX_UPLOAD_BYTES) for f in files]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        uploads = [
+            {
+                "filename": f["filename"],
+                **presign_upload(f["filename"], f["contentType"], f["contentLength"], f.get("sha256"), original),
+            }
+            for f, original in zip(files, originals)
+        ]
+        # One conditional write per distinct key: identical files share one
+        tokens = {
+            key: put_pending(key, size)
+            for key, size in {upload["key"]: f["contentLength"] for upload, f in zip(uploads, files)}.items()
+        }
+        for upload in uploads:
+            upload["subscribeToken"] = tokens[upload["key"]]
+        return jsonify({"uploads": uploads})
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/multipart-upload/create', methods=['POST'])
+def create_multipart_upload():
+    # Files above the page's multipart threshold; same contract as the
+    # presign Lambda's route
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Invalid JSON in request body"}), 400
+    filename = body.get("filename")
+    content_type = body.get("contentType")
+    content_length = body.get("contentLength")
+
+    if not filename or not content_type or content_length is None:
+        return jsonify({"error": "Missing filename, contentType or contentLength"}), 400
+    if not valid_content_length(content_length):
+        return jsonify({"error": "contentLength must be a positive whole number of bytes"}), 400
+    if too_large(content_length):
+        return jsonify({"error": f"Files are limited to {MAX_UPLOAD_BYTES} bytes"}), 413
+    if image_extension(filename) is None:
+        return jsonify({"error": f"Only {', '.join(IMAGE_SUFFIXES)} files are accepted"}), 415
+
+    try:
+        key = upload_key_for(filename, content_length)
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=UPLOAD_BUCKET, Key=key, ContentType=content_type,
+            Metadata={"original-filename": quote(filename)},
+        )["UploadId"]
+        # The declared size binds the parts and the completed object
+        token = secrets.token_urlsafe(16)
+        status_table().put_item(Item=status_item(key, "pending", content_length, token, upload_id))
+        return jsonify({
+            "key": key,
+            "uploadId": upload_id,
+            "subscribeToken": token,
+            "partSize": MULTIPART_PART_SIZE,
+            "partCount": math.ceil(content_length / MULTIPART_PART_SIZE),
+        })
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/multipart-upload/parts', methods=['POST'])
+def presign_upload_parts():
+    # Each URL signs the exact length of its part, from the size stored at create
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Invalid JSON in request body"}), 400
+    key = body.get("key")
+    upload_id = body.get("uploadId")
+    part_numbers = body.get("partNumbers")
+
+    if not key or not upload_id or not isinstance(part_numbers, list) or not part_numbers:
+        return jsonify({"error": "Missing key, uploadId or partNumbers"}), 400
+    if len(part_numbers) > MAX_PART_URLS:
+        return jsonify({"error": f"At most {MAX_PART_URLS} parts per request"}), 400
+    try:
+        content_length = declared_multipart_size(key, upload_id)
+        if content_length is None:
+            return jsonify({"error": "Unknown multipart upload"}), 404
+        part_count = math.ceil(content_length / MULTIPART_PART_SIZE)
+        # bool is an int too
+        if not all(isinstance(n, int) and not isinstance(n, bool) and 1 <= n <= part_count for n in part_numbers):
+            return jsonify({"error": f"partNumbers must be between 1 and {part_count}"}), 400
 
+        parts = []
+        for part_number in part_numbers:
+            part_size = min(MULTIPART_PART_SIZE, content_length - (part_number - 1) * MULTIPART_PART_SIZE)
+            url = presigner.presign(
+                'PUT', UPLOAD_BUCKET, key, URL_EXPIRES_IN,
+                query=[("uploadId", upload_id), ("partNumber", part_number)],
+                headers={"Content-Length": part_size},
+            )
+            parts.append({"partNumber": part_number, "url": url})
+        return jsonify({"parts": parts})
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/multipart-upload/complete', methods=['POST'])
+def complete_multipart_upload():
+    # Every part must be listed and the parts S3 holds must add up to the
+    # declared size; otherwise 400 and nothing is assembled
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Invalid JSON in request body"}), 400
+    key = body.get("key")
+    upload_id = body.get("uploadId")
+    parts = body.get("parts")
+
+    if not key or not upload_id or not isinstance(parts, list) or not parts:
+        return jsonify({"error": "Missing key, uploadId or parts"}), 400
+    try:
+        parts = sorted(
+            ({"PartNumber": int(part["partNumber"]), "ETag": part["etag"]} for part in parts),
+            key=lambda part: part["PartNumber"],
+        )
+    except (TypeError, ValueError, KeyError):
+        return jsonify({"error": "Invalid JSON in request body"}), 400
     try:
-        presigned_url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={
-                'Bucket': UPLOAD_BUCKET,
-                'Key': filename,
-                'ContentType': content_type
-            },
-            ExpiresIn=3600  # URL expires in 1 hour
+        content_length = declared_multipart_size(key, upload_id)
+        if content_length is None:
+            return jsonify({"error": "Unknown multipart upload"}), 404
+        part_count = math.ceil(content_length / MULTIPART_PART_SIZE)
+        if [part["PartNumber"] for part in parts] != list(range(1, part_count + 1)):
+            return jsonify({"error": f"All {part_count} parts must be listed"}), 400
+        uploaded = uploaded_part_sizes(key, upload_id)
+        if sum(uploaded.get(part["PartNumber"], 0) for part in parts) != content_length:
+            return jsonify({"error": f"The parts do not add up to the declared {content_length} bytes"}), 400
+
+        s3_client.complete_multipart_upload(
+            Bucket=UPLOAD_BUCKET, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts},
         )
-        return jsonify({"url": presigned_url})
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("InvalidPart", "InvalidPartOrder", "EntityTooSmall", "NoSuchUpload"):
+            return jsonify({"error": e.response["Error"]["Message"]}), 400
+        return jsonify({"error": str(e)}), 500
+    if LOCAL_MODE:
+        # What the bucket notification does for S3
+        local_aws.object_created(UPLOAD_BUCKET, key, content_length, "ObjectCreated:CompleteMultipartUpload")
+    return jsonify({"key": key})
+
+@app.route('/multipart-upload/abort', methods=['POST'])
+def abort_multipart_upload():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"error": "Invalid JSON in request body"}), 400
+    key = body.get("key")
+    upload_id = body.get("uploadId")
+    if not key or not upload_id:
+        return jsonify({"error": "Missing key or uploadId"}), 400
+    try:
+        s3_client.abort_multipart_upload(Bucket=UPLOAD_BUCKET, Key=key, UploadId=upload_id)
+        status_table().put_item(Item=status_item(key, "failed", error="The upload was aborted"))
+        return jsonify({"key": key})
     except ClientError as e:
         return jsonify({"error": str(e)}), 500
 
+def declared_multipart_size(key, upload_id):
+    # The size declared when upload_id was created for key, or None
+    item = status_table().get_item(Key={"upload_key": key}, ConsistentRead=True).get("Item")
+    if item is None or item.get("upload_id") != upload_id or "size_bytes" not in item:
+        return None
+    return int(item["size_bytes"])
+
+def uploaded_part_sizes(key, upload_id):
+    # Part number -> size of the parts S3 holds for upload_id
+    sizes = {}
+    paginator = s3_client.get_paginator("list_parts")
+    for page in paginator.paginate(Bucket=UPLOAD_BUCKET, Key=key, UploadId=upload_id):
+        sizes.update((part["PartNumber"], part["Size"]) for part in page.get("Parts", []))
+    return sizes
+
 @app.route('/get-processed-image-url')
 def get_processed_image_url():
-    filename = request.args.get('filename')
-    if not filename:
-        return jsonify({"error": "Missing filename"}), 400
+    key = request.args.get('key')
+    if not key:
+        return jsonify({"error": "Missing key"}), 400
+    wait = request.args.get('wait', default=0, type=int)
+    deadline = time.monotonic() + min(max(wait, 0), LONG_POLL_MAX_SECONDS)
+    delay = 0.1
 
     try:
-        # First, check if the object exists
-        s3_client.head_object(Bucket=PROCESSED_BUCKET, Key=filename)
-
-        # If it exists, generate the presigned URL
-        presigned_url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={
-                'Bucket': PROCESSED_BUCKET,
-                'Key': filename
-            },
-            ExpiresIn=3600 # URL expires in 1 hour
-        )
-        return jsonify({"url": presigned_url})
+        while True:
+            # One consistent read of the status the processor maintains
+            item = status_table().get_item(Key={"upload_key": key}, ConsistentRead=True).get("Item")
+            if item is None:
+                return jsonify({"error": "Unknown upload key"}), 404
+
+            status = item["status"]
+            if status in ("done", "failed"):
+                break
+            remaining = deadline - time.monotonic()
+            eta = estimate_seconds_left(key, item)
+            if remaining <= 0 or eta > remaining:
+                # Pending or processing: the client polls again after the hint
+                return jsonify({"status": status, "retryAfterMs": int(eta * 1000)}), 202, {
+                    "Retry-After": str(max(math.ceil(eta), 1)),
+                }
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+        if status == "failed":
+            return jsonify({"status": status, "error": item.get("error", "Processing failed")}), 422
+
+        processed_key = item["renditions"]["processed"]
+        return jsonify({"status": status, "url": download_url(processed_key), "key": processed_key}), 200, {
+            "Cache-Control": http_caching.FINISHED,
+        }
     except ClientError as e:
-        # If the error is a 404 Not Found, it means the file is not processed yet
-        if e.response['Error']['Code'] == '404':
-            return jsonify({"error": "File not found"}), 404
-        # For other errors, return a 500
         return jsonify({"error": str(e)}), 500
 
+def get_statuses(keys):
+    # Status items for keys (at most 100), in no particular order. Throttled
+    # keys come back as UnprocessedKeys and are read again with backoff, as
+    # in the presign Lambda; a key still missing would read as unknown.
+    items = []
+    request_items = {STATUS_TABLE: {"Keys": [{"upload_key": key} for key in keys], "ConsistentRead": True}}
+    for attempt in range(5):
+        response = dynamodb().batch_get_item(RequestItems=request_items)
+        items += response["Responses"].get(STATUS_TABLE, [])
+        request_items = response.get("UnprocessedKeys")
+        if not request_items:
+            return items
+        time.sleep(0.05 * 2 ** attempt)
+    raise ClientError(
+        {"Error": {"Code": "UnprocessedKeys", "Message": "Status reads were throttled"}},
+        "BatchGetItem",
+    )
+
+@app.route('/get-processed-image-urls', methods=['POST'])
+def get_processed_image_urls():
+    # The status of many uploads in one (long-)poll, as in the presign Lambda:
+    # held until one of them is done, failed or unknown, or none is expected
+    # before the wait is over
+    body = request.get_json(silent=True)
+    keys = body.get("keys") if isinstance(body, dict) else None
+    if not isinstance(keys, list) or not keys or not all(isinstance(key, str) and key for key in keys):
+        return jsonify({"error": "Missing keys"}), 400
+    if len(keys) > MAX_STATUS_KEYS:
+        return jsonify({"error": f"At most {MAX_STATUS_KEYS} keys per request"}), 400
+    try:
+        wait = min(max(int(body.get("wait") or 0), 0), LONG_POLL_MAX_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "wait must be a whole number of seconds"}), 400
+    deadline = time.monotonic() + wait
+    delay = 0.1
+
+    try:
+        while True:
+            # BatchGetItem rejects a key listed twice
+            items = {item["upload_key"]: item for item in get_statuses(list(dict.fromkeys(keys)))}
+            etas = {
+                key: estimate_seconds_left(key, item)
+                for key, item in items.items()
+                if item["status"] not in ("done", "failed")
+            }
+            remaining = deadline - time.monotonic()
+            if len(etas) < len(set(keys)) or remaining <= 0 or min(etas.values()) > remaining:
+                break
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+        images = []
+        for key in keys:
+            item = items.get(key)
+            if item is None:
+                images.append({"key": key, "status": "unknown"})
+            elif item["status"] == "done":
+                processed_key = item["renditions"]["processed"]
+                images.append({"key": key, "status": "done", "url": download_url(processed_key),
+                               "processedKey": processed_key})
+            elif item["status"] == "failed":
+                images.append({"key": key, "status": "failed", "error": item.get("error", "Processing failed")})
+            else:
+                images.append({"key": key, "status": item["status"], "retryAfterMs": int(etas[key] * 1000)})
+        result = {"images": images}
+        if etas:
+            result["retryAfterMs"] = int(min(etas.values()) * 1000)
+        return jsonify(result)
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/images/<path:key>')
+def get_image(key):
+    # Status, original and renditions in one response, revalidated by ETag
+    # (see image_resource.py); a 304 costs one status read
+    try:
+        item = status_table().get_item(Key={"upload_key": key}, ConsistentRead=True).get("Item")
+        if item is None:
+            return jsonify({"error": "Unknown upload key"}), 404
+
+        tag = image_resource.etag(key, item, time.time(), URL_CACHE_TTL)
+        headers = {"ETag": tag, "Cache-Control": http_caching.REVALIDATE}
+        if image_resource.not_modified(request.headers.get("If-None-Match"), tag):
+            return "", 304, headers
+
+        metadata_item = None
+        if item["status"] == "done" and METADATA_TABLE:
+            items = table(METADATA_TABLE).query(
+                KeyConditionExpression=Key("image_key").eq(key),
+                ScanIndexForward=False,
+                Limit=1,
+            )["Items"]
+            metadata_item = items[0] if items else None
+        return jsonify(image_resource.representation(key, item, metadata_item, download_url)), 200, headers
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 500
+
+def download_url(processed_key):
+    # A stable URL for repeated polls lets the browser reuse its cached copy
+    return url_cache.get(
+        'GET', PROCESSED_BUCKET, processed_key,
+        lambda: presigner.presign('GET', PROCESSED_BUCKET, processed_key, URL_EXPIRES_IN),
+    )
+
+@app.route('/url-cache-stats')
+def url_cache_stats():
+    # Hits, misses, evictions and current size of the signed-URL cache
+    return jsonify(url_cache.stats())
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
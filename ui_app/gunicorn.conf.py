@@ -0,0 +1,25 @@
+"""Gunicorn settings for ``wsgi:app``, overridable through the environment.
+
+UI_BIND     address to listen on (default 0.0.0.0:8000)
+UI_WORKERS  worker processes (default 2 per CPU + 1)
+UI_THREADS  request threads per worker (default 8)
+
+Each worker imports the app itself (no ``preload_app``), so it creates its
+own boto3 clients after the fork instead of inheriting the master's
+connection pools. Long polls of /get-processed-image-url hold a thread for
+up to 20 s: workers * threads bounds the requests served at once, long
+polls included.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("UI_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("UI_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("UI_THREADS", 8))
+# Idle keep-alive connections from a fronting proxy or load balancer
+keepalive = 75
+# Recycle workers now and then; the jitter keeps them from restarting together
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = "-"
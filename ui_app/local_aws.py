@@ -0,0 +1,187 @@
+"""Offline mode for the Flask app: the whole pipeline in one process.
+
+With ``UI_LOCAL=1`` the app runs against in-memory S3 and DynamoDB (moto's
+``mock_aws``), so no AWS account or network is needed:
+
+- ``start()`` creates the buckets and tables the stack would and imports
+  the real processor (``cdk-deployment/lambda/lambda_function.py``) against
+  them.
+- ``LocalPresigner`` stands in for the SigV4 presigner: its URLs point at
+  this app's ``/local-s3/<bucket>/<key>`` routes instead of S3.
+- A PUT to the upload bucket stores the object and invokes the processor's
+  ``handler`` with a synthetic S3 event, on a small thread pool as Lambda
+  would run it asynchronously; a GET serves any stored object. Only keys
+  the stack's bucket notifications match invoke it (``object_created()``).
+- A PUT with ``uploadId`` and ``partNumber`` uploads a part of a multipart
+  upload; the app's complete route calls ``object_created()`` itself.
+
+Local URLs are not signed and nothing checks them. Everything lives in one
+process: run the app with ``python app.py`` or a single gunicorn worker.
+"""
+import base64
+import hashlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, quote_plus, urlencode
+
+import boto3
+from botocore.exceptions import ClientError, ParamValidationError
+from flask import Blueprint, Response, jsonify, request
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cdk-deployment", "lambda")
+METADATA_TABLE = "image-metadata"
+# Concurrent processor invocations, like the function's reserved concurrency
+PROCESSORS = int(os.environ.get("UI_LOCAL_PROCESSORS", 4))
+# The stack's notification prefixes, one per processor tier
+PROCESSOR_PREFIXES = ("small/", "large/")
+
+blueprint = Blueprint("local_aws", __name__)
+processor = None
+upload_bucket = None
+# The notifications' suffix filters, which are case sensitive
+image_suffixes = ()
+s3 = None
+executor = ThreadPoolExecutor(max_workers=PROCESSORS, thread_name_prefix="processor")
+
+
+def start(upload, processed, status_table, stats_table, suffixes, metadata_table=METADATA_TABLE):
+    """Start the in-memory AWS, create the stack's resources and load the processor.
+
+    ``suffixes`` are the image extensions the notifications route; as in the
+    stack, their upper-case forms are routed too. Must run before the app
+    creates its boto3 session and clients, which moto only intercepts when
+    they are created after it started.
+    """
+    global processor, upload_bucket, image_suffixes, s3
+    from moto import mock_aws
+
+    # Credentials and region for every client, none of them real
+    for name, value in (("AWS_ACCESS_KEY_ID", "local"), ("AWS_SECRET_ACCESS_KEY", "local"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        os.environ.setdefault(name, value)
+    mock_aws().start()
+
+    session = boto3.Session()
+    s3 = session.client("s3")
+    for bucket in (upload, processed):
+        s3.create_bucket(Bucket=bucket)
+    dynamodb = session.client("dynamodb")
+    for table, keys in (
+        (status_table, [("upload_key", "HASH")]),
+        (stats_table, [("period", "HASH")]),
+        (metadata_table, [("image_key", "HASH"), ("timestamp", "RANGE")]),
+    ):
+        dynamodb.create_table(
+            TableName=table,
+            KeySchema=[{"AttributeName": name, "KeyType": kind} for name, kind in keys],
+            AttributeDefinitions=[{"AttributeName": name, "AttributeType": "S"} for name, _ in keys],
+            BillingMode="PAY_PER_REQUEST",
+        )
+
+    # The processor reads its configuration at import, as in Lambda
+    os.environ.update(
+        PROCESSED_BUCKET=processed,
+        METADATA_TABLE=metadata_table,
+        STATUS_TABLE=status_table,
+        STATS_TABLE=stats_table,
+    )
+    if LAMBDA_DIR not in sys.path:
+        sys.path.append(LAMBDA_DIR)
+    import lambda_function
+
+    processor = lambda_function
+    upload_bucket = upload
+    image_suffixes = tuple(dict.fromkeys(form for suffix in suffixes for form in (suffix, suffix.upper())))
+
+
+class LocalPresigner:
+    """``SigV4Presigner.presign`` for the local routes: the same call, unsigned URLs."""
+
+    def presign(self, method, bucket, key, expires_in=3600, query=(), headers=None, now=None):
+        url = f"{request.host_url}local-s3/{bucket}/{quote(key)}"
+        # Multipart parts carry their uploadId and partNumber
+        return f"{url}?{urlencode(query)}" if query else url
+
+
+@blueprint.route("/local-s3/<bucket>/<path:key>", methods=["PUT"])
+def put_object(bucket, key):
+    body = request.get_data()
+    if "uploadId" in request.args:
+        return upload_part(bucket, key, body)
+    params = {
+        "Bucket": bucket,
+        "Key": key,
+        "Body": body,
+        "ContentType": request.content_type or "binary/octet-stream",
+        "Metadata": {
+            name[len("x-amz-meta-"):]: value
+            for name, value in request.headers.items()
+            if name.lower().startswith("x-amz-meta-")
+        },
+    }
+    checksum = request.headers.get("x-amz-checksum-sha256")
+    if checksum is not None:
+        # S3 refuses bodies that do not match the signed checksum
+        if base64.b64encode(hashlib.sha256(body).digest()).decode() != checksum:
+            return jsonify({"error": "BadDigest"}), 400
+        params["ChecksumSHA256"] = checksum
+    try:
+        response = s3.put_object(**params)
+    except ClientError as e:
+        return jsonify({"error": str(e)}), 404
+
+    object_created(bucket, key, len(body))
+    return "", 200, {"ETag": response["ETag"]}
+
+
+def upload_part(bucket, key, body):
+    try:
+        response = s3.upload_part(
+            Bucket=bucket, Key=key, Body=body,
+            UploadId=request.args["uploadId"], PartNumber=request.args.get("partNumber", type=int),
+        )
+    except (ClientError, ParamValidationError) as e:
+        return jsonify({"error": str(e)}), 404
+    return "", 200, {"ETag": response["ETag"]}
+
+
+def object_created(bucket, key, size, event_name="ObjectCreated:Put"):
+    """Invoke the processor for a new object, if the stack's notifications would.
+
+    Only the upload bucket notifies, for keys under one of the tiers'
+    prefixes that end in one of the image suffixes.
+    """
+    if bucket != upload_bucket or not key.startswith(PROCESSOR_PREFIXES) or not key.endswith(image_suffixes):
+        return False
+    # S3 event notifications carry the key URL-encoded
+    event = {"Records": [{
+        "eventSource": "aws:s3",
+        "eventName": event_name,
+        "s3": {
+            "bucket": {"name": bucket},
+            "object": {"key": quote_plus(key), "size": size},
+        },
+    }]}
+    executor.submit(invoke_processor, event)
+    return True
+
+
+@blueprint.route("/local-s3/<bucket>/<path:key>", methods=["GET"])
+def get_object(bucket, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError:
+        return jsonify({"error": "NoSuchKey"}), 404
+    headers = {"ETag": response["ETag"]}
+    if "CacheControl" in response:
+        headers["Cache-Control"] = response["CacheControl"]
+    return Response(response["Body"].read(), content_type=response["ContentType"], headers=headers)
+
+
+def invoke_processor(event):
+    try:
+        processor.handler(event, None)
+    except Exception:
+        # Lambda would log the error and retry; the status item already says failed
+        processor.logger.exception("Local processor invocation failed")
@@ -0,0 +1,739 @@
+// Filled in by the Flask app in local mode (UI_LOCAL=1); opened as a
+// file, or served by the app otherwise, the page uses API Gateway
+const apiBaseUrlOverride = document.querySelector(
+  'meta[name="api-base-url"]'
+).content;
+const API_BASE_URL =
+  /^https?:/.test(apiBaseUrlOverride)
+    ? apiBaseUrlOverride
+    : "https://dcimmehj41.execute-api.us-east-1.amazonaws.com/prod";
+// The NotificationsWebSocketUrl stack output, filled in by the Flask app
+// from NOTIFICATIONS_WEBSOCKET_URL like the API base URL above. Results
+// are pushed over it as soon as each image is processed; without it (a
+// page opened as a file, or the local Flask app) the page polls instead.
+const websocketUrlOverride = document.querySelector(
+  'meta[name="websocket-url"]'
+).content;
+const WEBSOCKET_URL = /^wss?:/.test(websocketUrlOverride)
+  ? websocketUrlOverride
+  : "";
+
+const dropZone = document.getElementById("drop-zone");
+const fileInput = document.getElementById("imageUpload");
+const uploadBtn = document.getElementById("upload-btn");
+const previewContainer = document.getElementById("preview-container");
+const imagePreview = document.getElementById("image-preview");
+const statusArea = document.getElementById("status-area");
+const resultCard = document.getElementById("result-card");
+const processedImages = document.getElementById("processed-images");
+const uploadQueue = document.getElementById("upload-queue");
+const preResizeCheckbox = document.getElementById("pre-resize");
+// Matches MAX_BATCH_UPLOADS in the presign service
+const MAX_BATCH_UPLOADS = 50;
+// Matches IMAGE_SUFFIXES in the presign service (add the stack's
+// extra_image_formats when enabled). Other files are refused there, and
+// one of them would fail the whole batch they are presigned with.
+const IMAGE_SUFFIXES = [".jpg", ".jpeg", ".png", ".webp", ".gif"];
+// Files above this go up as parallel multipart parts, each retried on
+// its own, instead of one PUT that restarts from zero on any error
+const MULTIPART_THRESHOLD = 16 * 1024 * 1024;
+const PART_CONCURRENCY = 4;
+const PART_RETRIES = 3;
+// Matches MAX_PART_URLS in the presign service
+const MAX_PART_URLS = 100;
+// Files uploading at once; the rest wait their turn in the queue. A
+// multipart upload takes one slot (its parts have their own limit).
+const UPLOAD_CONCURRENCY = 4;
+// One status poll covers every uploaded file still processing
+// (MAX_STATUS_KEYS per request, as in the presign service). It is a long
+// poll: the server holds it for up to LONG_POLL_SECONDS (its own cap is
+// 20) and answers as soon as one of the files is done or failed. Files
+// that finish uploading meanwhile join it after POLL_COALESCE_MS, so a
+// stream of uploads restarts it at most that often. When nothing is done,
+// the answer carries retryAfterMs, the server's estimate of the time
+// until the next file is; the next poll follows it, jittered by +/-20%.
+// After errors the delay doubles from FIRST_BACKOFF_MS up to
+// MAX_BACKOFF_MS. A file is given up on after POLL_TIMEOUT_MS, extended
+// while the server still expects it (up to MAX_POLL_TIMEOUT_MS).
+const MAX_STATUS_KEYS = 100;
+const POLL_COALESCE_MS = 1000;
+const LONG_POLL_SECONDS = 20;
+const POLL_TIMEOUT_MS = 30000;
+const MAX_POLL_TIMEOUT_MS = 6 * 60 * 1000;
+const FIRST_BACKOFF_MS = 250;
+const MAX_BACKOFF_MS = 15000;
+// With "Downscale large photos" checked, JPEG and WebP files of at least
+// PRE_RESIZE_MIN_BYTES are scaled in a worker to the size the processor
+// would produce (half of each dimension) and uploaded instead, declared
+// as preResized so the processor only re-encodes them. The re-encode is
+// high quality because the processor encodes once more. Other files, and
+// browsers without OffscreenCanvas, upload the original.
+const PRE_RESIZE_MIN_BYTES = 2 * 1024 * 1024;
+const PRE_RESIZE_TYPES = ["image/jpeg", "image/webp"];
+const PRE_RESIZE_QUALITY = 0.92;
+
+// Every file added to the page, as {source, row, state, ...}; the
+// states are the keys of STATE_LABELS, in order
+const queue = [];
+const STATE_LABELS = {
+  selected: "Selected",
+  queued: "Queued",
+  preparing: "Preparing",
+  uploading: "Uploading",
+  processing: "Processing",
+  done: "Done",
+  failed: "Failed",
+};
+
+// --- Drag and Drop Event Listeners ---
+dropZone.addEventListener("click", () => fileInput.click());
+dropZone.addEventListener("dragover", (e) => {
+  e.preventDefault();
+  dropZone.classList.add("dragover");
+});
+dropZone.addEventListener("dragleave", () => {
+  dropZone.classList.remove("dragover");
+});
+dropZone.addEventListener("drop", (e) => {
+  e.preventDefault();
+  dropZone.classList.remove("dragover");
+  handleFiles(e.dataTransfer.files);
+});
+fileInput.addEventListener("change", () => {
+  handleFiles(fileInput.files);
+});
+
+function handleFiles(files) {
+  const images = Array.from(files).filter((file) =>
+    file.type.startsWith("image/")
+  );
+  if (images.length === 0) {
+    showAlert("Please select an image file.", "danger");
+    return;
+  }
+  previewContainer.classList.remove("d-none");
+  imagePreview.src = URL.createObjectURL(images[0]);
+  // Files already uploading carry on; these wait for the button
+  for (const file of images) {
+    const entry = createEntry(file);
+    // The service signs every URL for the file's size, which must be positive
+    if (file.size === 0) setState(entry, "failed", "empty file");
+    else if (!hasImageSuffix(file.name))
+      setState(entry, "failed", "unsupported file type");
+    queue.push(entry);
+  }
+  uploadBtn.disabled = false;
+  updateSummary();
+}
+
+function hasImageSuffix(filename) {
+  const dot = filename.lastIndexOf(".");
+  return dot > 0 && IMAGE_SUFFIXES.includes(filename.slice(dot).toLowerCase());
+}
+
+function createEntry(file) {
+  const row = document.createElement("li");
+  row.className = "list-group-item";
+  row.innerHTML =
+    '<div class="d-flex justify-content-between gap-2"><span class="text-truncate"></span><small class="text-nowrap"></small></div>' +
+    '<div class="progress mt-1" style="height: 4px"><div class="progress-bar" role="progressbar" style="width: 0%"></div></div>';
+  row.querySelector("span").textContent = file.name;
+  uploadQueue.appendChild(row);
+  const entry = { source: file, row };
+  setState(entry, "selected");
+  return entry;
+}
+
+function setState(entry, state, detail) {
+  entry.state = state;
+  const label = entry.row.querySelector("small");
+  label.textContent = detail
+    ? `${STATE_LABELS[state]}: ${detail}`
+    : STATE_LABELS[state];
+  label.className = `text-nowrap ${
+    { done: "text-success", failed: "text-danger" }[state] || "text-muted"
+  }`;
+  const bar = entry.row.querySelector(".progress-bar");
+  bar.classList.toggle("bg-success", state === "done");
+  bar.classList.toggle("bg-danger", state === "failed");
+  bar.classList.toggle("progress-bar-striped", state === "processing");
+  bar.classList.toggle("progress-bar-animated", state === "processing");
+  if (["processing", "done", "failed"].includes(state)) setProgress(entry, 1);
+  updateSummary();
+}
+
+function setProgress(entry, fraction) {
+  const percent = Math.round(fraction * 100);
+  entry.row.querySelector(".progress-bar").style.width = `${percent}%`;
+  if (entry.state === "uploading")
+    entry.row.querySelector("small").textContent = `Uploading ${percent}%`;
+}
+
+// One line with the number of files in each state
+function updateSummary() {
+  const counts = {};
+  for (const { state } of queue) counts[state] = (counts[state] || 0) + 1;
+  const parts = Object.keys(STATE_LABELS)
+    .filter((state) => counts[state])
+    .map((state) => `${counts[state]} ${STATE_LABELS[state].toLowerCase()}`);
+  const busy = queue.some(
+    ({ state }) => !["selected", "done", "failed"].includes(state)
+  );
+  const type = busy
+    ? "info"
+    : counts.failed
+    ? "warning"
+    : counts.done
+    ? "success"
+    : "info";
+  showAlert(
+    `${queue.length} image${queue.length === 1 ? "" : "s"}: ${parts.join(", ")}`,
+    type
+  );
+}
+
+function showAlert(message, type = "info") {
+  statusArea.innerHTML = `<div class="alert alert-${type}" role="alert">${message}</div>`;
+}
+
+// Hex SHA-256 of a file, or undefined where Web Crypto is unavailable
+// (it needs a secure context). The presign API uses it as the upload
+// key and S3 checks the uploaded bytes against it.
+async function sha256Hex(file) {
+  if (!window.crypto || !crypto.subtle) return undefined;
+  const digest = await crypto.subtle.digest(
+    "SHA-256",
+    await file.arrayBuffer()
+  );
+  return Array.from(new Uint8Array(digest), (b) =>
+    b.toString(16).padStart(2, "0")
+  ).join("");
+}
+
+// Runs in the resize worker: decode, scale to the rendition size and
+// encode as JPEG. Answers null when that fails or is not smaller.
+function resizeWorkerMain() {
+  self.onmessage = async ({ data: { id, file, quality } }) => {
+    let result = null;
+    try {
+      const bitmap = await createImageBitmap(file);
+      const width = Math.max(Math.floor(bitmap.width / 2), 1);
+      const height = Math.max(Math.floor(bitmap.height / 2), 1);
+      const canvas = new OffscreenCanvas(width, height);
+      const context = canvas.getContext("2d");
+      context.imageSmoothingQuality = "high";
+      context.drawImage(bitmap, 0, 0, width, height);
+      const blob = await canvas.convertToBlob({ type: "image/jpeg", quality });
+      if (blob.size < file.size)
+        result = {
+          blob,
+          original: {
+            width: bitmap.width,
+            height: bitmap.height,
+            sizeBytes: file.size,
+          },
+        };
+      bitmap.close();
+    } catch (error) {
+      // Undecodable here: the processor gets the original
+    }
+    self.postMessage({ id, result });
+  };
+}
+
+let resizeWorker;
+let resizeRequests = 0;
+const pendingResizes = new Map();
+
+// Started on first use from resizeWorkerMain's source, so it needs no
+// separate script (and works with the page opened from disk); null where
+// workers cannot draw
+function getResizeWorker() {
+  if (resizeWorker !== undefined) return resizeWorker;
+  resizeWorker = null;
+  if (!window.Worker || !window.OffscreenCanvas || !window.createImageBitmap)
+    return resizeWorker;
+  try {
+    const source = new Blob([`(${resizeWorkerMain})()`], {
+      type: "text/javascript",
+    });
+    resizeWorker = new Worker(URL.createObjectURL(source));
+  } catch (error) {
+    return resizeWorker;
+  }
+  resizeWorker.onmessage = ({ data: { id, result } }) => {
+    pendingResizes.get(id)(result);
+    pendingResizes.delete(id);
+  };
+  resizeWorker.onerror = () => {
+    pendingResizes.forEach((resolve) => resolve(null));
+    pendingResizes.clear();
+  };
+  return resizeWorker;
+}
+
+// {file, original} to upload: a downscaled copy with the declaration of
+// its original, or the file itself without one
+async function prepareUpload(file) {
+  const worker =
+    preResizeCheckbox.checked &&
+    file.size >= PRE_RESIZE_MIN_BYTES &&
+    PRE_RESIZE_TYPES.includes(file.type)
+      ? getResizeWorker()
+      : null;
+  if (!worker) return { file, original: undefined };
+  const id = ++resizeRequests;
+  const result = await new Promise((resolve) => {
+    pendingResizes.set(id, resolve);
+    worker.postMessage({ id, file, quality: PRE_RESIZE_QUALITY });
+  });
+  // Multipart uploads carry no declaration: keep the original for those
+  if (!result || result.blob.size > MULTIPART_THRESHOLD)
+    return { file, original: undefined };
+  return {
+    file: new File([result.blob], file.name, { type: "image/jpeg" }),
+    original: result.original,
+  };
+}
+
+// Presigned PUT URLs for all prepared uploads, one request per
+// MAX_BATCH_UPLOADS
+async function presignUploads(prepared) {
+  const uploads = [];
+  for (let i = 0; i < prepared.length; i += MAX_BATCH_UPLOADS) {
+    const batch = prepared.slice(i, i + MAX_BATCH_UPLOADS);
+    // One file at a time: each is read into memory whole to be hashed
+    const hashes = [];
+    for (const { file } of batch) hashes.push(await sha256Hex(file));
+    const presignResponse = await fetch(
+      `${API_BASE_URL}/generate-upload-urls`,
+      {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+          files: batch.map(({ file, original }, index) => ({
+            filename: file.name,
+            contentType: file.type,
+            contentLength: file.size,
+            sha256: hashes[index],
+            preResized: original,
+          })),
+        }),
+      }
+    );
+    if (!presignResponse.ok) {
+      const errorData = await presignResponse.json();
+      throw new Error(`Could not get upload URLs: ${errorData.error}`);
+    }
+    const { uploads: signed } = await presignResponse.json();
+    signed.forEach((upload, index) =>
+      uploads.push({ ...upload, file: batch[index].file })
+    );
+  }
+  return uploads;
+}
+
+async function postJson(path, body) {
+  const response = await fetch(`${API_BASE_URL}${path}`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify(body),
+  });
+  const data = await response.json();
+  if (!response.ok) throw new Error(data.error);
+  return data;
+}
+
+// PUT one part, retrying network errors and 5xx with backoff
+async function putPart(url, blob) {
+  for (let attempt = 0; ; attempt++) {
+    let response;
+    try {
+      response = await fetch(url, { method: "PUT", body: blob });
+    } catch (error) {
+      if (attempt >= PART_RETRIES) throw error;
+    }
+    if (response && response.ok) return response.headers.get("ETag");
+    // 4xx (e.g. an expired URL or a size mismatch) will not recover
+    if (response && response.status < 500)
+      throw new Error(`part upload failed with HTTP ${response.status}`);
+    if (attempt >= PART_RETRIES) throw new Error("part upload failed");
+    await new Promise((r) => setTimeout(r, 500 * 2 ** attempt));
+  }
+}
+
+// Multipart upload: create, sign part URLs in batches, PUT the parts
+// PART_CONCURRENCY at a time, then complete (or abort on failure).
+// onProgress gets the fraction of parts uploaded. Resolves to the upload
+// key and its subscribe token.
+async function uploadMultipart(file, onProgress) {
+  const { key, uploadId, partSize, partCount, subscribeToken } = await postJson(
+    "/multipart-upload/create",
+    {
+      filename: file.name,
+      contentType: file.type,
+      contentLength: file.size,
+    }
+  );
+  try {
+    const etags = [];
+    let uploaded = 0;
+    for (let first = 1; first <= partCount; first += MAX_PART_URLS) {
+      const partNumbers = [];
+      for (let n = first; n < first + MAX_PART_URLS && n <= partCount; n++)
+        partNumbers.push(n);
+      const { parts } = await postJson("/multipart-upload/parts", {
+        key,
+        uploadId,
+        partNumbers,
+      });
+      let next = 0;
+      const worker = async () => {
+        while (next < parts.length) {
+          const { partNumber, url } = parts[next++];
+          const start = (partNumber - 1) * partSize;
+          const part = file.slice(start, start + partSize);
+          etags[partNumber - 1] = await putPart(url, part);
+          uploaded += part.size;
+          onProgress(uploaded / file.size);
+        }
+      };
+      await Promise.all(
+        Array.from({ length: PART_CONCURRENCY }, worker)
+      );
+    }
+    await postJson("/multipart-upload/complete", {
+      key,
+      uploadId,
+      parts: etags.map((etag, i) => ({ partNumber: i + 1, etag })),
+    });
+  } catch (error) {
+    await postJson("/multipart-upload/abort", { key, uploadId }).catch(
+      () => {}
+    );
+    throw new Error(`multipart upload failed: ${error.message}`);
+  }
+  return { key, subscribeToken };
+}
+
+uploadBtn.addEventListener("click", () => {
+  const entries = queue.filter(({ state }) => state === "selected");
+  if (entries.length === 0) return;
+  // Enabled again when more files are added
+  uploadBtn.disabled = true;
+  uploadEntries(entries);
+});
+
+// Runs at most `limit` of the tasks given to it at once, in order
+function concurrencyLimit(limit) {
+  let active = 0;
+  const waiting = [];
+  const next = () => {
+    if (active >= limit || waiting.length === 0) return;
+    active++;
+    const { task, resolve } = waiting.shift();
+    task()
+      .then(resolve, resolve)
+      .finally(() => {
+        active--;
+        next();
+      });
+  };
+  return (task) =>
+    new Promise((resolve) => {
+      waiting.push({ task, resolve });
+      next();
+    });
+}
+
+const uploadSlot = concurrencyLimit(UPLOAD_CONCURRENCY);
+
+// Prepares and presigns the files MAX_BATCH_UPLOADS at a time and
+// uploads them UPLOAD_CONCURRENCY at a time, preparing the next batch
+// while the previous one uploads. Presigned URLs expire, so a batch is
+// only presigned once the one before the previous batch is done: at most
+// one batch of URLs waits behind the uploads in progress.
+async function uploadEntries(entries) {
+  entries.forEach((entry) => setState(entry, "queued"));
+  // One promise per batch, settled when all its uploads have finished
+  const batchUploads = [];
+  for (let i = 0; i < entries.length; i += MAX_BATCH_UPLOADS) {
+    const batch = entries.slice(i, i + MAX_BATCH_UPLOADS);
+    // Downscale large photos one at a time, to bound memory
+    for (const entry of batch) {
+      setState(entry, "preparing");
+      Object.assign(entry, await prepareUpload(entry.source));
+      setState(entry, "queued");
+    }
+    // Small files get their URLs in one request; large ones go up in
+    // parts, each signed by the multipart API
+    const single = batch.filter(({ file }) => file.size <= MULTIPART_THRESHOLD);
+    if (batchUploads.length >= 2) await batchUploads[batchUploads.length - 2];
+    if (single.length > 0) {
+      try {
+        const signed = await presignUploads(single);
+        single.forEach((entry, index) => (entry.upload = signed[index]));
+      } catch (error) {
+        single.forEach((entry) => setState(entry, "failed", error.message));
+      }
+    }
+    batchUploads.push(
+      Promise.all(
+        batch
+          .filter((entry) => entry.state !== "failed")
+          .map((entry) => uploadSlot(() => uploadEntry(entry)))
+      )
+    );
+  }
+  await Promise.all(batchUploads);
+}
+
+async function uploadEntry(entry) {
+  setState(entry, "uploading");
+  const onProgress = (fraction) => setProgress(entry, fraction);
+  try {
+    if (entry.upload) {
+      const { url, key, headers, subscribeToken } = entry.upload;
+      await putFile(url, entry.file, headers, onProgress);
+      Object.assign(entry, { key, subscribeToken });
+    } else {
+      Object.assign(entry, await uploadMultipart(entry.file, onProgress));
+    }
+  } catch (error) {
+    setState(entry, "failed", error.message);
+    return;
+  }
+  setState(entry, "processing");
+  trackProcessing(entry);
+}
+
+// A single pre-signed PUT. XMLHttpRequest rather than fetch, which
+// reports no upload progress. The URL is signed for these headers
+// (content type, original filename metadata, checksum).
+function putFile(url, file, headers, onProgress) {
+  return new Promise((resolve, reject) => {
+    const xhr = new XMLHttpRequest();
+    xhr.open("PUT", url);
+    for (const [name, value] of Object.entries(headers))
+      xhr.setRequestHeader(name, value);
+    xhr.upload.onprogress = (event) => {
+      if (event.lengthComputable) onProgress(event.loaded / event.total);
+    };
+    xhr.onload = () =>
+      xhr.status >= 200 && xhr.status < 300
+        ? resolve()
+        : reject(new Error(`S3 upload failed with HTTP ${xhr.status}`));
+    xhr.onerror = () => reject(new Error("S3 upload failed"));
+    xhr.send(file);
+  });
+}
+
+function showProcessedImage(url) {
+  const img = document.createElement("img");
+  img.src = url;
+  img.loading = "lazy";
+  img.className = "img-fluid rounded mb-3";
+  img.alt = "Processed Image";
+  processedImages.appendChild(img);
+  resultCard.classList.remove("d-none");
+}
+
+// Upload key -> entries waiting for its result (identical files share a
+// key). Results are pushed over the WebSocket API; keys it has not
+// reported within POLL_TIMEOUT_MS, or all of them when the socket fails,
+// join the batched status poll.
+const processing = new Map();
+const polledKeys = new Set();
+let socket = null;
+let pendingSubscriptions = [];
+let pollRunning = false;
+// Cuts the held poll or the pause after it short, to add new keys
+let pollAbort = null;
+let pollRestart = null;
+
+function trackProcessing(entry) {
+  entry.deadline = Date.now() + POLL_TIMEOUT_MS;
+  entry.latestDeadline = Date.now() + MAX_POLL_TIMEOUT_MS;
+  if (processing.has(entry.key)) {
+    processing.get(entry.key).push(entry);
+    return;
+  }
+  processing.set(entry.key, [entry]);
+  if (subscribe(entry.key, entry.subscribeToken))
+    setTimeout(() => pollKeys([entry.key]), POLL_TIMEOUT_MS);
+  else pollKeys([entry.key]);
+}
+
+// Reports the result of a key to its entries, once
+function settle(key, result) {
+  const entries = processing.get(key);
+  if (!entries) return;
+  processing.delete(key);
+  polledKeys.delete(key);
+  if (result.status === "done") showProcessedImage(result.url);
+  for (const entry of entries) {
+    if (result.status === "done") setState(entry, "done");
+    else if (result.status === "unknown") setState(entry, "failed", "unknown upload");
+    else setState(entry, "failed", result.error);
+  }
+  if (processing.size === 0 && socket) socket.close();
+}
+
+// Subscribes to the key's result over the WebSocket API, opened on first
+// use, with the token presign issued for it; false without either
+function subscribe(key, token) {
+  if (!WEBSOCKET_URL || !window.WebSocket || !token) return false;
+  pendingSubscriptions.push({ key, token });
+  if (!socket) {
+    socket = new WebSocket(WEBSOCKET_URL);
+    socket.onopen = sendSubscriptions;
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === "status") settle(message.key, message);
+    };
+    // Whatever is still waiting is polled instead
+    socket.onerror = socket.onclose = () => {
+      socket = null;
+      pendingSubscriptions = [];
+      pollKeys([...processing.keys()]);
+    };
+  } else if (socket.readyState === WebSocket.OPEN) {
+    // Keys that finish uploading together go in one message
+    setTimeout(sendSubscriptions, 0);
+  }
+  return true;
+}
+
+function sendSubscriptions() {
+  // The service accepts MAX_BATCH_UPLOADS keys per subscription
+  while (socket && pendingSubscriptions.length > 0) {
+    const batch = pendingSubscriptions.splice(0, MAX_BATCH_UPLOADS);
+    socket.send(
+      JSON.stringify({
+        action: "subscribe",
+        keys: batch.map(({ key }) => key),
+        tokens: batch.map(({ token }) => token),
+      })
+    );
+  }
+}
+
+function pollKeys(keys) {
+  const now = Date.now();
+  let added = false;
+  for (const key of keys) {
+    if (!processing.has(key) || polledKeys.has(key)) continue;
+    polledKeys.add(key);
+    for (const entry of processing.get(key)) {
+      entry.deadline = now + POLL_TIMEOUT_MS;
+      entry.latestDeadline = now + MAX_POLL_TIMEOUT_MS;
+    }
+    added = true;
+  }
+  if (!added) return;
+  if (!pollRunning) {
+    runStatusPoll();
+  } else if (!pollRestart) {
+    pollRestart = setTimeout(() => {
+      pollRestart = null;
+      if (pollAbort) pollAbort.abort();
+    }, POLL_COALESCE_MS);
+  }
+}
+
+// The batched status poll, running while any key is polled
+async function runStatusPoll() {
+  pollRunning = true;
+  let backoff = FIRST_BACKOFF_MS;
+  while (polledKeys.size > 0) {
+    const controller = new AbortController();
+    pollAbort = controller;
+    const keys = [...polledKeys];
+    let delay = 0;
+    try {
+      const chunks = [];
+      for (let i = 0; i < keys.length; i += MAX_STATUS_KEYS)
+        chunks.push(keys.slice(i, i + MAX_STATUS_KEYS));
+      const responses = await Promise.all(
+        chunks.map((chunk) => fetchStatuses(chunk, controller.signal))
+      );
+      backoff = FIRST_BACKOFF_MS;
+      let settled = false;
+      const hints = [];
+      for (const { images, retryAfterMs } of responses) {
+        for (const image of images) {
+          if (["done", "failed", "unknown"].includes(image.status)) {
+            settle(image.key, image);
+            settled = true;
+          } else {
+            extendDeadlines(image.key, image.retryAfterMs);
+          }
+        }
+        if (typeof retryAfterMs === "number") hints.push(retryAfterMs);
+      }
+      // Nothing finished: ask again when the next file is expected
+      if (!settled && hints.length > 0)
+        delay = Math.min(...hints) * (0.8 + Math.random() * 0.4);
+    } catch (error) {
+      // Aborted to add keys: ask again right away
+      if (!controller.signal.aborted) {
+        delay = backoff;
+        backoff = Math.min(backoff * 2, MAX_BACKOFF_MS);
+      }
+    }
+    expireOverdue();
+    if (delay > 0) await sleep(delay, controller.signal);
+  }
+  pollAbort = null;
+  pollRunning = false;
+}
+
+async function fetchStatuses(keys, signal) {
+  const response = await fetch(`${API_BASE_URL}/get-processed-image-urls`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ keys, wait: LONG_POLL_SECONDS }),
+    signal,
+  });
+  if (!response.ok)
+    throw new Error(`status check failed with HTTP ${response.status}`);
+  return response.json();
+}
+
+// Leave room for the poll after the expected time; long estimates
+// (large images) push the deadline out, short ones leave it alone
+function extendDeadlines(key, retryAfterMs) {
+  if (typeof retryAfterMs !== "number") return;
+  for (const entry of processing.get(key) || [])
+    entry.deadline = Math.min(
+      Math.max(entry.deadline, Date.now() + 2 * retryAfterMs),
+      entry.latestDeadline
+    );
+}
+
+function expireOverdue() {
+  const now = Date.now();
+  for (const key of [...polledKeys])
+    if (processing.get(key).every(({ deadline }) => deadline <= now))
+      settle(key, { status: "failed", error: "timed out" });
+}
+
+function sleep(ms, signal) {
+  return new Promise((resolve) => {
+    const timer = setTimeout(resolve, ms);
+    signal.addEventListener(
+      "abort",
+      () => {
+        clearTimeout(timer);
+        resolve();
+      },
+      { once: true }
+    );
+  });
+}
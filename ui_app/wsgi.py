@@ -0,0 +1,9 @@
+"""Production entry point for the UI service.
+
+Serve it with gunicorn from ``ui_app/``::
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+``python app.py`` still starts Flask's debug server for development.
+"""
+from app import app  # noqa: F401